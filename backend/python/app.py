@@ -1,27 +1,105 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException, Form
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, File, UploadFile, HTTPException, Form, Request, Response, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.background import BackgroundTask
 import os
-import shutil
+import re
+import json
+import secrets
+import asyncio
 import logging
+import time
+import queue
+from collections import deque
+from contextlib import asynccontextmanager
 from pydantic import BaseModel
-from llm_model import get_llm_response, ChatHistory  # Import the LLM response function and ChatHistory class
-from ocr import extract_text_from_enhanced_image  # Import the OCR function
-import ngrok
-from prompt import create_nutrition_analysis_prompt,create_medical_chat_prompt,create_health_chat_prompt,create_health_report_analysis_prompt
+from typing import Optional
+from llm_model import ChatHistory, TOKEN_BUDGETS, SPECULATIVE_ENDPOINTS, is_error_response
+from llm_client import LLM_SERVER_SOCKET, DEFAULT_SERVER_SOCKET
+if LLM_SERVER_SOCKET:
+    # The LLM lives in the model server process (model_server.py); this worker loads no weights
+    from llm_client import get_llm_response, stream_llm_response, llm_stats as get_llm_stats, wait_for_server, metrics_snapshot
+else:
+    from llm_model import get_llm_response, stream_llm_response, llm_stats as get_llm_stats, warmup_llm, require_draft, warmup_draft
+from ocr import extract_text_from_enhanced_image, ocr_cache, ocr_engine, warmup_ocr  # Import the OCR function and its result cache
+from prompt import create_nutrition_analysis_prompt,create_medical_chat_prompt,create_health_chat_prompt,create_health_report_analysis_prompt,create_lab_table_analysis_prompt,create_sentiment_explanation_prompt, PROMPT_VERSION
 from PIL import Image
-import whisper
-from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
-from transformers import pipeline
-import tempfile
-import wave
-
-
-# Set up loggingt
-logging.basicConfig(level=logging.INFO)
+from sentiment_engine import analyze, explain_feelings, GenerativeExplainer, SENTIMENT_GENERATIVE, EXPLANATION_VERSION, MAX_DRIVERS, SENTIMENT_BATCH_MAX, score_batch, sentiment_fanout, sentiment_timeline
+from model_registry import registry, current_rss_bytes
+from metrics import metrics, render, with_labels, stage, REQUEST_SECONDS
+from scheduler import PoolSaturated, run_in_pool, pool_stats, pools
+from conversation_store import conversation_store
+from response_cache import response_cache, make_key, CACHE_DETERMINISTIC
+from uploads import read_image_upload, read_audio_upload
+from lab_extract import extract_lab_rows, format_lab_table
+from ingredient_index import ingredient_index, format_ingredients
+from transcription import transcription_engine, LiveTranscriber, stitch, SAMPLE_RATE
+from audio_ingest import load_audio, AudioDecodeError
+from startup import startup
+from request_log import configure_logging, trace_log
+
+
+# Set up logging: records are written by a background thread, never on the request path
+configure_logging(logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI()
+# Public tunnel opened once the server starts (NGROK_ENABLED=0 disables); needs NGROK_AUTHTOKEN
+NGROK_ENABLED = os.environ.get("NGROK_ENABLED", "1") == "1"
+NGROK_DOMAIN = os.environ.get("NGROK_DOMAIN", "cricket-romantic-slightly.ngrok-free.app")
+
+# HTTP worker processes for `python app.py`; above 1, the LLM moves to a single model server they share
+API_WORKERS = int(os.environ.get("API_WORKERS", "1"))
+
+# Utterances of one live transcription connection transcribed at once; later audio waits for them
+ASR_LIVE_MAX_IN_FLIGHT = int(os.environ.get("ASR_LIVE_MAX_IN_FLIGHT", "2"))
+# Input sample rates accepted for live transcription
+LIVE_MIN_SAMPLE_RATE = 8000
+LIVE_MAX_SAMPLE_RATE = 48000
+
+# Chat sessions are issued by the server (random, URL-safe); ids sent by clients must look like one
+SESSION_ID_BYTES = 16
+SESSION_ID_PATTERN = re.compile(r"[A-Za-z0-9_-]{16,128}")
+
+# Models brought up by the lifespan; importing this module loads none of them
+if LLM_SERVER_SOCKET:
+    # The model server loads and warms the LLM (and draft) before it accepts connections
+    startup.register("llm", wait_for_server)
+else:
+    startup.register("llm", lambda: registry.get("llm"), warmup_llm)
+    if any(SPECULATIVE_ENDPOINTS.values()):
+        startup.register("llm-draft", require_draft, warmup_draft)
+startup.register("whisper", transcription_engine.load, transcription_engine.warmup)
+startup.register("ocr", warmup_ocr)
+
+def open_tunnel():
+    """Forward the public ngrok domain to this server; failures are logged, not fatal."""
+    auth_token = os.environ.get("NGROK_AUTHTOKEN")
+    if not auth_token:
+        logger.warning("NGROK_AUTHTOKEN is not set; not opening the ngrok tunnel")
+        return None
+    try:
+        import ngrok
+        ngrok.set_auth_token(auth_token)
+        return ngrok.forward("127.0.0.1:8000", domain=NGROK_DOMAIN)
+    except Exception as e:
+        logger.error(f"Could not open ngrok tunnel: {e}")
+        return None
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start model loading and the tunnel after uvicorn binds; stop worker pools on shutdown."""
+    startup.start()
+    if startup.mode == "eager":
+        await asyncio.to_thread(startup.wait)
+    listener = await asyncio.to_thread(open_tunnel) if NGROK_ENABLED else None
+    yield
+    if listener is not None:
+        await asyncio.to_thread(listener.close)
+    transcription_engine.shutdown()
+    sentiment_fanout.shutdown()
+    ocr_engine.shutdown()
+
+app = FastAPI(lifespan=lifespan)
 
 # Add CORS middleware
 app.add_middleware(
@@ -30,35 +108,104 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Let the browser read the session id issued to it
+    expose_headers=["X-Session-ID"],
 )
 
-ngrok.set_auth_token("2niCah6WtVIDTrt4rndLw83ak5y_7YrR4DjQk3p1hqSqmyCKp")
-listener = ngrok.forward("127.0.0.1:8000", domain="cricket-romantic-slightly.ngrok-free.app")
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """
+    Time each request per route template into the metrics and a trace
+    (streamed responses: until headers are sent). The trace is buffered for
+    /debug/traces and logged as one line for a sample of requests.
+    """
+    started = time.perf_counter()
+    trace, token = trace_log.start(request.method, request.url.path)
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        response.headers["X-Trace-ID"] = trace.id
+        return response
+    finally:
+        route = request.scope.get("route")
+        route_path = route.path if route is not None else "unmatched"
+        REQUEST_SECONDS.observe(time.perf_counter() - started, method=request.method, route=route_path, status=status)
+        trace_log.finish(trace, token, status, route_path)
+
+# Gauges are read from the existing stats at scrape time
+metrics.gauge(
+    "process_resident_memory_bytes", "Resident set size of the process", collect=lambda: {(): current_rss_bytes()}
+)
+metrics.gauge(
+    "workload_pool_running", "Jobs running per workload pool", ("pool",),
+    lambda: {(name,): stats["running"] for name, stats in pool_stats().items()}
+)
+metrics.gauge(
+    "workload_pool_queued", "Jobs waiting per workload pool", ("pool",),
+    lambda: {(name,): stats["queued"] for name, stats in pool_stats().items()}
+)
+metrics.gauge(
+    "workload_pool_rejected", "Jobs rejected per workload pool since start", ("pool",),
+    lambda: {(name,): stats["rejected"] for name, stats in pool_stats().items()}
+)
+metrics.gauge(
+    "model_loaded", "1 if the registry model is resident", ("model",),
+    lambda: {(name,): int(model["loaded"]) for name, model in registry.stats()["models"].items()}
+)
+
+@app.exception_handler(PoolSaturated)
+async def pool_saturated_handler(request, exc: PoolSaturated):
+    """Shed load with 503 + Retry-After when a workload queue is full."""
+    logger.warning(f"Rejecting {request.url.path}: {exc}")
+    return JSONResponse(
+        status_code=503,
+        content={"message": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
 
 # Define request model for chat
 class ChatRequest(BaseModel):
     message: str
+    session_id: Optional[str] = None
 
-# Ensure uploads directory exists
-os.makedirs("uploads", exist_ok=True)
+def resolve_session(request: ChatRequest, http_request: Request, endpoint):
+    """
+    The caller's session id (body session_id, else X-Session-ID header) and its
+    conversation key. A missing or malformed id gets a new random one, which the
+    response returns in X-Session-ID for the client to send back. Each chat
+    endpoint keeps its own conversation under the same id.
 
-# Initialize chat history - make this global so it persists between requests
-chat_history = ChatHistory()
+    Returns:
+        tuple[str, str]: (session id for the X-Session-ID header, conversation key)
+    """
+    session_id = request.session_id or http_request.headers.get("x-session-id")
+    if not session_id or not SESSION_ID_PATTERN.fullmatch(session_id):
+        session_id = secrets.token_urlsafe(SESSION_ID_BYTES)
+    return session_id, f"{endpoint}:{session_id}"
 
 @app.post("/llm-chat")
-async def llm_chat(request: ChatRequest):
+async def llm_chat(request: ChatRequest, http_request: Request, response: Response):
     try:
-        # Add the user message to chat history
-        chat_history.add_message(request.message)
+        # Each session gets its own conversation history
+        session_id, conversation_key = resolve_session(request, http_request, "llm-chat")
+        response.headers["X-Session-ID"] = session_id
+        chat_history = await asyncio.to_thread(conversation_store.get, conversation_key)
 
         # Create the professional medical prompt
         medical_prompt = create_medical_chat_prompt(request.message)
 
         # Get the LLM response using the medical prompt
-        llm_response = get_llm_response(medical_prompt, chat_history)
+        llm_response = await run_in_pool(
+            "llm", get_llm_response, medical_prompt, chat_history, conversation_key, TOKEN_BUDGETS["llm-chat"],
+            speculative=SPECULATIVE_ENDPOINTS["llm-chat"]
+        )
+        await asyncio.to_thread(conversation_store.save, conversation_key, chat_history)
 
         # Return the LLM response directly as text (not in JSON format)
         return llm_response
+    except PoolSaturated:
+        raise
     except Exception as e:
         logger.error(f"Error in llm-chat: {str(e)}")
         error_message = f"Sorry, I encountered an error: {str(e)}"
@@ -68,19 +215,27 @@ async def llm_chat(request: ChatRequest):
         )
 
 @app.post("/health-llm-chat")
-async def llm_chat(request: ChatRequest):
+async def llm_chat(request: ChatRequest, http_request: Request, response: Response):
     try:
-        # Add the user message to chat history
-        chat_history.add_message(request.message)
+        # Each session gets its own conversation history
+        session_id, conversation_key = resolve_session(request, http_request, "health-llm-chat")
+        response.headers["X-Session-ID"] = session_id
+        chat_history = await asyncio.to_thread(conversation_store.get, conversation_key)
 
         # Create the professional medical prompt
         medical_prompt = create_health_chat_prompt(request.message)
 
         # Get the LLM response using the medical prompt
-        llm_response = get_llm_response(medical_prompt, chat_history)
+        llm_response = await run_in_pool(
+            "llm", get_llm_response, medical_prompt, chat_history, conversation_key, TOKEN_BUDGETS["health-llm-chat"],
+            speculative=SPECULATIVE_ENDPOINTS["health-llm-chat"]
+        )
+        await asyncio.to_thread(conversation_store.save, conversation_key, chat_history)
 
         # Return the LLM response directly as text (not in JSON format)
         return llm_response
+    except PoolSaturated:
+        raise
     except Exception as e:
         logger.error(f"Error in llm-chat: {str(e)}")
         error_message = f"Sorry, I encountered an error: {str(e)}"
@@ -89,6 +244,41 @@ async def llm_chat(request: ChatRequest):
             content={"message": error_message}
         )
 
+def sse_events(chunks):
+    """Wrap decoded text chunks as Server-Sent Events, ending with a 'done' event."""
+    for chunk in chunks:
+        yield f"data: {json.dumps(chunk)}\n\n"
+    yield "event: done\ndata: {}\n\n"
+
+async def streaming_chat_response(prompt, request, http_request, endpoint):
+    """Start a streamed generation on the LLM pool and return it as an SSE response."""
+    session_id, conversation_key = resolve_session(request, http_request, endpoint)
+    chat_history = await asyncio.to_thread(conversation_store.get, conversation_key)
+    # Prompt building may load the tokenizer (or draft model) on first use, so keep it off the event loop
+    chunks = await asyncio.to_thread(
+        stream_llm_response, prompt, chat_history, launch=pools["llm"].submit, session_id=conversation_key,
+        token_budget=TOKEN_BUDGETS[endpoint], speculative=SPECULATIVE_ENDPOINTS[endpoint]
+    )
+    return StreamingResponse(
+        sse_events(chunks),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "X-Session-ID": session_id},
+        # Persisted once the stream is sent; Starlette runs sync background tasks on its threadpool
+        background=BackgroundTask(conversation_store.save, conversation_key, chat_history)
+    )
+
+@app.post("/llm-chat/stream")
+async def llm_chat_stream(request: ChatRequest, http_request: Request):
+    """Stream the medical chat response token by token as Server-Sent Events."""
+    return await streaming_chat_response(create_medical_chat_prompt(request.message), request, http_request, "llm-chat")
+
+@app.post("/health-llm-chat/stream")
+async def health_llm_chat_stream(request: ChatRequest, http_request: Request):
+    """Stream the health chat response token by token as Server-Sent Events."""
+    return await streaming_chat_response(
+        create_health_chat_prompt(request.message), request, http_request, "health-llm-chat"
+    )
+
 @app.post("/ocr")
 async def ocr(
     file: UploadFile = File(...),
@@ -101,42 +291,54 @@ async def ocr(
         age_value = "Not provided" if age is None or age == "undefined" else age
         gender_value = "Not provided" if gender is None or gender == "undefined" else gender
 
+        # Read the upload into memory, rejecting oversized or non-image files early
+        image_bytes = await read_image_upload(file)
+
+        # With greedy generation the same label and profile get the same analysis, so serve
+        # repeats from the cache (a sampled answer is not cached: it would be served forever)
+        cache_key = None
+        if response_cache is not None and CACHE_DETERMINISTIC:
+            cache_key = make_key(
+                "ocr", PROMPT_VERSION, ingredient_index.version,
+                image_bytes, age_value, gender_value, description
+            )
+            cached_response = await asyncio.to_thread(response_cache.get, cache_key)
+            if cached_response is not None:
+                return cached_response
+
         # Create a separate chat history for OCR analysis to keep it isolated from regular chat
         ocr_chat_history = ChatHistory()
 
-        # Save the uploaded file temporarily
-        file_location = f"uploads/{file.filename}"
-        try:
-            with open(file_location, "wb+") as buffer:
-                shutil.copyfileobj(file.file, buffer)
-        except Exception as save_error:
-            logger.error(f"Error saving file: {str(save_error)}")
-            raise HTTPException(status_code=500, detail=f"Error saving file: {str(save_error)}")
-
-        # Call the OCR function from ocr.py
-        text = extract_text_from_enhanced_image(file_location)
+        # Call the OCR function from ocr.py on the in-memory image
+        text = await run_in_pool("ocr", extract_text_from_enhanced_image, image_bytes)
 
         # If OCR text is empty, provide a fallback message
         if not text.strip():
             text = "No text could be detected in the provided image."
 
-        # Clean up - remove the file after processing
-        try:
-            os.remove(file_location)
-        except Exception as rm_error:
-            logger.warning(f"Error removing file: {str(rm_error)}")
+        # Send the deduplicated ingredients (with their precomputed facts) and the label
+        # items the dictionary does not know; unrecognised labels fall back to the raw text
+        ingredients, unmatched = ingredient_index.extract(text)
+        if ingredients:
+            text = format_ingredients(ingredients, unmatched)
 
         # Prepare the prompt for the LLM with better handling of missing values
         prompt = create_nutrition_analysis_prompt(age_value, gender_value, description, text)
 
-        # Add the prompt to OCR chat history
-        ocr_chat_history.add_message(prompt)
+        # Get the LLM response (get_llm_response records the prompt in the history)
+        llm_response = await run_in_pool(
+            "llm", get_llm_response, prompt, ocr_chat_history,
+            token_budget=TOKEN_BUDGETS["ocr"], deterministic=CACHE_DETERMINISTIC,
+            speculative=SPECULATIVE_ENDPOINTS["ocr"]
+        )
 
-        # Get the LLM response
-        llm_response = get_llm_response(prompt, ocr_chat_history)
+        if cache_key is not None and not is_error_response(llm_response):
+            await asyncio.to_thread(response_cache.set, cache_key, llm_response)
 
         return llm_response
 
+    except (PoolSaturated, HTTPException):
+        raise
     except Exception as e:
         logger.error(f"General Error in OCR endpoint: {str(e)}")
         return JSONResponse(
@@ -147,114 +349,210 @@ async def ocr(
 
 #===============================SENTIMENT ANALYSIS =============================
 # Step 1: Transcribe audio with Whisper
-def transcribe_audio(audio_file_path):
-    model = whisper.load_model("tiny")
-    if not os.path.exists(audio_file_path):
-        raise FileNotFoundError(f"Audio file '{audio_file_path}' not found.")
-    result = model.transcribe(audio_file_path)
-    return result["text"]
-
-# Step 2: Analyze sentiment with VADER
-def analyze_sentiment(text):
-    analyzer = SentimentIntensityAnalyzer()
-    sentiment_scores = analyzer.polarity_scores(text)
-    compound = sentiment_scores['compound']
+def transcribe_audio(data, audio_format=None):
+    """Decode an upload in memory and transcribe it in pause-delimited chunks on the Whisper worker processes."""
+    return transcription_engine.transcribe(load_audio(data, audio_format))
+
+# Step 2 and 3: Score with VADER and explain from the phrases that drove the score
+def generate_explanation(prompt):
+    """LLM explanation for the optional generative backend; errors are not cached."""
+    response = get_llm_response(prompt, ChatHistory(), deterministic=True)
+    return "" if is_error_response(response) else response
+
+# Optional LLM explanations, generated in the background on the LLM pool and
+# served once cached; requests never wait for them
+generative_explainer = (
+    GenerativeExplainer(generate_explanation, launch=pools["llm"].submit) if SENTIMENT_GENERATIVE else None
+)
+
+def sentiment_report(text):
+    """Score and explain text; returns (sentiment_data, explanation, explanation source)."""
+    sentiment_data = analyze(text)
+    prompt = None
+    if generative_explainer is not None:
+        prompt = create_sentiment_explanation_prompt(text, sentiment_data["sentiment"], sentiment_data["drivers"])
+    explanation, source = explain_feelings(text, sentiment_data, generative_explainer, prompt)
+    return sentiment_data, explanation, source
+
+def sentiment_fields(sentiment_data, explanation, source):
+    """Response fields shared by the audio and text sentiment endpoints."""
     return {
-        "sentiment": "Positive" if compound >= 0.05 else "Negative" if compound <= -0.05 else "Neutral",
-        "scores": sentiment_scores
+        "sentiment": sentiment_data["sentiment"],
+        "sentiment_scores": {
+            "positive": sentiment_data["scores"]["pos"],
+            "negative": sentiment_data["scores"]["neg"],
+            "neutral": sentiment_data["scores"]["neu"],
+            "compound": sentiment_data["scores"]["compound"]
+        },
+        "drivers": sentiment_data["drivers"][:2 * MAX_DRIVERS],
+        "explanation": explanation,
+        "explanation_source": source
     }
 
-# Step 3: Use DistilRoBERTa to explain the sentiment and transcription
-def explain_feelings(transcription, sentiment_data):
-    model_name = "distilroberta-base"
-    generator = pipeline("text-generation", model=model_name, tokenizer=model_name)
-
-    sentiment = sentiment_data["sentiment"]
-    scores = sentiment_data["scores"]
-    pos_percent = scores['pos'] * 100
-    neg_percent = scores['neg'] * 100
-    neu_percent = scores['neu'] * 100
-
-    # Craft a prompt for explanation
-    prompt = (
-        f"Based on the statement '{transcription}' with a {sentiment} sentiment, "
-        f"explain in 5-10 lines how the user feels and possible reasons for their emotions. "
-        f"Sentiment scores: Positive {pos_percent:.1f}%, Negative {neg_percent:.1f}%, Neutral {neu_percent:.1f}%."
-    )
-
-    # Generate explanation
-    output = generator(
-        prompt,
-        max_new_tokens=100,
-        num_return_sequences=1,
-        temperature=0.8,
-        top_p=0.9,
-        do_sample=True,
-        truncation=True
-    )
-    full_text = output[0]["generated_text"]
-
-    # Strip the prompt and ensure a clean explanation
-    explanation = full_text.replace(prompt, "").strip()
-    if not explanation:  # Fallback if generation fails
-        explanation = (
-            f"The user feels {sentiment.lower()} based on their statement. "
-            f"With {pos_percent:.1f}% positive, {neg_percent:.1f}% negative, and {neu_percent:.1f}% neutral sentiment, "
-            f"they might be reacting to recent events. Their emotions could stem from personal experiences or external factors."
-        )
-    return explanation
-
 @app.post("/process-audio", response_class=JSONResponse)
 async def process_audio(file: UploadFile = File(...)):
     """
-    Process an uploaded audio file (supports WAV, MP3, MP4, M4A, etc.):
+    Process an uploaded audio file (supports WAV, FLAC, OGG, MP3, MP4, M4A, AAC, WebM):
     1. Transcribe the audio
     2. Analyze sentiment
     3. Generate an explanation
 
     Returns a JSON with transcription, sentiment, and explanation.
     """
-    # List of supported audio formats
-    supported_formats = ['.wav', '.mp3', '.mp4', '.m4a', '.m4p', '.aac', '.ogg', '.flac']
-
-    # Check file extension
-    file_ext = os.path.splitext(file.filename.lower())[1]
-    if file_ext not in supported_formats:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Unsupported file format. Supported formats: {', '.join(supported_formats)}"
-        )
-
-    # Save the uploaded file temporarily with its original extension
-    with tempfile.NamedTemporaryFile(delete=False, suffix=file_ext) as temp_file:
-        shutil.copyfileobj(file.file, temp_file)
-        temp_file_path = temp_file.name
+    # Read the upload into memory; the format is detected from its magic bytes
+    data, audio_format = await read_audio_upload(file)
 
     try:
         # Process the audio
-        transcription = transcribe_audio(temp_file_path)
-        sentiment_data = analyze_sentiment(transcription)
-        explanation = explain_feelings(transcription, sentiment_data)
+        transcript = await run_in_pool("asr", transcribe_audio, data, audio_format)
+        transcription = transcript["text"]
+        sentiment_data, explanation, source = await run_in_pool("sentiment", sentiment_report, transcription)
+        timeline = await run_in_pool("sentiment", sentiment_timeline, transcript["segments"])
 
         # Return results
         return {
             "transcription": transcription,
-            "sentiment": sentiment_data["sentiment"],
-            "sentiment_scores": {
-                "positive": sentiment_data["scores"]["pos"],
-                "negative": sentiment_data["scores"]["neg"],
-                "neutral": sentiment_data["scores"]["neu"],
-                "compound": sentiment_data["scores"]["compound"]
-            },
-            "explanation": explanation
+            "segments": transcript["segments"],
+            "timeline": timeline,
+            **sentiment_fields(sentiment_data, explanation, source)
         }
+    except PoolSaturated:
+        raise
+    except AudioDecodeError as e:
+        raise HTTPException(status_code=415, detail=f"Could not decode audio: {e}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/process-audio/stream")
+async def process_audio_stream(file: UploadFile = File(...)):
+    """
+    Transcribe an uploaded audio file, streaming each chunk's transcript as a
+    Server-Sent Event as soon as it is ready ({"type": "partial", ...}),
+    followed by the stitched transcript with timestamps and its per-segment
+    sentiment timeline ({"type": "final", ...}).
+    """
+    data, audio_format = await read_audio_upload(file)
+
+    try:
+        audio = await run_in_pool("asr", load_audio, data, audio_format)
+    except PoolSaturated:
+        raise
+    except AudioDecodeError as e:
+        raise HTTPException(status_code=415, detail=f"Could not decode audio: {e}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        # Clean up the temporary file
-        if os.path.exists(temp_file_path):
-            os.unlink(temp_file_path)
 
+    events = queue.Queue()
+
+    def transcribe():
+        try:
+            job = transcription_engine.start(audio)
+            for chunk in job.as_completed():
+                events.put({"type": "partial", **chunk})
+            transcript = job.result()
+            events.put({"type": "final", **transcript, "timeline": sentiment_timeline(transcript["segments"])})
+        except Exception as e:
+            logger.error(f"Error in process-audio/stream: {str(e)}")
+            events.put({"type": "error", "message": str(e)})
+        finally:
+            events.put(None)
+
+    # The whole transcription holds one ASR slot, so a full pool answers 503 before streaming starts
+    pools["asr"].submit(transcribe)
+
+    def transcript_events():
+        while (event := events.get()) is not None:
+            yield event
+
+    return StreamingResponse(
+        sse_events(transcript_events()),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.websocket("/ws/transcribe")
+async def live_transcription(websocket: WebSocket):
+    """
+    Live microphone transcription.
+
+    The client sends binary frames of 16-bit little-endian mono PCM (16 kHz
+    unless a sample_rate query parameter says otherwise) and a text frame
+    "end" when it stops recording. Each utterance is
+    transcribed as soon as a pause closes it and sent back as
+    {"type": "partial", ...}; the stitched transcript follows as
+    {"type": "final", ...} before the socket is closed.
+
+    A connection is refused with an error message and close code 1003 when
+    sample_rate is not an integer between LIVE_MIN_SAMPLE_RATE and
+    LIVE_MAX_SAMPLE_RATE, and with close code 1013 (try again later) when the
+    ASR pool is full. At most ASR_LIVE_MAX_IN_FLIGHT
+    utterances per connection are transcribed at once; until one finishes,
+    further frames are not read.
+    """
+    await websocket.accept()
+    try:
+        sample_rate = int(websocket.query_params.get("sample_rate", SAMPLE_RATE))
+    except ValueError:
+        sample_rate = None
+    if sample_rate is None or not LIVE_MIN_SAMPLE_RATE <= sample_rate <= LIVE_MAX_SAMPLE_RATE:
+        await websocket.send_json({
+            "type": "error",
+            "message": f"sample_rate must be an integer between {LIVE_MIN_SAMPLE_RATE} and {LIVE_MAX_SAMPLE_RATE}",
+        })
+        await websocket.close(code=1003)
+        return
+
+    try:
+        pools["asr"].admit()
+    except PoolSaturated as e:
+        await websocket.send_json({"type": "error", "message": str(e), "retry_after": e.retry_after})
+        await websocket.close(code=1013)
+        return
+
+    live = LiveTranscriber(input_rate=sample_rate)
+    results = []
+    tasks = set()
+    in_flight = asyncio.Semaphore(ASR_LIVE_MAX_IN_FLIGHT)
+    send_lock = asyncio.Lock()
+
+    async def transcribe_chunk(offset, samples):
+        try:
+            chunk = await run_in_pool("asr", transcription_engine.transcribe_chunk, samples, offset)
+        except PoolSaturated as e:
+            message = {"type": "error", "message": str(e), "retry_after": e.retry_after}
+        else:
+            results.append(chunk)
+            message = {"type": "partial", **chunk}
+        finally:
+            in_flight.release()
+        async with send_lock:
+            await websocket.send_json(message)
+
+    async def submit(chunks):
+        for offset, samples in chunks:
+            await in_flight.acquire()
+            task = asyncio.create_task(transcribe_chunk(offset, samples))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
+            if message.get("bytes"):
+                await submit(live.feed_pcm16(message["bytes"]))
+            elif message.get("text") == "end":
+                break
+
+        await submit(live.flush())
+        await asyncio.gather(*tasks)
+        await websocket.send_json({"type": "final", **stitch(results)})
+        await websocket.close()
+    except WebSocketDisconnect:
+        for task in list(tasks):
+            task.cancel()
 
 @app.post("/text-sentiment", response_class=JSONResponse)
 async def analyze_text_sentiment(request: ChatRequest):
@@ -268,29 +566,155 @@ async def analyze_text_sentiment(request: ChatRequest):
     try:
         text = request.message
 
-        # Analyze sentiment
-        sentiment_data = analyze_sentiment(text)
+        # Identical text always scores the same, so serve repeats from the cache. VADER reads
+        # case and punctuation and the result echoes the text, so the key is the exact text
+        cache_key = None
+        if response_cache is not None:
+            cache_key = make_key("text-sentiment", EXPLANATION_VERSION, text, exact=True)
+            cached_result = await asyncio.to_thread(response_cache.get, cache_key)
+            if cached_result is not None:
+                return cached_result
 
-        # Generate explanation
-        explanation = explain_feelings(text, sentiment_data)
+        # Analyze sentiment and explain it (microseconds; no model call on the request path)
+        sentiment_data, explanation, source = await run_in_pool("sentiment", sentiment_report, text)
 
         # Return results
-        return {
-            "text": text,
-            "sentiment": sentiment_data["sentiment"],
-            "sentiment_scores": {
-                "positive": sentiment_data["scores"]["pos"],
-                "negative": sentiment_data["scores"]["neg"],
-                "neutral": sentiment_data["scores"]["neu"],
-                "compound": sentiment_data["scores"]["compound"]
-            },
-            "explanation": explanation
-        }
+        result = {"text": text, **sentiment_fields(sentiment_data, explanation, source)}
+        # While a generated explanation is pending, keep serving fresh results so it replaces this one
+        if cache_key is not None and (generative_explainer is None or source == "generative"):
+            await asyncio.to_thread(response_cache.set, cache_key, result)
+        return result
+    except PoolSaturated:
+        raise
     except Exception as e:
         logger.error(f"Error in text-sentiment: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def batch_item(index, value):
+    """Normalise one batch entry (a string or {"text", "id"}) to (index, id, text, error)."""
+    if isinstance(value, str):
+        return index, None, value, None
+    if isinstance(value, dict) and isinstance(value.get("text"), str):
+        return index, value.get("id"), value["text"], None
+    return index, None, None, 'Expected a string or an object with a "text" string'
+
+def batch_results(items, results):
+    """Merge scores back into their entries, keeping input order and per-entry errors."""
+    results = iter(results)
+    for index, item_id, text, error in items:
+        entry = {"index": index} if item_id is None else {"index": index, "id": item_id}
+        if error is not None:
+            entry["error"] = error
+        else:
+            entry.update(next(results))
+        yield entry
+
+def score_batch_items(items, drivers):
+    """Score a fully received batch (runs on the sentiment pool)."""
+    texts = [text for _, _, text, error in items if error is None]
+    return list(batch_results(items, score_batch(texts, drivers)))
+
+async def ndjson_lines(http_request: Request):
+    """Yield non-blank lines of a streamed request body as they arrive."""
+    buffer = b""
+    async for body_chunk in http_request.stream():
+        buffer += body_chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield line
+    if buffer.strip():
+        yield buffer
+
+async def stream_batch_sentiment(http_request: Request, drivers):
+    """
+    Score an NDJSON request body on the sentiment worker processes as it is
+    received, yielding NDJSON result lines in input order.
+
+    Entries are submitted in chunks with at most max_in_flight chunks
+    outstanding, so a long stream is scored in bounded memory while the
+    client is still uploading. Without worker processes, chunks are scored
+    on the sentiment pool, never on the event loop; a chunk the pool rejects
+    comes back with an error on each entry, since the status line is sent.
+    """
+    pending = deque()
+    items = []
+
+    def submit():
+        texts = [text for _, _, text, error in items if error is None]
+        try:
+            pending.append((items, sentiment_fanout.submit(texts, drivers, launch=pools["sentiment"].submit)))
+        except PoolSaturated as exc:
+            pending.append((items, exc))
+
+    async def collect():
+        chunk_items, future = pending.popleft()
+        if isinstance(future, PoolSaturated):
+            chunk_items = [(index, item_id, None, error or str(future)) for index, item_id, _, error in chunk_items]
+            results = []
+        else:
+            results = await asyncio.wrap_future(future)
+        return "".join(json.dumps(entry) + "\n" for entry in batch_results(chunk_items, results))
+
+    index = 0
+    truncated = False
+    async for line in ndjson_lines(http_request):
+        if index >= SENTIMENT_BATCH_MAX:
+            truncated = True
+            break
+        try:
+            items.append(batch_item(index, json.loads(line)))
+        except ValueError:
+            items.append((index, None, None, "Invalid JSON"))
+        index += 1
+        if len(items) >= sentiment_fanout.chunk_size:
+            submit()
+            items = []
+            while len(pending) >= sentiment_fanout.max_in_flight:
+                yield await collect()
+    if items:
+        submit()
+    while pending:
+        yield await collect()
+    if truncated:
+        yield json.dumps({"index": index, "error": f"Batch limit of {SENTIMENT_BATCH_MAX} texts reached"}) + "\n"
+
+@app.post("/text-sentiment/batch")
+async def text_sentiment_batch(http_request: Request, drivers: bool = False):
+    """
+    Score many texts in one request.
+
+    A JSON body (a list, or {"texts": [...]}) of strings or {"text", "id"}
+    objects is answered with {"results": [...]} in the same order. With
+    Content-Type application/x-ndjson, each body line is one such entry and
+    results stream back as NDJSON, in order, while the body is still being
+    read. Each result carries its index (and id, if given), the label and
+    VADER scores; ?drivers=true adds the phrases that drove each score.
+    Large batches are scored across the sentiment worker processes.
+    """
+    content_type = http_request.headers.get("content-type", "")
+    if "ndjson" in content_type or "jsonlines" in content_type:
+        return StreamingResponse(
+            stream_batch_sentiment(http_request, drivers),
+            media_type="application/x-ndjson"
+        )
+
+    try:
+        body = await http_request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Body must be JSON or NDJSON")
+    texts = body.get("texts") if isinstance(body, dict) else body
+    if not isinstance(texts, list):
+        raise HTTPException(status_code=400, detail='Expected a JSON list or {"texts": [...]}')
+    if len(texts) > SENTIMENT_BATCH_MAX:
+        raise HTTPException(status_code=413, detail=f"At most {SENTIMENT_BATCH_MAX} texts per batch")
+
+    items = [batch_item(index, value) for index, value in enumerate(texts)]
+    results = await run_in_pool("sentiment", score_batch_items, items, drivers)
+    return {"results": results}
+
+
 #======================================SENTIMENT ANALYSIS END =================================
 
 
@@ -309,42 +733,46 @@ async def ocr(
         # Create a separate chat history for OCR analysis to keep it isolated from regular chat
         ocr_chat_history = ChatHistory()
 
-        # Save the uploaded file temporarily
-        file_location = f"uploads/{file.filename}"
-        try:
-            with open(file_location, "wb+") as buffer:
-                shutil.copyfileobj(file.file, buffer)
-        except Exception as save_error:
-            logger.error(f"Error saving file: {str(save_error)}")
-            raise HTTPException(status_code=500, detail=f"Error saving file: {str(save_error)}")
+        # Read the upload into memory, rejecting oversized or non-image files early
+        image_bytes = await read_image_upload(file)
 
-        # Call the OCR function from ocr.py
-        text = extract_text_from_enhanced_image(file_location)
+        # Call the OCR function from ocr.py on the in-memory image, tiling the
+        # report into text blocks and table cells that are read in parallel.
+        # Reports from the same lab share a layout and differ only in values,
+        # so only exact re-uploads may be served from the OCR cache.
+        # report=True keeps decimals, units and ranges (5.6 mg/dL, 4.0-5.6, %)
+        text = await run_in_pool(
+            "ocr", extract_text_from_enhanced_image, image_bytes, near_duplicates=False, layout=True, report=True
+        )
 
         # If OCR text is empty, provide a fallback message
         if not text.strip():
             text = "No text could be detected in the provided image."
 
-        # Clean up - remove the file after processing
-        try:
-            os.remove(file_location)
-        except Exception as rm_error:
-            logger.warning(f"Error removing file: {str(rm_error)}")
-
         # Use description as user_query if needed
         user_query = description  # Use description as the user query
 
-        # Prepare the prompt for the LLM with better handling of missing values
-        prompt = create_health_report_analysis_prompt(age_value, gender_value, description, text, user_query)
-
-        # Add the prompt to OCR chat history
-        ocr_chat_history.add_message(prompt)
-
-        # Get the LLM response
-        llm_response = get_llm_response(prompt, ocr_chat_history)
+        # Send only the structured lab values when any were recognised; the raw
+        # OCR text (headers, addresses, boilerplate) is the fallback
+        with stage("report_prompt_build"):
+            lab_rows = extract_lab_rows(text)
+            if lab_rows:
+                prompt = create_lab_table_analysis_prompt(
+                    age_value, gender_value, description, format_lab_table(lab_rows), user_query
+                )
+            else:
+                prompt = create_health_report_analysis_prompt(age_value, gender_value, description, text, user_query)
+
+        # Get the LLM response (get_llm_response records the prompt in the history)
+        llm_response = await run_in_pool(
+            "llm", get_llm_response, prompt, ocr_chat_history, token_budget=TOKEN_BUDGETS["health-ocr"],
+            speculative=SPECULATIVE_ENDPOINTS["health-ocr"]
+        )
 
         return llm_response
 
+    except (PoolSaturated, HTTPException):
+        raise
     except Exception as e:
         logger.error(f"General Error in OCR endpoint: {str(e)}")
         return JSONResponse(
@@ -353,9 +781,107 @@ async def ocr(
         )
 @app.get("/health")
 async def health_check():
-    """Health check endpoint to verify the service is running."""
+    """Liveness probe: the process is up and serving, whether or not models are loaded yet."""
     return {"status": "healthy"}
 
-if __name__ == "__main__":
+@app.get("/ready")
+async def readiness_check():
+    """Readiness probe: 200 once the required models are loaded and warm, 503 (with each model's state) until then."""
+    readiness = startup.readiness()
+    return JSONResponse(status_code=200 if readiness["ready"] else 503, content=readiness)
+
+@app.get("/models")
+async def model_stats():
+    """Report load time, resident size and usage of registry-managed models."""
+    return registry.stats()
+
+@app.get("/llm-stats")
+async def llm_stats():
+    """Report backend throughput and memory, speculative decoding, batching, KV-cache reuse and time-to-first-token statistics."""
+    # Asks the model server over its socket when the LLM is out of process
+    return await asyncio.to_thread(get_llm_stats)
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Stage latency histograms, token counts, queue waits, model loads and pool gauges in Prometheus text format."""
+    snapshots = [metrics.snapshot()]
+    if LLM_SERVER_SOCKET:
+        # LLM stages, tokens and the batcher are recorded in the model server process
+        snapshots.append(with_labels(await asyncio.to_thread(metrics_snapshot), process="model_server"))
+    return PlainTextResponse(render(*snapshots), media_type="text/plain; version=0.0.4")
+
+@app.get("/debug/traces")
+async def debug_traces(limit: int = 50, route: Optional[str] = None, min_ms: Optional[float] = None,
+                       status: Optional[int] = None):
+    """
+    Recent request traces, newest first: stage timings and small annotations
+    (sizes, token counts), never request text. Filter by route template
+    (e.g. /health-ocr), minimum duration in ms, or minimum status code.
+    """
+    return {
+        "stats": trace_log.stats(),
+        "traces": trace_log.recent(limit=limit, route=route, min_ms=min_ms, min_status=status),
+    }
+
+@app.get("/cache-stats")
+async def cache_stats():
+    """Report response-cache and OCR-cache hit/miss counters."""
+    return {
+        "responses": response_cache.stats() if response_cache is not None else {"enabled": False},
+        "ocr": ocr_cache.stats(),
+        "sentiment_explanations": generative_explainer.stats() if generative_explainer is not None else {"enabled": False}
+    }
+
+@app.get("/asr-stats")
+async def asr_stats():
+    """Report chunked transcription throughput counters."""
+    return transcription_engine.stats()
+
+@app.get("/sentiment-stats")
+async def sentiment_stats():
+    """Report batch sentiment throughput counters."""
+    return sentiment_fanout.stats()
+
+@app.get("/sessions")
+async def session_stats():
+    """Report the number, size and eviction counts of stored chat sessions."""
+    return conversation_store.stats()
+
+@app.get("/pools")
+async def workload_pool_stats():
+    """Report concurrency, queue depth and rejections for each workload pool."""
+    return pool_stats()
+
+def run_workers():
+    """Start the model server, then API_WORKERS uvicorn workers that share it for the LLM."""
+    import subprocess
+    import sys
+    import tempfile
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+
+    backend_dir = os.path.dirname(os.path.abspath(__file__))
+    socket_path = LLM_SERVER_SOCKET or DEFAULT_SERVER_SOCKET
+    model_server = subprocess.Popen([sys.executable, os.path.join(backend_dir, "model_server.py"), "--socket", socket_path])
+    # Workers re-import this module and read these: use the model server, and leave the tunnel to this process
+    os.environ["LLM_SERVER_SOCKET"] = socket_path
+    os.environ["NGROK_ENABLED"] = "0"
+    # Each worker is its own process: chat sessions and cached responses are only shared through SQLite
+    for name, filename in (("SESSION_DB", "sessions.sqlite3"), ("RESPONSE_CACHE_DB", "responses.sqlite3")):
+        if not os.environ.get(name):
+            os.environ[name] = os.path.join(tempfile.gettempdir(), f"api-{filename}")
+            logger.info(f"{name} is not set; the workers share {os.environ[name]}")
+    listener = open_tunnel() if NGROK_ENABLED else None
+    try:
+        uvicorn.run("app:app", host="0.0.0.0", port=8000, workers=API_WORKERS, app_dir=backend_dir)
+    finally:
+        if listener is not None:
+            listener.close()
+        model_server.terminate()
+        model_server.wait()
+
+if __name__ == "__main__":
+    if API_WORKERS > 1:
+        run_workers()
+    else:
+        import uvicorn
+        uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,200 @@
+import io
+import logging
+import os
+import subprocess
+import tempfile
+import wave
+from math import gcd
+
+import numpy as np
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Whisper's input rate
+TARGET_SAMPLE_RATE = 16000
+# Taps of the anti-aliasing filter used when scipy is not installed
+RESAMPLE_TAPS = 65
+# Output samples filtered per block, bounding the memory of the gathered windows
+RESAMPLE_BLOCK = 16384
+# Seconds before an ffmpeg fallback decode is abandoned
+FFMPEG_TIMEOUT = int(os.environ.get("FFMPEG_TIMEOUT", "120"))
+
+# Formats decoded in-process; everything else goes through ffmpeg
+SOUNDFILE_FORMATS = ("flac", "ogg", "wav")
+
+
+class AudioDecodeError(Exception):
+    """Raised when an upload cannot be decoded as audio."""
+
+
+# ---------------------------------------------------------------------------
+# Decoders
+# ---------------------------------------------------------------------------
+
+def decode_wav(data):
+    """
+    Decode integer PCM WAV with the standard library.
+
+    Returns:
+        tuple[numpy.ndarray, int]: (frames x channels float32 samples, sample rate)
+    """
+    with wave.open(io.BytesIO(data)) as wav:
+        channels, width, rate = wav.getnchannels(), wav.getsampwidth(), wav.getframerate()
+        raw = wav.readframes(wav.getnframes())
+
+    if width == 1:
+        samples = (np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+    elif width == 2:
+        samples = np.frombuffer(raw, dtype="<i2").astype(np.float32) / 32768.0
+    elif width == 3:
+        # Widen 24-bit little-endian samples to int32 by putting them in the top three bytes
+        packed = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3)
+        widened = np.zeros((packed.shape[0], 4), dtype=np.uint8)
+        widened[:, 1:] = packed
+        samples = widened.view("<i4").ravel().astype(np.float32) / 2147483648.0
+    elif width == 4:
+        samples = np.frombuffer(raw, dtype="<i4").astype(np.float32) / 2147483648.0
+    else:
+        raise AudioDecodeError(f"Unsupported WAV sample width: {width} bytes")
+    return samples.reshape(-1, channels), rate
+
+
+def decode_soundfile(data):
+    """Decode FLAC/OGG (and float WAV) with libsndfile, if the soundfile package is installed."""
+    import soundfile
+    samples, rate = soundfile.read(io.BytesIO(data), dtype="float32", always_2d=True)
+    return samples, rate
+
+
+def _run_ffmpeg(source, data=None):
+    command = [
+        "ffmpeg", "-nostdin", "-loglevel", "error", "-threads", "0", "-i", source,
+        "-f", "s16le", "-ac", "1", "-acodec", "pcm_s16le", "-ar", str(TARGET_SAMPLE_RATE), "-",
+    ]
+    try:
+        result = subprocess.run(command, input=data, capture_output=True, timeout=FFMPEG_TIMEOUT)
+    except FileNotFoundError:
+        raise AudioDecodeError("ffmpeg is not installed; only WAV, FLAC and OGG can be decoded") from None
+    except subprocess.TimeoutExpired:
+        raise AudioDecodeError(f"ffmpeg did not finish within {FFMPEG_TIMEOUT}s") from None
+    if result.returncode != 0:
+        raise AudioDecodeError(f"ffmpeg failed: {result.stderr.decode(errors='replace').strip()}")
+    return np.frombuffer(result.stdout, dtype="<i2").astype(np.float32) / 32768.0
+
+
+def decode_ffmpeg(data, suffix=""):
+    """
+    Decode compressed audio (M4A/AAC/MP3/WebM) with ffmpeg, already at 16 kHz mono.
+
+    The upload is piped to ffmpeg's stdin; MP4 files whose index (moov atom)
+    sits at the end cannot be read from a pipe, and only those are written to
+    a temporary file.
+    """
+    try:
+        return _run_ffmpeg("pipe:0", bytes(data))
+    except AudioDecodeError:
+        if suffix not in ("mp4", "m4a"):
+            raise
+    with tempfile.NamedTemporaryFile(suffix=f".{suffix}") as temp_file:
+        temp_file.write(data)
+        temp_file.flush()
+        return _run_ffmpeg(temp_file.name)
+
+
+# ---------------------------------------------------------------------------
+# Resampling
+# ---------------------------------------------------------------------------
+
+def _lowpass_kernel(cutoff, taps=RESAMPLE_TAPS):
+    """Hamming-windowed sinc low-pass; cutoff in cycles per input sample."""
+    n = np.arange(taps) - (taps - 1) / 2
+    kernel = 2 * cutoff * np.sinc(2 * cutoff * n) * np.hamming(taps)
+    return (kernel / kernel.sum()).astype(np.float32)
+
+
+def resample(samples, orig_rate, target_rate=TARGET_SAMPLE_RATE):
+    """
+    Resample mono float32 audio.
+
+    Uses scipy's polyphase resampler when scipy is installed. Otherwise the
+    input is low-pass filtered only at the positions the output needs
+    (windows gathered in blocks and reduced with one matrix product), then
+    linearly interpolated, so 48/44.1 kHz input never aliases into 16 kHz.
+    """
+    if orig_rate == target_rate or samples.size == 0:
+        return samples.astype(np.float32, copy=False)
+
+    try:
+        from scipy.signal import resample_poly
+        divisor = gcd(int(orig_rate), int(target_rate))
+        return resample_poly(samples, target_rate // divisor, orig_rate // divisor).astype(np.float32)
+    except ImportError:
+        pass
+
+    ratio = orig_rate / target_rate
+    positions = np.arange(int(len(samples) / ratio)) * ratio
+    if ratio <= 1:
+        # Upsampling adds no content above the old Nyquist; interpolation is enough
+        return np.interp(positions, np.arange(len(samples)), samples).astype(np.float32)
+
+    kernel = _lowpass_kernel(0.5 / ratio)
+    half = len(kernel) // 2
+    windows = np.lib.stride_tricks.sliding_window_view(np.pad(samples, (half, half + 1)), len(kernel))
+    left = np.floor(positions).astype(np.int64)
+    fraction = (positions - left).astype(np.float32)
+    output = np.empty(len(positions), dtype=np.float32)
+    for start in range(0, len(positions), RESAMPLE_BLOCK):
+        block = slice(start, start + RESAMPLE_BLOCK)
+        filtered_left = windows[left[block]] @ kernel
+        filtered_right = windows[left[block] + 1] @ kernel
+        output[block] = filtered_left + fraction[block] * (filtered_right - filtered_left)
+    return output
+
+
+def to_mono(samples):
+    """Average a frames x channels array down to one channel."""
+    return samples.mean(axis=1, dtype=np.float32) if samples.ndim == 2 and samples.shape[1] > 1 else samples.reshape(-1)
+
+
+# ---------------------------------------------------------------------------
+# Entry point
+# ---------------------------------------------------------------------------
+
+def load_audio(data, audio_format=None):
+    """
+    Decode an in-memory upload to Whisper input: 16 kHz mono float32.
+
+    WAV is decoded with the standard library and FLAC/OGG with soundfile
+    (libsndfile) straight from the buffer; compressed formats fall back to an
+    ffmpeg pipe.
+
+    Args:
+        data (bytes | bytearray): Encoded audio
+        audio_format (str): Format from uploads.detect_audio_format, if known
+
+    Returns:
+        numpy.ndarray: Samples at TARGET_SAMPLE_RATE
+
+    Raises:
+        AudioDecodeError: If no decoder can read the data
+    """
+    if audio_format == "wav":
+        try:
+            samples, rate = decode_wav(data)
+            return resample(to_mono(samples), rate)
+        except (wave.Error, EOFError, AudioDecodeError) as e:
+            # Float or compressed WAV variants; try libsndfile next
+            logger.debug(f"wave could not decode upload ({e}); trying soundfile")
+
+    if audio_format in SOUNDFILE_FORMATS:
+        try:
+            samples, rate = decode_soundfile(data)
+            return resample(to_mono(samples), rate)
+        except ImportError:
+            logger.info("soundfile is not installed; decoding with ffmpeg")
+        except RuntimeError as e:
+            # soundfile raises LibsndfileError (a RuntimeError) for unsupported codecs, e.g. Opus
+            logger.debug(f"soundfile could not decode upload ({e}); trying ffmpeg")
+
+    return decode_ffmpeg(data, audio_format or "")
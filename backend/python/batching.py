@@ -0,0 +1,125 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from metrics import QUEUE_WAIT_SECONDS
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class _PendingPrompt:
+    __slots__ = ("prompt", "generate_kwargs", "future", "enqueued_at")
+
+    def __init__(self, prompt, generate_kwargs):
+        self.prompt = prompt
+        self.generate_kwargs = generate_kwargs
+        self.future = Future()
+        self.enqueued_at = time.perf_counter()
+
+
+class BatchingEngine:
+    """
+    Dynamic batcher in front of a causal LM's generate().
+
+    Prompts submitted concurrently are collected for up to window_ms (or until
+    max_batch_size prompts are waiting), left-padded into one tensor and
+    generated together. Each caller gets back only its own completion.
+    """
+
+    def __init__(self, model, tokenizer, max_batch_size=8, window_ms=20, **generate_kwargs):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.max_batch_size = max_batch_size
+        self.window = window_ms / 1000.0
+        self.generate_kwargs = generate_kwargs
+
+        # Decoder-only models must be left-padded so every row ends at the
+        # position generation continues from
+        self.tokenizer.padding_side = "left"
+        if self.tokenizer.pad_token is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
+
+        self._queue = queue.Queue()
+        self.batches = 0
+        self.prompts = 0
+        self._worker = threading.Thread(target=self._run, name="llm-batcher", daemon=True)
+        self._worker.start()
+
+    def submit(self, prompt, **generate_kwargs):
+        """Queue a prompt and return a Future resolving to its generated text."""
+        pending = _PendingPrompt(prompt, {**self.generate_kwargs, **generate_kwargs})
+        self._queue.put(pending)
+        return pending.future
+
+    def generate(self, prompt, **generate_kwargs):
+        """Blocking helper: submit a prompt and wait for its completion."""
+        return self.submit(prompt, **generate_kwargs).result()
+
+    def _collect(self):
+        """Block for the first prompt, then gather more until the window closes."""
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.window
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            # Prompts can only share a generate() call if their settings match
+            groups = {}
+            for pending in batch:
+                key = tuple(sorted(pending.generate_kwargs.items()))
+                groups.setdefault(key, []).append(pending)
+            for group in groups.values():
+                self._generate_batch(group)
+
+    def _generate_batch(self, group):
+        import torch
+
+        started = time.perf_counter()
+        for pending in group:
+            QUEUE_WAIT_SECONDS.observe(started - pending.enqueued_at, queue="llm_batcher")
+        try:
+            inputs = self.tokenizer(
+                [pending.prompt for pending in group],
+                return_tensors="pt",
+                padding=True,
+            ).to(self.model.device)
+            with torch.inference_mode():
+                output_ids = self.model.generate(
+                    **inputs,
+                    pad_token_id=self.tokenizer.pad_token_id,
+                    **group[0].generate_kwargs,
+                )
+            # Left padding means every prompt ends at the same column
+            new_tokens = output_ids[:, inputs["input_ids"].shape[1]:]
+            texts = self.tokenizer.batch_decode(new_tokens, skip_special_tokens=True)
+        except Exception as e:
+            logger.error(f"Batched generation failed for {len(group)} prompt(s): {str(e)}")
+            for pending in group:
+                pending.future.set_exception(e)
+            return
+
+        self.batches += 1
+        self.prompts += len(group)
+        for pending, text in zip(group, texts):
+            pending.future.set_result(text)
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "prompts": self.prompts,
+            "avg_batch_size": round(self.prompts / self.batches, 2) if self.batches else 0.0,
+            "max_batch_size": self.max_batch_size,
+            "window_ms": self.window * 1000,
+        }
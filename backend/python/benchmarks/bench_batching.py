@@ -0,0 +1,105 @@
+"""
+Compare one-at-a-time generation with the dynamic batching engine.
+
+Usage:
+    python benchmarks/bench_batching.py --model Qwen/Qwen1.5-0.5B-Chat --requests 16 --concurrency 8
+
+Both paths use greedy decoding with the same max_new_tokens so the amount of
+work per request is identical. Reports throughput and per-request latency.
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import torch
+from transformers import AutoModelForCausalLM, AutoTokenizer
+
+from batching import BatchingEngine
+
+PROMPTS = [
+    "What are the common symptoms of iron deficiency?",
+    "Is a fasting blood sugar of 110 mg/dL normal?",
+    "Explain what a high LDL cholesterol level means.",
+    "What foods should someone with hypertension avoid?",
+    "How much water should an adult drink per day?",
+    "What does an elevated TSH level indicate?",
+    "Are artificial sweeteners safe for diabetics?",
+    "What is a normal resting heart rate?",
+]
+
+
+def summarize(name, latencies, elapsed, tokens):
+    latencies = sorted(latencies)
+    p95 = latencies[max(0, int(len(latencies) * 0.95) - 1)]
+    print(
+        f"{name:>12}: {len(latencies) / elapsed:6.2f} req/s  {tokens / elapsed:8.1f} tok/s  "
+        f"p50 {statistics.median(latencies):6.2f}s  p95 {p95:6.2f}s  total {elapsed:6.2f}s"
+    )
+
+
+def run(label, generate_fn, prompts, concurrency, tokenizer):
+    latencies = []
+
+    def timed(prompt):
+        start = time.perf_counter()
+        text = generate_fn(prompt)
+        latencies.append(time.perf_counter() - start)
+        return text
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        outputs = list(executor.map(timed, prompts))
+    elapsed = time.perf_counter() - start
+    tokens = sum(len(tokenizer(text, add_special_tokens=False)["input_ids"]) for text in outputs)
+    summarize(label, latencies, elapsed, tokens)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=os.environ.get("BENCH_MODEL", "Qwen/Qwen1.5-0.5B-Chat"))
+    parser.add_argument("--requests", type=int, default=16)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--max-new-tokens", type=int, default=64)
+    parser.add_argument("--window-ms", type=float, default=20)
+    args = parser.parse_args()
+
+    tokenizer = AutoTokenizer.from_pretrained(args.model)
+    model = AutoModelForCausalLM.from_pretrained(args.model, torch_dtype=torch.float32)
+    model.eval()
+    generate_kwargs = {"max_new_tokens": args.max_new_tokens, "do_sample": False}
+    prompts = [PROMPTS[i % len(PROMPTS)] for i in range(args.requests)]
+
+    # The current path: a shared model serialised behind a lock, one prompt per generate()
+    lock = threading.Lock()
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+
+    def sequential(prompt):
+        with lock, torch.inference_mode():
+            inputs = tokenizer(prompt, return_tensors="pt")
+            output_ids = model.generate(**inputs, pad_token_id=tokenizer.pad_token_id, **generate_kwargs)
+            return tokenizer.decode(output_ids[0, inputs["input_ids"].shape[1]:], skip_special_tokens=True)
+
+    batcher = BatchingEngine(
+        model,
+        tokenizer,
+        max_batch_size=args.concurrency,
+        window_ms=args.window_ms,
+        **generate_kwargs,
+    )
+
+    print(f"model={args.model} requests={args.requests} concurrency={args.concurrency} "
+          f"max_new_tokens={args.max_new_tokens} threads={torch.get_num_threads()}")
+    run("sequential", sequential, prompts, args.concurrency, tokenizer)
+    run("batched", batcher.generate, prompts, args.concurrency, tokenizer)
+    print(f"batcher: {batcher.stats()}")
+
+
+if __name__ == "__main__":
+    main()
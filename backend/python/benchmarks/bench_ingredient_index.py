@@ -0,0 +1,99 @@
+"""
+Ingredient-index build time, lookup latency and prompt shrinkage for /ocr.
+
+Usage:
+    python benchmarks/bench_ingredient_index.py --repeat 200 --label-tokens 500
+
+Runs the index over the OCR text of the sample ingredient images and over a
+synthetic noisy label of the requested length, and prints the per-call
+latency (first call, which fills the spelling-correction cache, and the
+steady-state median) plus the word count of the raw text vs. the ingredient
+list that reaches the LLM.
+"""
+import argparse
+import glob
+import os
+import random
+import statistics
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from ingredient_index import IngredientIndex, format_ingredients
+
+SAMPLE_DIR = os.path.join(BACKEND_DIR, "..", "..", "Sample input files", "ingredent images")
+FILLER = "crunchy delicious goodness of real taste best before see pack net weight store in a cool dry place".split()
+
+
+def noisy(word, rng):
+    """Simulate a single OCR substitution error."""
+    if len(word) < 5 or rng.random() > 0.3:
+        return word
+    i = rng.randrange(len(word))
+    return word[:i] + rng.choice("ilo0rn") + word[i + 1:]
+
+
+def synthetic_label(index, tokens, seed=0):
+    rng = random.Random(seed)
+    aliases = [alias for _, alias_list in index.entries for alias in alias_list]
+    words = []
+    while len(words) < tokens:
+        if rng.random() < 0.1:
+            words.extend(noisy(word, rng) for word in rng.choice(aliases).split())
+        else:
+            words.append(rng.choice(FILLER))
+    return " ".join(words[:tokens])
+
+
+def sample_texts():
+    try:
+        import ocr
+    except ImportError as e:
+        print(f"OCR unavailable ({e}); skipping sample images")
+        return []
+    texts = [
+        (os.path.basename(path), ocr.extract_text_from_enhanced_image(path))
+        for path in sorted(glob.glob(os.path.join(SAMPLE_DIR, "*")))
+    ]
+    ocr.ocr_engine.shutdown()
+    return texts
+
+
+def measure(index, text, repeat):
+    index._speller.correct.cache_clear()
+    start = time.perf_counter()
+    found, unmatched = index.extract(text)
+    cold = time.perf_counter() - start
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        index.extract(text)
+        timings.append(time.perf_counter() - start)
+    return found, unmatched, cold, statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--label-tokens", type=int, default=500)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    index = IngredientIndex.load()
+    print(f"built index over {len(index.entries)} ingredients in {(time.perf_counter() - start) * 1000:.1f}ms")
+
+    texts = sample_texts()
+    texts.append((f"synthetic ({args.label_tokens} tokens)", synthetic_label(index, args.label_tokens)))
+
+    print(f"{'input':<28} {'found':>5} {'cold':>9} {'warm p50':>9} {'raw words':>10} {'list words':>11}")
+    for name, text in texts:
+        found, unmatched, cold, warm = measure(index, text, args.repeat)
+        listed = format_ingredients(found, unmatched) if found else text
+        print(f"{name[:28]:<28} {len(found):>5} {cold * 1000:>7.3f}ms {warm * 1000:>7.3f}ms "
+              f"{len(text.split()):>10} {len(listed.split()):>11}")
+
+
+if __name__ == "__main__":
+    main()
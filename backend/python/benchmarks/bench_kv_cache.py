@@ -0,0 +1,95 @@
+"""
+Per-turn latency of a 10-turn conversation with and without KV-cache reuse.
+
+Usage:
+    python benchmarks/bench_kv_cache.py --model Qwen/Qwen1.5-0.5B-Chat --turns 10
+
+Both runs use greedy decoding, so they produce the same text; the only
+difference is whether each turn re-prefills the whole conversation.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import torch
+from transformers import AutoModelForCausalLM, AutoTokenizer
+
+from kv_cache import SessionKVCache, generate_with_cache
+
+SYSTEM_PROMPT = "You are a helpful, friendly AI assistant. Provide clear, concise, and accurate responses to user questions."
+
+QUESTIONS = [
+    "My fasting blood sugar was 118 mg/dL. What does that mean?",
+    "What lifestyle changes help lower it?",
+    "Which foods should I avoid?",
+    "Is fruit okay to eat?",
+    "How often should I retest?",
+    "What is HbA1c and why does it matter?",
+    "My HbA1c is 6.1%. Is that prediabetes?",
+    "Can exercise alone bring it down?",
+    "How much exercise per week is recommended?",
+    "Should I see a doctor now or wait for the retest?",
+]
+
+
+def build_prompt(turns, question):
+    prompt = f"<|im_start|>system\n{SYSTEM_PROMPT}<|im_end|>\n"
+    for user_msg, ai_msg in turns:
+        prompt += f"<|im_start|>user\n{user_msg}<|im_end|>\n<|im_start|>assistant\n{ai_msg}<|im_end|>\n"
+    return prompt + f"<|im_start|>user\n{question}<|im_end|>\n<|im_start|>assistant\n"
+
+
+def plain_generate(model, tokenizer, prompt, **generate_kwargs):
+    inputs = tokenizer(prompt, return_tensors="pt")
+    with torch.inference_mode():
+        output_ids = model.generate(**inputs, pad_token_id=tokenizer.pad_token_id or tokenizer.eos_token_id, **generate_kwargs)
+    return tokenizer.decode(output_ids[0, inputs["input_ids"].shape[1]:], skip_special_tokens=True)
+
+
+def run_conversation(generate_fn, turns):
+    history, latencies, prompts = [], [], []
+    for question in QUESTIONS[:turns]:
+        prompt = build_prompt(history, question)
+        start = time.perf_counter()
+        answer = generate_fn(prompt).strip()
+        latencies.append(time.perf_counter() - start)
+        prompts.append(prompt)
+        history.append((question, answer))
+    return latencies, prompts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=os.environ.get("BENCH_MODEL", "Qwen/Qwen1.5-0.5B-Chat"))
+    parser.add_argument("--turns", type=int, default=10)
+    parser.add_argument("--max-new-tokens", type=int, default=48)
+    args = parser.parse_args()
+
+    tokenizer = AutoTokenizer.from_pretrained(args.model)
+    model = AutoModelForCausalLM.from_pretrained(args.model, torch_dtype=torch.float32)
+    model.eval()
+    generate_kwargs = {"max_new_tokens": args.max_new_tokens, "do_sample": False}
+
+    baseline, prompts = run_conversation(
+        lambda prompt: plain_generate(model, tokenizer, prompt, **generate_kwargs), args.turns
+    )
+    kv_cache = SessionKVCache()
+    reused, _ = run_conversation(
+        lambda prompt: generate_with_cache(model, tokenizer, kv_cache, "bench", prompt, **generate_kwargs),
+        args.turns,
+    )
+
+    print(f"model={args.model} turns={args.turns} max_new_tokens={args.max_new_tokens}")
+    print(f"{'turn':>4} {'prompt tok':>10} {'full prefill':>13} {'kv reuse':>9} {'speedup':>8}")
+    for turn, (prompt, full, cached) in enumerate(zip(prompts, baseline, reused), start=1):
+        prompt_len = len(tokenizer(prompt)["input_ids"])
+        print(f"{turn:>4} {prompt_len:>10} {full:>12.3f}s {cached:>8.3f}s {full / cached:>7.2f}x")
+    print(f"total {sum(baseline):.2f}s vs {sum(reused):.2f}s")
+    print(f"kv cache: {kv_cache.stats()}")
+
+
+if __name__ == "__main__":
+    main()
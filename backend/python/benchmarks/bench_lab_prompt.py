@@ -0,0 +1,78 @@
+"""
+/health-ocr prompt size with raw OCR text vs. the extracted lab-value table.
+
+Usage:
+    python benchmarks/bench_lab_prompt.py --model Qwen/Qwen1.5-0.5B-Chat
+
+For each sample report prints the rows extracted, the prompt length in
+tokens for both prompt styles and the extraction time. Reports with no
+recognised lab values (e.g. ultrasound findings) fall back to the raw prompt
+in the API, so their "table" column repeats the raw size.
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+import ocr
+from lab_extract import extract_lab_rows, format_lab_table
+from prompt import create_health_report_analysis_prompt, create_lab_table_analysis_prompt
+
+REPORT_DIR = os.path.join(BACKEND_DIR, "..", "..", "Sample input files", "health report")
+PROFILE = ("45", "Male", "Type 2 diabetes")
+QUERY = "Is anything in this report concerning?"
+
+
+def load_counter(model_name):
+    """Token counter from the model's tokenizer, or a whitespace count if transformers is unavailable."""
+    try:
+        from transformers import AutoTokenizer
+        tokenizer = AutoTokenizer.from_pretrained(model_name)
+        return lambda text: len(tokenizer.encode(text, add_special_tokens=False))
+    except Exception as e:
+        print(f"tokenizer unavailable ({e}); counting whitespace-separated words")
+        return lambda text: len(text.split())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=os.environ.get("BENCH_MODEL", "Qwen/Qwen1.5-0.5B-Chat"))
+    parser.add_argument("--show-table", action="store_true", help="print each extracted table")
+    args = parser.parse_args()
+    count_tokens = load_counter(args.model)
+
+    print(f"{'report':<28} {'rows':>5} {'raw':>6} {'table':>6} {'saved':>7} {'extract':>8}")
+    total_raw = total_table = 0
+    for path in sorted(glob.glob(os.path.join(REPORT_DIR, "*"))):
+        text = ocr.extract_text_from_enhanced_image(path, near_duplicates=False, layout=True, report=True)
+
+        start = time.perf_counter()
+        rows = extract_lab_rows(text)
+        elapsed = time.perf_counter() - start
+
+        raw_tokens = count_tokens(create_health_report_analysis_prompt(*PROFILE, text, QUERY))
+        if rows:
+            table = format_lab_table(rows)
+            table_tokens = count_tokens(create_lab_table_analysis_prompt(*PROFILE, table, QUERY))
+        else:
+            table, table_tokens = None, raw_tokens
+        total_raw += raw_tokens
+        total_table += table_tokens
+
+        saved = 1 - table_tokens / raw_tokens if raw_tokens else 0.0
+        print(f"{os.path.basename(path)[:28]:<28} {len(rows):>5} {raw_tokens:>6} {table_tokens:>6} "
+              f"{saved:>6.1%} {elapsed * 1000:>6.2f}ms")
+        if args.show_table and table:
+            print(table)
+
+    if total_raw:
+        print(f"total: raw {total_raw} tokens, table {total_table} tokens ({1 - total_table / total_raw:.1%} smaller)")
+    ocr.ocr_engine.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Decode speed and memory of the LLM inference backends.
+
+Usage:
+    python benchmarks/bench_llm_backends.py --backends tiny
+    LLM_GGUF_PATH=model.Q4_K_M.gguf python benchmarks/bench_llm_backends.py --backends bf16,int8,gguf
+
+Each backend is loaded in a fresh process, so peak RSS is its own and not
+left over from the previous one. The same chat prompt is generated greedily
+--repeat times and the load time, load RSS, peak RSS and tokens/s reported by
+the backend's stats() are printed. "tiny" needs no network and no weights.
+
+With --speculative the same prompt is also decoded with the draft model
+(LLM_DRAFT_MODEL), and its tokens/s and generated tokens per target-model
+forward pass are printed next to the plain run (the estimated acceptance
+rate is in --json output, when the draft shares the target's tokenizer).
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+PROMPT = "What should I eat to keep my blood sugar stable through the afternoon?"
+
+
+def run_backend(name, model, max_new_tokens, repeat, speculative, results):
+    os.environ["LLM_BACKEND"] = name
+    if model:
+        os.environ["LLM_MODEL"] = model
+    # Single prompts: measure the model, not the batching window
+    os.environ["LLM_BATCHING"] = "0"
+    import llm_model
+
+    try:
+        backend = llm_model.llm()
+        prompt = llm_model.format_chat([{"role": "user", "content": PROMPT}])
+        for _ in range(repeat):
+            streamer = backend.make_streamer()
+            started = time.perf_counter()
+            backend.stream(prompt, streamer, max_new_tokens=max_new_tokens, **llm_model.DETERMINISTIC_KWARGS)
+            backend.record("".join(streamer), time.perf_counter() - started)
+        stats = backend.stats()
+        if speculative:
+            decoder = llm_model.require_draft()
+            for _ in range(repeat):
+                decoder.generate(prompt, max_new_tokens=max_new_tokens, **llm_model.DETERMINISTIC_KWARGS)
+            stats["speculative"] = decoder.stats()
+        results.put((name, stats))
+    except Exception as e:
+        results.put((name, {"error": str(e)}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", default="tiny", help="Comma-separated backend names")
+    parser.add_argument("--model", help="LLM_MODEL for the transformers backends")
+    parser.add_argument("--max-new-tokens", type=int, default=64)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--speculative", action="store_true", help="Also decode with the draft model")
+    parser.add_argument("--json", action="store_true", help="Print raw stats as JSON")
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    report = {}
+    for name in args.backends.split(","):
+        process = context.Process(
+            target=run_backend,
+            args=(name, args.model, args.max_new_tokens, args.repeat, args.speculative, results)
+        )
+        process.start()
+        backend_name, stats = results.get()
+        process.join()
+        report[backend_name] = stats
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"{'backend':<8} {'load s':>8} {'load MB':>9} {'peak MB':>9} {'tokens/s':>9} {'draft tok/s':>12} {'tok/pass':>9}")
+    for name, stats in report.items():
+        if "error" in stats:
+            print(f"{name:<8} error: {stats['error']}")
+            continue
+        draft = stats.get("speculative", {})
+        print(f"{name:<8} {stats['load_seconds']:>8.1f} {stats['load_rss_mb'] or 0:>9.0f} "
+              f"{stats['peak_rss_mb']:>9.0f} {stats['tokens_per_second'] or 0:>9.1f} "
+              f"{draft.get('tokens_per_second') or 0:>12.1f} {draft.get('tokens_per_target_pass') or 0:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+OCR throughput of the pytesseract CLI path vs. the warm tesserocr worker pool.
+
+Usage:
+    python benchmarks/bench_ocr_engine.py --requests 48 --concurrency 1 4 16
+
+Images come from "Sample input files/" and are preprocessed once up front,
+so the numbers measure only the Tesseract engine.
+"""
+import argparse
+import glob
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from ocr import OCR_WHITELIST, enhance_image_for_ocr
+from ocr_engine import PytesseractEngine, TesserocrEngine
+
+SAMPLE_DIR = os.path.join(BACKEND_DIR, "..", "..", "Sample input files")
+
+
+def load_images():
+    paths = sorted(
+        path for path in glob.glob(os.path.join(SAMPLE_DIR, "**", "*"), recursive=True)
+        if path.lower().endswith((".png", ".jpg", ".jpeg", ".webp"))
+    )
+    return [(os.path.basename(path), enhance_image_for_ocr(path)) for path in paths]
+
+
+def run(engine, images, requests, concurrency):
+    work = [images[i % len(images)][1] for i in range(requests)]
+    latencies = []
+
+    def timed(image):
+        start = time.perf_counter()
+        engine.image_to_string(image, lang="eng", psm=6, whitelist=OCR_WHITELIST)
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(timed, work))
+    elapsed = time.perf_counter() - start
+    return requests / elapsed, statistics.median(latencies), max(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=48)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    args = parser.parse_args()
+
+    images = load_images()
+    print(f"{len(images)} sample images, {args.requests} requests per run, {args.workers} tesserocr workers")
+
+    engines = [PytesseractEngine()]
+    try:
+        engines.append(TesserocrEngine(workers=args.workers, whitelist=OCR_WHITELIST))
+    except ImportError:
+        print("tesserocr is not installed; only benchmarking pytesseract")
+
+    for engine in engines:
+        if isinstance(engine, TesserocrEngine):
+            # Start the workers and load language data before timing
+            engine.map([image for _, image in images[:args.workers]], whitelist=OCR_WHITELIST)
+        for concurrency in args.concurrency:
+            throughput, p50, worst = run(engine, images, args.requests, concurrency)
+            print(f"{engine.name:>12} c={concurrency:<3} {throughput:7.2f} img/s  p50 {p50:6.3f}s  max {worst:6.3f}s")
+        engine.shutdown()
+
+
+if __name__ == "__main__":
+    main()
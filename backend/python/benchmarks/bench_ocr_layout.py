@@ -0,0 +1,59 @@
+"""
+Full-page OCR vs. region-tiled layout OCR on the sample health reports.
+
+Usage:
+    python benchmarks/bench_ocr_layout.py
+
+For each report prints wall-clock time, number of output tokens and the
+share of garbage tokens (tokens that are neither words of 2+ letters nor
+numbers), which is what ends up in the LLM prompt.
+"""
+import glob
+import os
+import re
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+import ocr
+
+REPORT_DIR = os.path.join(BACKEND_DIR, "..", "..", "Sample input files", "health report")
+CLEAN_TOKEN = re.compile(r"^(?:[A-Za-z]{2,}|\d+(?:[.,/]\d+)*%?)$")
+
+
+def token_stats(text):
+    tokens = [token for token in re.split(r"[\s|]+", text) if token]
+    garbage = sum(1 for token in tokens if not CLEAN_TOKEN.match(token))
+    return len(tokens), garbage / len(tokens) if tokens else 0.0
+
+
+def timed_ocr(image_bytes, layout):
+    # Clear the cache so every run really OCRs the page
+    ocr.ocr_cache = ocr.OCRCache()
+    start = time.perf_counter()
+    text = ocr.extract_text_from_enhanced_image(image_bytes, layout=layout)
+    return time.perf_counter() - start, text
+
+
+def main():
+    paths = sorted(glob.glob(os.path.join(REPORT_DIR, "*")))
+    print(f"engine={ocr.ocr_engine.name}")
+    print(f"{'report':<28} {'mode':<7} {'time':>7} {'tokens':>7} {'garbage':>8}")
+    totals = {"page": 0.0, "layout": 0.0}
+    for path in paths:
+        with open(path, "rb") as image_file:
+            image_bytes = image_file.read()
+        for layout in (False, True):
+            mode = "layout" if layout else "page"
+            elapsed, text = timed_ocr(image_bytes, layout)
+            tokens, garbage = token_stats(text)
+            totals[mode] += elapsed
+            print(f"{os.path.basename(path)[:28]:<28} {mode:<7} {elapsed:6.2f}s {tokens:>7} {garbage:>7.1%}")
+    print(f"total: page {totals['page']:.2f}s, layout {totals['layout']:.2f}s")
+    ocr.ocr_engine.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Batch sentiment throughput: in-process scoring vs. the worker-process fan-out.
+
+Usage:
+    python benchmarks/bench_sentiment_batch.py --texts 50000 --processes 4
+
+Scores the same synthetic batch of short review-style texts in-process and
+through SentimentFanout, checks that both produce identical results in the
+same order, and prints texts per second for each. The first fan-out pass
+(which spawns the workers and loads the VADER lexicon in each) is reported
+separately from the warm pass.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from sentiment_engine import SentimentFanout
+
+PHRASES = [
+    "I love how quickly the results came back", "the staff were not very helpful",
+    "honestly it was fine", "this is the worst app I have used :(", "pretty good, but slow",
+    "I'm scared about the test results", "great advice, thanks!!", "nothing special",
+    "the diet plan is not bad at all", "I feel really anxious today",
+]
+
+
+def synthetic_texts(count, seed=0):
+    rng = random.Random(seed)
+    return [" ".join(rng.sample(PHRASES, rng.randint(1, 3))) for _ in range(count)]
+
+
+def timed(fanout, texts, drivers):
+    start = time.perf_counter()
+    results = list(fanout.map(texts, drivers))
+    return results, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--texts", type=int, default=50000)
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--chunk-size", type=int, default=256)
+    parser.add_argument("--drivers", action="store_true", help="Also extract the phrases driving each score")
+    args = parser.parse_args()
+
+    texts = synthetic_texts(args.texts)
+    inline = SentimentFanout(processes=0)
+    fanout = SentimentFanout(processes=args.processes, chunk_size=args.chunk_size, parallel_min=0)
+
+    expected, inline_time = timed(inline, texts, args.drivers)
+    _, cold_time = timed(fanout, texts, args.drivers)
+    results, warm_time = timed(fanout, texts, args.drivers)
+    fanout.shutdown()
+
+    print(f"{'mode':<24} {'seconds':>8} {'texts/s':>10}")
+    print(f"{'in-process':<24} {inline_time:>8.3f} {len(texts) / inline_time:>10.0f}")
+    print(f"{f'{args.processes} processes (cold)':<24} {cold_time:>8.3f} {len(texts) / cold_time:>10.0f}")
+    print(f"{f'{args.processes} processes (warm)':<24} {warm_time:>8.3f} {len(texts) / warm_time:>10.0f}")
+    print(f"results identical and in order: {results == expected}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,374 @@
+"""
+Latency and throughput of the OCR, ASR, sentiment and chat paths, replayed
+from "Sample input files/", with an optional baseline comparison for CI.
+
+Usage:
+    python benchmarks/bench_suite.py --output results.json
+    python benchmarks/bench_suite.py --scenarios chat,sentiment --modes http --concurrency 1 8
+    python benchmarks/bench_suite.py --output new.json --baseline results.json --max-regression 20
+
+Every scenario runs in two modes:
+    library - the module functions the endpoints call, on a thread pool
+    http    - requests through the FastAPI app in-process (httpx ASGITransport,
+              lifespan included, no network)
+
+The LLM is the stub backend (LLM_BACKEND=stub unless already set): a fixed
+answer with a simulated per-token cost, so runs are offline and repeatable.
+Response, OCR and explanation caches are off unless --caches is given, so
+repeated inputs are really recomputed. --warmup requests per scenario are
+excluded from the statistics.
+
+For each scenario, mode and concurrency level the report has p50/p95/p99 and
+mean latency (ms), throughput (requests/s), errors, the peak RSS of this
+driver process and the RSS of its worker processes. With --baseline, p95
+latency or throughput worse than the baseline by more than --max-regression
+percent, or any new errors, is listed and the exit status is 1. Latency changes below --min-delta-ms are ignored, so
+sub-millisecond paths do not fail on timer noise.
+"""
+import argparse
+import asyncio
+import glob
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+SAMPLE_DIR = os.path.join(BACKEND_DIR, "..", "..", "Sample input files")
+SCENARIOS = ("ocr", "health-ocr", "asr", "sentiment", "chat")
+MESSAGES = [
+    "I have been feeling tired after lunch every day, what could help?",
+    "Is it safe to exercise with mild knee pain?",
+    "What does a fasting glucose of 110 mg/dL mean?",
+    "I'm really worried about my blood pressure readings this week.",
+    "Can you suggest a high-protein vegetarian breakfast?",
+]
+
+
+def configure(caches):
+    """Environment for an offline, uncached run; must happen before the backend modules are imported."""
+    os.environ.setdefault("LLM_BACKEND", "stub")
+    os.environ.setdefault("NGROK_ENABLED", "0")
+    os.environ.setdefault("STARTUP_MODE", "lazy")
+    if not caches:
+        os.environ["RESPONSE_CACHE"] = "0"
+        os.environ["OCR_CACHE_MAX_MB"] = "0"
+        os.environ["SENTIMENT_GENERATIVE_CACHE_SIZE"] = "0"
+
+
+def sample_files(folder, extensions):
+    paths = sorted(
+        path for path in glob.glob(os.path.join(SAMPLE_DIR, folder, "**", "*"), recursive=True)
+        if path.lower().endswith(extensions)
+    )
+    files = []
+    for path in paths:
+        with open(path, "rb") as sample:
+            files.append((os.path.basename(path), sample.read()))
+    return files
+
+
+class Scenario:
+    """One path to benchmark: a library call and an equivalent HTTP request for input i."""
+
+    def __init__(self, name, library, http):
+        self.name = name
+        self.library = library
+        self.http = http
+
+
+def build_scenarios():
+    """Scenarios keyed by name; imports the backend modules lazily so --help stays fast."""
+    images = sample_files("ingredent images", (".png", ".jpg", ".jpeg", ".webp"))
+    reports = sample_files("health report", (".png", ".jpg", ".jpeg", ".webp"))
+    audio = sample_files("Example audio", (".wav", ".m4a", ".mp3", ".flac", ".ogg"))
+    form = {"age": "42", "gender": "female", "description": "Benchmark request"}
+
+    def ocr_library(i):
+        from ocr import extract_text_from_enhanced_image
+        return extract_text_from_enhanced_image(images[i % len(images)][1])
+
+    def health_ocr_library(i):
+        from ocr import extract_text_from_enhanced_image
+        return extract_text_from_enhanced_image(
+            reports[i % len(reports)][1], near_duplicates=False, layout=True, report=True
+        )
+
+    def asr_library(i):
+        from audio_ingest import load_audio
+        from transcription import transcription_engine
+        from uploads import detect_audio_format
+        data = audio[i % len(audio)][1]
+        return transcription_engine.transcribe(load_audio(data, detect_audio_format(data[:16])))
+
+    def sentiment_library(i):
+        from sentiment_engine import analyze
+        return analyze(MESSAGES[i % len(MESSAGES)])
+
+    def chat_library(i):
+        from llm_model import ChatHistory, get_llm_response, is_error_response
+        response = get_llm_response(MESSAGES[i % len(MESSAGES)], ChatHistory(), session_id=f"bench-{i}")
+        if is_error_response(response):
+            raise RuntimeError(response)
+        return response
+
+    def upload(files, i):
+        name, data = files[i % len(files)]
+        return {"files": {"file": (name, data)}}
+
+    return {
+        "ocr": Scenario("ocr", ocr_library, lambda i: ("POST", "/ocr", {**upload(images, i), "data": form})),
+        "health-ocr": Scenario(
+            "health-ocr", health_ocr_library, lambda i: ("POST", "/health-ocr", {**upload(reports, i), "data": form})
+        ),
+        "asr": Scenario("asr", asr_library, lambda i: ("POST", "/process-audio", upload(audio, i))),
+        "sentiment": Scenario(
+            "sentiment", sentiment_library,
+            lambda i: ("POST", "/text-sentiment", {"json": {"message": MESSAGES[i % len(MESSAGES)]}})
+        ),
+        "chat": Scenario(
+            "chat", chat_library,
+            lambda i: ("POST", "/llm-chat", {"json": {"message": MESSAGES[i % len(MESSAGES)], "session_id": f"bench-session-{i:06d}"}})
+        ),
+    }
+
+
+def summarise(latencies, errors, seconds):
+    """Percentiles in milliseconds, throughput and memory for one run."""
+    from model_registry import children_rss_bytes, peak_rss_bytes
+
+    latencies_ms = sorted(latency * 1000 for latency in latencies)
+    if len(latencies_ms) >= 2:
+        cuts = statistics.quantiles(latencies_ms, n=100, method="inclusive")
+        p50, p95, p99 = cuts[49], cuts[94], cuts[98]
+    else:
+        p50 = p95 = p99 = latencies_ms[0] if latencies_ms else None
+    return {
+        "requests": len(latencies) + errors,
+        "errors": errors,
+        "p50_ms": round(p50, 2) if p50 is not None else None,
+        "p95_ms": round(p95, 2) if p95 is not None else None,
+        "p99_ms": round(p99, 2) if p99 is not None else None,
+        "mean_ms": round(statistics.fmean(latencies_ms), 2) if latencies_ms else None,
+        "throughput_rps": round(len(latencies) / seconds, 3) if seconds else None,
+        "driver_peak_rss_mb": round(peak_rss_bytes() / (1024 * 1024), 1),
+        "children_rss_mb": round(children_rss_bytes() / (1024 * 1024), 1),
+    }
+
+
+def run_library(scenario, requests, concurrency, warmup):
+    for i in range(warmup):
+        scenario.library(i)
+
+    def timed(i):
+        started = time.perf_counter()
+        try:
+            scenario.library(i)
+        except Exception as e:
+            return None, f"{type(e).__name__}: {e}"
+        return time.perf_counter() - started, None
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        outcomes = list(executor.map(timed, range(requests)))
+    return outcomes, time.perf_counter() - started
+
+
+async def run_http(scenario, requests, concurrency, warmup, client):
+    async def send(i):
+        method, path, kwargs = scenario.http(i)
+        response = await client.request(method, path, **kwargs)
+        if response.status_code >= 400:
+            raise RuntimeError(f"HTTP {response.status_code}: {response.text[:200]}")
+
+    for i in range(warmup):
+        await send(i)
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def timed(i):
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                await send(i)
+            except Exception as e:
+                return None, f"{type(e).__name__}: {e}"
+            return time.perf_counter() - started, None
+
+    started = time.perf_counter()
+    outcomes = await asyncio.gather(*(timed(i) for i in range(requests)))
+    return outcomes, time.perf_counter() - started
+
+
+def record(results, key, outcomes, seconds):
+    latencies = [latency for latency, error in outcomes if error is None]
+    errors = [error for _, error in outcomes if error is not None]
+    results[key] = summarise(latencies, len(errors), seconds)
+    if errors:
+        results[key]["first_error"] = errors[0]
+    stats = results[key]
+    print(f"{key:<28} p50 {stats['p50_ms'] or 0:>9.1f}  p95 {stats['p95_ms'] or 0:>9.1f}  "
+          f"p99 {stats['p99_ms'] or 0:>9.1f} ms  {stats['throughput_rps'] or 0:>8.2f} req/s  "
+          f"errors {stats['errors']}", flush=True)
+
+
+def run_library_mode(scenarios, args, results):
+    for scenario in scenarios:
+        for concurrency in args.concurrency:
+            key = f"library/{scenario.name}@{concurrency}"
+            try:
+                outcomes, seconds = run_library(scenario, args.requests, concurrency, args.warmup)
+            except Exception as e:
+                results[key] = {"error": f"{type(e).__name__}: {e}"}
+                print(f"{key:<28} skipped: {results[key]['error']}", flush=True)
+                continue
+            record(results, key, outcomes, seconds)
+
+
+async def run_http_mode(scenarios, args, results):
+    try:
+        import httpx
+    except ImportError:
+        print("http mode needs httpx (pip install httpx); skipping", flush=True)
+        return
+    from app import app
+
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=600) as client:
+            for scenario in scenarios:
+                for concurrency in args.concurrency:
+                    key = f"http/{scenario.name}@{concurrency}"
+                    try:
+                        outcomes, seconds = await run_http(scenario, args.requests, concurrency, args.warmup, client)
+                    except Exception as e:
+                        results[key] = {"error": f"{type(e).__name__}: {e}"}
+                        print(f"{key:<28} skipped: {results[key]['error']}", flush=True)
+                        continue
+                    record(results, key, outcomes, seconds)
+
+
+def compare(results, baseline, max_regression, min_delta_ms=0.0, expected=None):
+    """
+    List regressions against a baseline report.
+
+    Args:
+        results (dict): This run's results
+        baseline (dict): A report written by --output
+        max_regression (float): Allowed p95/throughput regression, percent
+        min_delta_ms (float): Ignore changes whose p95 (or mean, for throughput) moved less than this
+        expected (set[str]): Result keys this run was asked for; baseline keys outside it
+            are not compared (None: every baseline key is expected)
+
+    Returns:
+        list[str]: One line per scenario whose p95 or throughput is more than
+            max_regression percent worse, that gained errors, or that the
+            baseline has but this run did not produce
+    """
+    tolerance = max_regression / 100
+    regressions = []
+    for key, old in baseline["results"].items():
+        if expected is not None and key not in expected:
+            continue
+        new = results.get(key)
+        if new is None:
+            regressions.append(f"{key}: missing from this run")
+            continue
+        if "error" in old:
+            continue
+        if "error" in new:
+            regressions.append(f"{key}: failed ({new['error']})")
+            continue
+        if new["errors"] > old["errors"]:
+            regressions.append(f"{key}: errors {old['errors']} -> {new['errors']}")
+        if old["p95_ms"] and new["p95_ms"] and new["p95_ms"] > old["p95_ms"] * (1 + tolerance) \
+                and new["p95_ms"] - old["p95_ms"] >= min_delta_ms:
+            regressions.append(f"{key}: p95 {old['p95_ms']} -> {new['p95_ms']} ms")
+        if old["throughput_rps"] and new["throughput_rps"] is not None \
+                and new["throughput_rps"] < old["throughput_rps"] * (1 - tolerance) \
+                and (new["mean_ms"] or 0) - (old["mean_ms"] or 0) >= min_delta_ms:
+            regressions.append(f"{key}: throughput {old['throughput_rps']} -> {new['throughput_rps']} req/s")
+    return regressions
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Comma-separated subset of " + ", ".join(SCENARIOS))
+    parser.add_argument("--modes", default="library,http", help="library, http or both")
+    parser.add_argument("--requests", type=int, default=20, help="Measured requests per scenario and concurrency")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--warmup", type=int, default=1, help="Unmeasured requests first (model loads, pools)")
+    parser.add_argument("--caches", action="store_true", help="Leave response, OCR and explanation caches on")
+    parser.add_argument("--output", help="Write the report as JSON")
+    parser.add_argument("--baseline", help="Report to compare against")
+    parser.add_argument("--max-regression", type=float, default=20.0, help="Allowed p95/throughput regression, percent")
+    parser.add_argument("--min-delta-ms", type=float, default=2.0, help="Ignore latency changes smaller than this")
+    args = parser.parse_args()
+
+    configure(args.caches)
+    names = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = set(names) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    available = build_scenarios()
+    scenarios = [available[name] for name in names]
+    modes = args.modes.split(",")
+
+    results = {}
+    if "library" in modes:
+        run_library_mode(scenarios, args, results)
+    if "http" in modes:
+        asyncio.run(run_http_mode(scenarios, args, results))
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "llm_backend": os.environ["LLM_BACKEND"],
+            "requests": args.requests,
+            "warmup": args.warmup,
+            "caches": args.caches,
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+        print(f"Wrote {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        expected = {
+            f"{mode}/{scenario.name}@{concurrency}"
+            for mode in modes for scenario in scenarios for concurrency in args.concurrency
+        }
+        regressions = compare(results, baseline, args.max_regression, args.min_delta_ms, expected)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) beyond {args.max_regression}%:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"\nNo regressions beyond {args.max_regression}% against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
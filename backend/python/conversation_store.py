@@ -0,0 +1,232 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from llm_model import ChatHistory
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Idle time after which a session is forgotten, in seconds
+SESSION_TTL_SECONDS = float(os.environ.get("SESSION_TTL_SECONDS", "1800"))
+# Maximum number of sessions kept in memory
+SESSION_MAX = int(os.environ.get("SESSION_MAX", "1000"))
+# Hard cap on the estimated memory used by in-memory sessions, in MB
+SESSION_MAX_MB = float(os.environ.get("SESSION_MAX_MB", "64"))
+# Optional SQLite file so sessions survive restarts and are shared by API workers (empty = memory only)
+SESSION_DB = os.environ.get("SESSION_DB", "")
+
+# Rough per-session overhead of the entry, history object and dict slot
+_SESSION_OVERHEAD_BYTES = 512
+
+
+def _estimate_bytes(history):
+    return _SESSION_OVERHEAD_BYTES + sum(len(user) + len(ai) for user, ai in history.messages)
+
+
+class _Session:
+    __slots__ = ("history", "last_access", "size", "saved_at")
+
+    def __init__(self, history, last_access, saved_at=0.0):
+        self.history = history
+        self.last_access = last_access
+        self.size = _estimate_bytes(history)
+        # updated_at of the stored copy this history matches
+        self.saved_at = saved_at
+
+
+class SQLiteSessionBackend:
+    """Stores serialised chat histories in a single SQLite table."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "session_id TEXT PRIMARY KEY, "
+            "window_size INTEGER NOT NULL, "
+            "messages TEXT NOT NULL, "
+            "updated_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def load(self, session_id, ttl_seconds):
+        """Return (history, updated_at), or None if the session is absent or expired."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT window_size, messages, updated_at FROM sessions WHERE session_id = ?",
+                (session_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        window_size, messages, updated_at = row
+        if ttl_seconds and time.time() - updated_at > ttl_seconds:
+            self.delete(session_id)
+            return None
+        return ChatHistory.from_messages(json.loads(messages), window_size=window_size), updated_at
+
+    def updated_at(self, session_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT updated_at FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def save(self, session_id, history):
+        """Store the history and return its updated_at."""
+        updated_at = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sessions (session_id, window_size, messages, updated_at) "
+                "VALUES (?, ?, ?, ?)",
+                (session_id, history.window_size, json.dumps(history.messages), updated_at),
+            )
+            self._conn.commit()
+        return updated_at
+
+    def delete(self, session_id):
+        with self._lock:
+            self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+            self._conn.commit()
+
+    def purge_expired(self, ttl_seconds):
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM sessions WHERE updated_at < ?", (time.time() - ttl_seconds,)
+            )
+            self._conn.commit()
+            return cursor.rowcount
+
+
+class ConversationStore:
+    """
+    Session-keyed chat histories with idle-TTL and LRU eviction.
+
+    Sessions idle for longer than ttl_seconds are dropped. When the number of
+    in-memory sessions or their estimated size exceeds the caps, the least
+    recently used ones are evicted from memory; with a SQLite backend they are
+    reloaded on next access instead of being lost. Several processes (API
+    workers) may share one SQLite file: a session another process saved more
+    recently than the in-memory copy is reloaded.
+    """
+
+    def __init__(self, ttl_seconds=SESSION_TTL_SECONDS, max_sessions=SESSION_MAX,
+                 max_bytes=int(SESSION_MAX_MB * 1024 * 1024), backend=None, window_size=5):
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.backend = backend
+        self.window_size = window_size
+        self._sessions = OrderedDict()  # LRU order: oldest first
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.evicted = 0
+        self.expired = 0
+        if self.backend and self.ttl_seconds:
+            purged = self.backend.purge_expired(self.ttl_seconds)
+            if purged:
+                logger.info(f"Purged {purged} expired session(s) from {self.backend.path}")
+
+    def get(self, session_id):
+        """Return the ChatHistory for a session, creating or reloading it if needed."""
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            cached = self._sessions.get(session_id)
+        if cached is not None and self._is_current(session_id, cached):
+            with self._lock:
+                cached.last_access = now
+                if session_id in self._sessions:
+                    self._sessions.move_to_end(session_id)
+            return cached.history
+
+        loaded = self.backend.load(session_id, self.ttl_seconds) if self.backend else None
+        history, saved_at = loaded if loaded is not None else (ChatHistory(window_size=self.window_size), 0.0)
+
+        with self._lock:
+            session = self._sessions.get(session_id)
+            # Another request may have loaded the same session meanwhile
+            if session is None or session is cached:
+                if session is not None:
+                    self._bytes -= session.size
+                session = _Session(history, now, saved_at)
+                self._sessions[session_id] = session
+                self._sessions.move_to_end(session_id)
+                self._bytes += session.size
+                self._evict()
+            return session.history
+
+    def _is_current(self, session_id, session):
+        """False when another process has saved the session since this copy was loaded or saved."""
+        if self.backend is None:
+            return True
+        updated_at = self.backend.updated_at(session_id)
+        return updated_at is None or updated_at <= session.saved_at
+
+    def save(self, session_id, history):
+        """Record that a session changed: refresh its size and persist it."""
+        saved_at = self.backend.save(session_id, history) if self.backend else 0.0
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None:
+                new_size = _estimate_bytes(history)
+                self._bytes += new_size - session.size
+                session.size = new_size
+                session.last_access = time.time()
+                session.saved_at = saved_at
+                self._sessions.move_to_end(session_id)
+                self._evict()
+
+    def delete(self, session_id):
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+            if session is not None:
+                self._bytes -= session.size
+        if self.backend:
+            self.backend.delete(session_id)
+
+    def _expire(self, now):
+        """Drop idle sessions. Caller must hold the lock."""
+        if not self.ttl_seconds:
+            return
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if now - session.last_access <= self.ttl_seconds:
+                break
+            self._sessions.popitem(last=False)
+            self._bytes -= session.size
+            self.expired += 1
+
+    def _evict(self):
+        """Evict LRU sessions until both caps hold. Caller must hold the lock."""
+        while self._sessions and (
+            len(self._sessions) > self.max_sessions or self._bytes > self.max_bytes
+        ):
+            # Sessions are persisted on every save(), so dropping them is safe
+            _, session = self._sessions.popitem(last=False)
+            self._bytes -= session.size
+            self.evicted += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "estimated_mb": round(self._bytes / (1024 * 1024), 3),
+                "max_sessions": self.max_sessions,
+                "max_mb": round(self.max_bytes / (1024 * 1024), 1),
+                "ttl_seconds": self.ttl_seconds,
+                "evicted": self.evicted,
+                "expired": self.expired,
+                "persistent": self.backend is not None,
+            }
+
+
+conversation_store = ConversationStore(
+    backend=SQLiteSessionBackend(SESSION_DB) if SESSION_DB else None
+)
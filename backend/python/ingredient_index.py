@@ -0,0 +1,287 @@
+import json
+import os
+import re
+from collections import deque
+from functools import lru_cache
+
+# Bundled ingredient / E-number dictionary
+INGREDIENT_DICT = os.environ.get(
+    "INGREDIENT_DICT", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "ingredients.json")
+)
+# Words shorter than this are never fuzzy-corrected (too many near neighbours)
+FUZZY_MIN_LENGTH = 4
+# Words at least this long may be corrected by up to two edits, shorter ones by one
+FUZZY_TWO_EDIT_LENGTH = 8
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+# "E 621" / "INS 621" written with a space; OCR confuses O/0 and I/l/1 in the number
+_E_NUMBER = re.compile(r"\b(e|ins)\s*(?=[0-9oil]*\d)([0-9oil]{3,4}[a-e]?)\b")
+_E_NUMBER_DIGITS = str.maketrans("oil", "011")
+# Punctuation that separates list items on a label; unmatched text is reported per item
+_SEPARATOR = re.compile(r"[,;:()\[\]{}/|*\n]+")
+
+
+class IngredientEntry:
+    """A dictionary ingredient and its precomputed facts."""
+
+    __slots__ = ("name", "category", "facts")
+
+    def __init__(self, name, category, facts):
+        self.name = name
+        self.category = category
+        self.facts = facts
+
+    def as_dict(self):
+        return {"name": self.name, "category": self.category, "facts": self.facts}
+
+    def __repr__(self):
+        return f"IngredientEntry({self.name}, {self.category})"
+
+
+def _canonical(text):
+    """Lower-cased text with E/INS numbers canonicalised."""
+    return _E_NUMBER.sub(
+        lambda m: (m.group(1) + (" " if m.group(1) == "ins" else "") + m.group(2).translate(_E_NUMBER_DIGITS)),
+        text.lower(),
+    )
+
+
+def normalize(text):
+    """Lower-case OCR text and split it into word tokens, canonicalising E/INS numbers."""
+    return _TOKEN.findall(_canonical(text))
+
+
+def damerau_levenshtein(a, b, max_distance):
+    """Optimal string alignment distance, or max_distance + 1 once it is exceeded."""
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    previous2, previous = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > max_distance:
+            return max_distance + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+def _deletes(word, distance):
+    """All strings reachable from word by deleting up to distance characters."""
+    results = {word}
+    frontier = {word}
+    for _ in range(distance):
+        frontier = {w[:i] + w[i + 1:] for w in frontier for i in range(len(w))}
+        results |= frontier
+    return results
+
+
+class SymSpell:
+    """
+    Symmetric-delete spelling correction over a fixed vocabulary.
+
+    Every vocabulary word is indexed under its deletions, so a lookup only
+    generates the query's own deletions and verifies the few candidates that
+    share one, instead of comparing against the whole vocabulary.
+    """
+
+    def __init__(self, words):
+        self.vocabulary = set(words)
+        self._deletes = {}
+        for word in self.vocabulary:
+            if len(word) < FUZZY_MIN_LENGTH:
+                continue
+            for deleted in _deletes(word, self._max_distance(word)):
+                self._deletes.setdefault(deleted, []).append(word)
+        self.correct = lru_cache(maxsize=16384)(self._correct)
+
+    @staticmethod
+    def _max_distance(word):
+        return 2 if len(word) >= FUZZY_TWO_EDIT_LENGTH else 1
+
+    def _correct(self, word):
+        """Closest vocabulary word, or the word itself when nothing is close enough."""
+        if word in self.vocabulary or len(word) < FUZZY_MIN_LENGTH or word.isdigit():
+            return word
+        max_distance = self._max_distance(word)
+        best, best_distance = word, max_distance + 1
+        seen = set()
+        for deleted in _deletes(word, max_distance):
+            for candidate in self._deletes.get(deleted, ()):
+                if candidate in seen:
+                    continue
+                seen.add(candidate)
+                distance = damerau_levenshtein(word, candidate, min(max_distance, self._max_distance(candidate)))
+                # Ties go to the alphabetically first word so results are deterministic
+                if distance < best_distance or (distance == best_distance and candidate < best):
+                    best, best_distance = candidate, distance
+        return best
+
+
+class AhoCorasick:
+    """
+    Multi-pattern matcher over word tokens.
+
+    Patterns are token tuples; matching visits each input token once and
+    reports every dictionary phrase ending at it via failure/output links.
+    """
+
+    def __init__(self):
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]  # state -> [(pattern length, value)]
+
+    def add(self, tokens, value):
+        state = 0
+        for token in tokens:
+            next_state = self._goto[state].get(token)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][token] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = next_state
+        self._output[state].append((len(tokens), value))
+
+    def build(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for token, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and token not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[next_state] = self._goto[fallback].get(token, 0)
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+    def longest_matches(self, tokens):
+        """
+        Leftmost-longest, non-overlapping matches.
+
+        Returns:
+            list[tuple[int, int, object]]: (start, length, value) in input order
+        """
+        longest = {}  # start -> (length, value)
+        state = 0
+        for end, token in enumerate(tokens):
+            while state and token not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(token, 0)
+            for length, value in self._output[state]:
+                start = end - length + 1
+                if length > longest.get(start, (0, None))[0]:
+                    longest[start] = (length, value)
+
+        matches = []
+        position = 0
+        for start in sorted(longest):
+            if start < position:
+                continue
+            length, value = longest[start]
+            matches.append((start, length, value))
+            position = start + length
+        return matches
+
+
+class IngredientIndex:
+    """
+    Finds dictionary ingredients in noisy label OCR text.
+
+    Tokens are fuzzy-corrected against the dictionary's vocabulary with
+    SymSpell, then an Aho-Corasick automaton over alias phrases picks out
+    ingredients in a single pass.
+    """
+
+    def __init__(self, entries, label_words=(), version=None):
+        self.version = version
+        self.entries = entries
+        self.label_words = frozenset(label_words)
+        self._matcher = AhoCorasick()
+        # Common label words are known-correct, so they are never "corrected"
+        # into an ingredient (e.g. "raising" into "raisins")
+        vocabulary = set(label_words)
+        for entry, aliases in entries:
+            for alias in aliases:
+                tokens = normalize(alias)
+                vocabulary.update(tokens)
+                self._matcher.add(tokens, entry)
+        self._matcher.build()
+        self._speller = SymSpell(vocabulary)
+
+    @classmethod
+    def load(cls, path=INGREDIENT_DICT):
+        with open(path, encoding="utf-8") as dict_file:
+            data = json.load(dict_file)
+        entries = [
+            (IngredientEntry(item["name"], item["category"], item["facts"]), item["aliases"])
+            for item in data["ingredients"]
+        ]
+        return cls(entries, data.get("label_words", ()), version=data.get("version"))
+
+    def extract(self, text):
+        """
+        Dictionary ingredients found in OCR text, and the label text they do not cover.
+
+        Label items the dictionary does not know (allergens such as fish or
+        lupin, E-numbers written without the E) are returned as they were
+        written, one phrase per comma-separated item, so nothing on the label
+        is lost; items made only of common label words ("contains") are dropped.
+
+        Args:
+            text (str): Raw or cleaned label text
+
+        Returns:
+            tuple[list[IngredientEntry], list[str]]: Matched dictionary entries,
+            deduplicated in order of first appearance, and the unmatched phrases
+        """
+        tokens, items = [], []
+        for item, part in enumerate(_SEPARATOR.split(_canonical(text))):
+            for token in _TOKEN.findall(part):
+                tokens.append(token)
+                items.append(item)
+
+        covered = [False] * len(tokens)
+        found = []
+        seen = set()
+        for start, length, entry in self._matcher.longest_matches([self._speller.correct(token) for token in tokens]):
+            covered[start:start + length] = [True] * length
+            if entry.name not in seen:
+                seen.add(entry.name)
+                found.append(entry)
+
+        unmatched = []
+        phrase = []
+        for i, token in enumerate(tokens):
+            if phrase and (covered[i] or items[i] != items[i - 1]):
+                self._add_phrase(unmatched, phrase)
+                phrase = []
+            if not covered[i]:
+                phrase.append(token)
+        self._add_phrase(unmatched, phrase)
+        return found, unmatched
+
+    def _add_phrase(self, phrases, tokens):
+        if not tokens or all(token in self.label_words for token in tokens):
+            return
+        phrase = " ".join(tokens)
+        if phrase not in phrases:
+            phrases.append(phrase)
+
+
+def format_ingredients(entries, unmatched=()):
+    """
+    One line per ingredient with its category and facts, for the LLM prompt,
+    followed by the label text that matched no dictionary entry.
+    """
+    lines = [f"- {entry.name} [{entry.category}]: {entry.facts}" for entry in entries]
+    if unmatched:
+        lines.append(f"Other label text (not in the ingredient dictionary): {', '.join(unmatched)}")
+    return "\n".join(lines)
+
+
+ingredient_index = IngredientIndex.load()
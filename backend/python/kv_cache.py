@@ -0,0 +1,172 @@
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Memory budget for cached past_key_values across all sessions, in MB
+KV_CACHE_MAX_MB = float(os.environ.get("KV_CACHE_MAX_MB", "2048"))
+# Maximum number of sessions holding a cached prefix
+KV_CACHE_MAX_SESSIONS = int(os.environ.get("KV_CACHE_MAX_SESSIONS", "32"))
+
+
+def cache_nbytes(past_key_values):
+    """Total size of the key/value tensors in a transformers cache."""
+    layers = past_key_values.to_legacy_cache() if hasattr(past_key_values, "to_legacy_cache") else past_key_values
+    # Newer transformers pad legacy layers with None for unused slots
+    return sum(
+        tensor.numel() * tensor.element_size() for layer in layers for tensor in layer if tensor is not None
+    )
+
+
+def common_prefix_length(a, b):
+    """Length of the shared prefix of two token id lists."""
+    limit = min(len(a), len(b))
+    for i in range(limit):
+        if a[i] != b[i]:
+            return i
+    return limit
+
+
+class _CacheEntry:
+    __slots__ = ("token_ids", "past_key_values", "nbytes")
+
+    def __init__(self, token_ids, past_key_values):
+        self.token_ids = token_ids
+        self.past_key_values = past_key_values
+        self.nbytes = cache_nbytes(past_key_values)
+
+
+class SessionKVCache:
+    """
+    Per-session store of the model's past_key_values for the processed prefix.
+
+    An entry is taken out while a turn is generating (so concurrent turns of
+    the same session never share a cache object) and put back afterwards.
+    Entries are evicted least-recently-used to respect the byte and session
+    budgets. How much of an entry the next prompt can use is the token prefix
+    they share (see generate_with_cache). While the history window is filling
+    that is the whole previous conversation; once the window is full, each
+    turn drops the oldest exchange, every token after the system prompt
+    changes, and only the system prompt is reused.
+    """
+
+    def __init__(self, max_bytes=int(KV_CACHE_MAX_MB * 1024 * 1024), max_sessions=KV_CACHE_MAX_SESSIONS):
+        self.max_bytes = max_bytes
+        self.max_sessions = max_sessions
+        self._entries = OrderedDict()  # LRU order: oldest first
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.reused_tokens = 0
+        self.prefilled_tokens = 0
+
+    def take(self, session_id):
+        """Remove and return the session's entry, or None if absent."""
+        with self._lock:
+            entry = self._entries.pop(session_id, None)
+            if entry is not None:
+                self._bytes -= entry.nbytes
+            return entry
+
+    def put(self, session_id, token_ids, past_key_values):
+        entry = _CacheEntry(token_ids, past_key_values)
+        with self._lock:
+            old = self._entries.pop(session_id, None)
+            if old is not None:
+                self._bytes -= old.nbytes
+            if entry.nbytes > self.max_bytes:
+                return
+            self._entries[session_id] = entry
+            self._bytes += entry.nbytes
+            while len(self._entries) > self.max_sessions or self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.nbytes
+                self.evictions += 1
+
+    def record(self, reused, prefilled):
+        with self._lock:
+            if reused:
+                self.hits += 1
+            else:
+                self.misses += 1
+            self.reused_tokens += reused
+            self.prefilled_tokens += prefilled
+
+    def stats(self):
+        with self._lock:
+            return {
+                "sessions": len(self._entries),
+                "cached_mb": round(self._bytes / (1024 * 1024), 1),
+                "max_mb": round(self.max_bytes / (1024 * 1024), 1),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "reused_tokens": self.reused_tokens,
+                "prefilled_tokens": self.prefilled_tokens,
+            }
+
+
+def generate_with_cache(model, tokenizer, kv_cache, session_id, prompt, streamer=None, **generate_kwargs):
+    """
+    Generate a completion, reusing the session's cached prefix where possible.
+
+    The prompt is tokenised in full and compared with the token ids behind the
+    cached past_key_values. The cache is cropped to the longest common prefix,
+    so only the new part of the conversation is prefilled. After generation the
+    updated cache is stored back for the next turn.
+
+    Args:
+        model: Causal LM
+        tokenizer: Matching tokenizer
+        kv_cache (SessionKVCache): Cache store
+        session_id (str): Conversation key
+        prompt (str): Full chat-formatted prompt
+        streamer: Optional transformers streamer
+
+    Returns:
+        str: Decoded completion
+    """
+    import torch
+    from transformers import DynamicCache
+
+    token_ids = tokenizer(prompt)["input_ids"]
+    entry = kv_cache.take(session_id)
+
+    past_key_values = None
+    reused = 0
+    if entry is not None:
+        # At least one token must be fed to the model to produce logits
+        reused = min(common_prefix_length(entry.token_ids, token_ids), len(token_ids) - 1)
+        if reused > 0:
+            past_key_values = entry.past_key_values
+            if not hasattr(past_key_values, "crop"):
+                past_key_values = DynamicCache.from_legacy_cache(past_key_values)
+            past_key_values.crop(reused)
+        else:
+            reused = 0
+    kv_cache.record(reused, len(token_ids) - reused)
+
+    input_ids = torch.tensor([token_ids], device=model.device)
+    with torch.inference_mode():
+        output = model.generate(
+            input_ids=input_ids,
+            attention_mask=torch.ones_like(input_ids),
+            past_key_values=past_key_values if past_key_values is not None else DynamicCache(),
+            streamer=streamer,
+            return_dict_in_generate=True,
+            pad_token_id=tokenizer.pad_token_id or tokenizer.eos_token_id,
+            **generate_kwargs,
+        )
+
+    sequence = output.sequences[0]
+    new_cache = output.past_key_values
+    # The final sampled token is never fed back, so the cache is one short
+    cached_length = new_cache.get_seq_length()
+    kv_cache.put(session_id, sequence[:cached_length].tolist(), new_cache)
+
+    return tokenizer.decode(sequence[len(token_ids):], skip_special_tokens=True)
@@ -0,0 +1,317 @@
+import re
+
+# ---------------------------------------------------------------------------
+# Reference-range index
+# ---------------------------------------------------------------------------
+
+# canonical name: (aliases, unit, low, high). Adult reference ranges used when
+# the report does not print its own; qualitative tests have no numeric range.
+REFERENCE_RANGES = {
+    "Hemoglobin": (("hemoglobin", "haemoglobin", "hb", "hgb"), "g/dL", 12.0, 17.5),
+    "RBC Count": (("rbc count", "rbc", "red blood cell count", "total rbc count"), "million/uL", 4.0, 6.0),
+    "WBC Count": (("wbc count", "wbc", "total wbc count", "total leucocyte count", "tlc", "white blood cell count"), "/uL", 4000, 11000),
+    "Platelet Count": (("platelet count", "platelets", "plt"), "/uL", 150000, 450000),
+    "Hematocrit": (("hematocrit", "haematocrit", "pcv", "hct", "packed cell volume"), "%", 36.0, 52.0),
+    "MCV": (("mcv", "mean corpuscular volume"), "fL", 80.0, 100.0),
+    "MCH": (("mch", "mean corpuscular hemoglobin"), "pg", 27.0, 33.0),
+    "MCHC": (("mchc",), "g/dL", 32.0, 36.0),
+    "RDW": (("rdw", "rdw-cv"), "%", 11.5, 14.5),
+    "Neutrophils": (("neutrophils", "polymorphs"), "%", 40.0, 75.0),
+    "Lymphocytes": (("lymphocytes",), "%", 20.0, 45.0),
+    "Monocytes": (("monocytes",), "%", 2.0, 10.0),
+    "Eosinophils": (("eosinophils",), "%", 1.0, 6.0),
+    "Basophils": (("basophils",), "%", 0.0, 1.0),
+    "ESR": (("esr", "erythrocyte sedimentation rate"), "mm/hr", 0.0, 20.0),
+    "Fasting Glucose": (("fasting blood sugar", "fbs", "fasting glucose", "glucose fasting", "blood sugar fasting", "fasting plasma glucose"), "mg/dL", 70.0, 100.0),
+    "Postprandial Glucose": (("postprandial blood sugar", "ppbs", "post prandial blood sugar", "glucose pp", "blood sugar pp"), "mg/dL", 70.0, 140.0),
+    "Random Glucose": (("random blood sugar", "rbs", "random glucose", "glucose random", "blood glucose", "glucose"), "mg/dL", 70.0, 140.0),
+    "HbA1c": (("hba1c", "glycated hemoglobin", "glycosylated hemoglobin", "a1c"), "%", 4.0, 5.6),
+    "Total Cholesterol": (("total cholesterol", "cholesterol total", "serum cholesterol", "cholesterol"), "mg/dL", 0.0, 200.0),
+    "HDL Cholesterol": (("hdl cholesterol", "hdl", "hdl-c"), "mg/dL", 40.0, 60.0),
+    "LDL Cholesterol": (("ldl cholesterol", "ldl", "ldl-c"), "mg/dL", 0.0, 100.0),
+    "VLDL Cholesterol": (("vldl cholesterol", "vldl"), "mg/dL", 2.0, 30.0),
+    "Triglycerides": (("triglycerides", "triglyceride", "tg"), "mg/dL", 0.0, 150.0),
+    "Creatinine": (("serum creatinine", "creatinine"), "mg/dL", 0.6, 1.3),
+    "Urea": (("blood urea", "urea", "serum urea"), "mg/dL", 15.0, 45.0),
+    "BUN": (("bun", "blood urea nitrogen"), "mg/dL", 7.0, 20.0),
+    "Uric Acid": (("uric acid", "serum uric acid"), "mg/dL", 3.5, 7.2),
+    "Total Bilirubin": (("total bilirubin", "bilirubin total", "serum bilirubin"), "mg/dL", 0.2, 1.2),
+    "Direct Bilirubin": (("direct bilirubin", "bilirubin direct", "conjugated bilirubin"), "mg/dL", 0.0, 0.3),
+    "SGOT (AST)": (("sgot", "ast", "aspartate aminotransferase"), "U/L", 5.0, 40.0),
+    "SGPT (ALT)": (("sgpt", "alt", "alanine aminotransferase"), "U/L", 7.0, 56.0),
+    "Alkaline Phosphatase": (("alkaline phosphatase", "alp"), "U/L", 44.0, 147.0),
+    "Total Protein": (("total protein", "serum protein"), "g/dL", 6.0, 8.3),
+    "Albumin": (("serum albumin", "albumin"), "g/dL", 3.5, 5.0),
+    "TSH": (("tsh", "thyroid stimulating hormone"), "uIU/mL", 0.4, 4.0),
+    "T3": (("total t3", "t3", "triiodothyronine"), "ng/dL", 80.0, 200.0),
+    "T4": (("total t4", "t4", "thyroxine"), "ug/dL", 5.0, 12.0),
+    "Sodium": (("sodium", "na"), "mmol/L", 135.0, 145.0),
+    "Potassium": (("potassium",), "mmol/L", 3.5, 5.1),
+    "Chloride": (("chloride", "cl"), "mmol/L", 98.0, 107.0),
+    "Calcium": (("serum calcium", "calcium"), "mg/dL", 8.5, 10.5),
+    "Vitamin D": (("vitamin d", "25-oh vitamin d", "25 oh vitamin d", "vit d"), "ng/mL", 30.0, 100.0),
+    "Vitamin B12": (("vitamin b12", "vit b12", "cyanocobalamin"), "pg/mL", 200.0, 900.0),
+    "Ferritin": (("ferritin", "serum ferritin"), "ng/mL", 20.0, 300.0),
+    # Urine routine examination
+    "Urine pH": (("ph", "reaction (ph)", "urine ph"), "", 4.5, 8.0),
+    "Specific Gravity": (("specific gravity", "sp gravity", "sp. gravity"), "", 1.005, 1.030),
+    "Urine Protein": (("urine protein", "protein", "urine albumin"), "", None, None),
+    "Urine Sugar": (("urine sugar", "sugar", "urine glucose"), "", None, None),
+    "Ketone Bodies": (("ketone bodies", "ketones", "acetone"), "", None, None),
+    "Urine Bilirubin": (("bile pigments", "bile salts", "urine bilirubin"), "", None, None),
+    "Pus Cells": (("pus cells", "pus cell", "leucocytes"), "/hpf", 0.0, 5.0),
+    "Epithelial Cells": (("epithelial cells", "epithelial cell"), "/hpf", 0.0, 5.0),
+    "Urine RBC": (("red blood cells", "rbcs", "urine rbc"), "/hpf", 0.0, 2.0),
+    "Casts": (("casts",), "", None, None),
+    "Crystals": (("crystals",), "", None, None),
+}
+
+# Values a result can physically take, in any unit reports commonly use for the
+# test (e.g. platelets in lakhs or per uL). A number outside them was read from
+# something else on the line - a phone number after "Ph:", a date - and is dropped.
+PLAUSIBLE_VALUES = {
+    "Hemoglobin": (1.0, 250.0),
+    "RBC Count": (0.1, 1e7),
+    "WBC Count": (0.1, 5e5),
+    "Platelet Count": (0.1, 2e6),
+    "Hematocrit": (5.0, 80.0),
+    "MCV": (40.0, 150.0),
+    "MCH": (10.0, 60.0),
+    "MCHC": (15.0, 50.0),
+    "RDW": (5.0, 40.0),
+    "Neutrophils": (0.0, 100.0),
+    "Lymphocytes": (0.0, 100.0),
+    "Monocytes": (0.0, 100.0),
+    "Eosinophils": (0.0, 100.0),
+    "Basophils": (0.0, 100.0),
+    "ESR": (0.0, 200.0),
+    "Fasting Glucose": (1.0, 2000.0),
+    "Postprandial Glucose": (1.0, 2000.0),
+    "Random Glucose": (1.0, 2000.0),
+    "HbA1c": (2.0, 25.0),
+    "Total Cholesterol": (0.1, 2000.0),
+    "HDL Cholesterol": (0.1, 300.0),
+    "LDL Cholesterol": (0.1, 1000.0),
+    "VLDL Cholesterol": (0.1, 1000.0),
+    "Triglycerides": (0.1, 20000.0),
+    "Creatinine": (0.05, 2000.0),
+    "Urea": (1.0, 500.0),
+    "BUN": (1.0, 250.0),
+    "Uric Acid": (0.1, 1000.0),
+    "Total Bilirubin": (0.0, 50.0),
+    "Direct Bilirubin": (0.0, 40.0),
+    "SGOT (AST)": (0.0, 20000.0),
+    "SGPT (ALT)": (0.0, 20000.0),
+    "Alkaline Phosphatase": (0.0, 5000.0),
+    "Total Protein": (1.0, 15.0),
+    "Albumin": (0.5, 7.0),
+    "TSH": (0.0, 1000.0),
+    "T3": (0.1, 1000.0),
+    "T4": (0.1, 300.0),
+    "Sodium": (80.0, 200.0),
+    "Potassium": (1.0, 12.0),
+    "Chloride": (50.0, 150.0),
+    "Calcium": (1.0, 20.0),
+    "Vitamin D": (1.0, 300.0),
+    "Vitamin B12": (10.0, 5000.0),
+    "Ferritin": (0.5, 1e5),
+    "Urine pH": (0.0, 14.0),
+    "Specific Gravity": (1.0, 1.1),
+    "Pus Cells": (0.0, 1000.0),
+    "Epithelial Cells": (0.0, 1000.0),
+    "Urine RBC": (0.0, 1000.0),
+}
+
+# Aliases this short ("ph", "na", "hb") also occur inside other text, so they
+# only count at the start of a line or table cell
+SHORT_ALIAS_LENGTH = 3
+
+# Results written as words rather than numbers (mainly urine routine)
+QUALITATIVE_RESULTS = (
+    "nil", "absent", "present", "trace", "negative", "positive", "normal", "abnormal",
+    "not detected", "detected", "occasional", "few", "plenty", "pale yellow", "yellow",
+    "straw", "clear", "turbid", "hazy", "slightly turbid", "+++", "++", "+",
+)
+
+# alias -> canonical name
+_ALIASES = {
+    alias: name
+    for name, (aliases, _, _, _) in REFERENCE_RANGES.items()
+    for alias in aliases
+}
+
+# ---------------------------------------------------------------------------
+# Precompiled patterns
+# ---------------------------------------------------------------------------
+
+# Longest aliases first so "hdl cholesterol" wins over "cholesterol"
+_TEST_NAME = re.compile(
+    r"(?<![a-z])(" + "|".join(
+        re.escape(alias) for alias in sorted(_ALIASES, key=len, reverse=True) if len(alias) > SHORT_ALIAS_LENGTH
+    ) + r")(?![a-z])",
+    re.IGNORECASE,
+)
+# Short aliases after the line or cell start and an optional bullet or row number
+_SHORT_TEST_NAME = re.compile(
+    r"(?:^|\|)\s*(?:[-*•]|\d{1,3}[.)])?\s*(" + "|".join(
+        re.escape(alias) for alias in sorted(_ALIASES, key=len, reverse=True) if len(alias) <= SHORT_ALIAS_LENGTH
+    ) + r")(?![a-z])",
+    re.IGNORECASE,
+)
+# Thousands ("10,500", "4,000") and Indian lakh ("2,50,000") grouping commas
+_GROUPED_NUMBER = r"\d{1,3}(?:,\d{2,3})*,\d{3}(?!\d)"
+# Otherwise a comma is a decimal comma ("4,5")
+_NUMBER = r"(?:" + _GROUPED_NUMBER + r"(?:\.\d+)?|\d+(?:[.,]\d+)?)"
+# A number not glued to other digits and not the start of a "low - high" range
+_VALUE = re.compile(
+    r"(?P<cmp>[<>])?\s*(?<![\d.,])(?P<value>" + _NUMBER + r")(?![\d.,])(?!\s*(?:-|–|to)\s*\d)"
+)
+_QUALITATIVE = re.compile(
+    r"(?<![a-z])(" + "|".join(re.escape(word) for word in QUALITATIVE_RESULTS) + r")(?![a-z])",
+    re.IGNORECASE,
+)
+_UNIT = re.compile(
+    r"\s*(?P<unit>%|(?:g|mg|ug|µg|ng|pg|mmol|umol|µmol|meq|iu|uiu|µiu|miu|u|fl|cells|million|lakhs|thou)"
+    r"(?:/(?:dl|l|ml|ul|µl|hpf|cumm|mm3|hr))?|/(?:hpf|cumm|ul|µl)|mm/hr|fl|pg)(?![a-z])",
+    re.IGNORECASE,
+)
+_RANGE = re.compile(r"(?P<low>" + _NUMBER + r")\s*(?:-|–|to)\s*(?P<high>" + _NUMBER + r")")
+_BOUND = re.compile(r"(?P<cmp><|>|less than|upto|up to|more than)\s*(?P<bound>" + _NUMBER + r")", re.IGNORECASE)
+# Rows from layout OCR separate table cells with " | "
+_CELL_SEPARATOR = re.compile(r"\s*\|\s*")
+
+
+_GROUPED = re.compile(_GROUPED_NUMBER + r"(?:\.\d+)?")
+
+
+def _number(text):
+    if _GROUPED.fullmatch(text):
+        return float(text.replace(",", ""))
+    return float(text.replace(",", "."))
+
+
+def _find_test(line):
+    """The earliest test name on the line, or None."""
+    matches = [match for match in (_TEST_NAME.search(line), _SHORT_TEST_NAME.search(line)) if match]
+    return min(matches, key=lambda match: match.start(1)) if matches else None
+
+
+class LabRow:
+    """One extracted result: test, value, unit, reference range and H/L/N flag."""
+
+    __slots__ = ("test", "value", "unit", "low", "high", "flag")
+
+    def __init__(self, test, value, unit, low, high, flag):
+        self.test = test
+        self.value = value
+        self.unit = unit
+        self.low = low
+        self.high = high
+        self.flag = flag
+
+    @property
+    def reference(self):
+        if self.low is None and self.high is None:
+            return ""
+        if self.low is None:
+            return f"<{self.high:g}"
+        if self.high is None:
+            return f">{self.low:g}"
+        return f"{self.low:g}-{self.high:g}"
+
+    def as_dict(self):
+        return {
+            "test": self.test,
+            "value": self.value,
+            "unit": self.unit,
+            "reference": self.reference,
+            "flag": self.flag,
+        }
+
+    def __repr__(self):
+        return f"LabRow({self.test}={self.value} {self.unit} [{self.reference}] {self.flag})"
+
+
+def _flag(value, low, high):
+    if low is not None and value < low:
+        return "L"
+    if high is not None and value > high:
+        return "H"
+    return "N" if low is not None or high is not None else ""
+
+
+def _parse_line(line):
+    """Extract a LabRow from one OCR line, or return None."""
+    name_match = _find_test(line)
+    if name_match is None:
+        return None
+    test = _ALIASES[name_match.group(1).lower()]
+    _, default_unit, default_low, default_high = REFERENCE_RANGES[test]
+    rest = _CELL_SEPARATOR.sub(" ", line[name_match.end():])
+
+    value_match = _VALUE.search(rest)
+    qualitative_match = _QUALITATIVE.search(rest)
+    # A word result that comes before any number is the result itself
+    if qualitative_match and (value_match is None or qualitative_match.start() < value_match.start()):
+        return LabRow(test, qualitative_match.group(1).lower(), "", None, None, "")
+    if value_match is None:
+        return None
+
+    value = _number(value_match.group("value"))
+    plausible = PLAUSIBLE_VALUES.get(test)
+    if plausible is not None and not plausible[0] <= value <= plausible[1]:
+        return None
+    after_value = rest[value_match.end():]
+
+    unit_match = _UNIT.match(after_value)
+    unit = unit_match.group("unit") if unit_match else default_unit
+    if unit_match:
+        after_value = after_value[unit_match.end():]
+
+    # Prefer the range printed on the report over the built-in one
+    low, high = default_low, default_high
+    range_match = _RANGE.search(after_value)
+    bound_match = _BOUND.search(after_value)
+    if range_match:
+        low, high = _number(range_match.group("low")), _number(range_match.group("high"))
+    elif bound_match:
+        bound = _number(bound_match.group("bound"))
+        if bound_match.group("cmp").lower() in ("<", "less than", "upto", "up to"):
+            low, high = None, bound
+        else:
+            low, high = bound, None
+
+    display_value = f"{value_match.group('cmp') or ''}{value:g}"
+    return LabRow(test, display_value, unit, low, high, _flag(value, low, high))
+
+
+def extract_lab_rows(text):
+    """
+    Turn report OCR text into structured lab rows.
+
+    Each line is matched against the reference-range index to find the test,
+    then against precompiled value, unit and range patterns. Repeated tests
+    keep their first occurrence.
+
+    Args:
+        text (str): OCR output, one report row per line
+
+    Returns:
+        list[LabRow]: Extracted results in report order
+    """
+    rows = []
+    seen = set()
+    for line in text.splitlines():
+        row = _parse_line(line)
+        if row is not None and row.test not in seen:
+            seen.add(row.test)
+            rows.append(row)
+    return rows
+
+
+def format_lab_table(rows):
+    """Compact pipe-separated table: one header plus one line per result."""
+    lines = ["Test|Value|Unit|Ref|Flag"]
+    for row in rows:
+        lines.append(f"{row.test}|{row.value}|{row.unit}|{row.reference}|{row.flag}")
+    return "\n".join(lines)
@@ -0,0 +1,582 @@
+import logging
+import os
+import queue
+import threading
+import time
+
+from batching import BatchingEngine
+from metrics import LLM_TOKENS, LLM_TOKENS_PER_SECOND, STAGE_SECONDS
+from model_registry import current_rss_bytes, peak_rss_bytes
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Inference backend: hf (fp16 on GPU, fp32 on CPU), bf16, int8, onnx, gguf, tiny or stub
+LLM_BACKEND = os.environ.get("LLM_BACKEND", "hf")
+# Exported ONNX model directory for the onnx backend (exported from LLM_MODEL on first load if unset)
+LLM_ONNX_PATH = os.environ.get("LLM_ONNX_PATH")
+# Quantized GGUF file for the gguf backend
+LLM_GGUF_PATH = os.environ.get("LLM_GGUF_PATH")
+# Context window of the gguf backend, in tokens
+LLM_GGUF_CONTEXT = int(os.environ.get("LLM_GGUF_CONTEXT", "4096"))
+# CPU threads used by the CPU backends (0 = library default)
+LLM_CPU_THREADS = int(os.environ.get("LLM_CPU_THREADS", "0"))
+# Load transformers weights only from memory-mapped safetensors files, never pickled .bin
+LLM_SAFETENSORS = os.environ.get("LLM_SAFETENSORS", "1") == "1"
+# Simulated cost of the stub backend: milliseconds per prompt token and per generated token
+LLM_STUB_PREFILL_MS = float(os.environ.get("LLM_STUB_PREFILL_MS", "0.05"))
+LLM_STUB_TOKEN_MS = float(os.environ.get("LLM_STUB_TOKEN_MS", "5"))
+
+
+class GenerationStats:
+    """Decode throughput of one backend."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.generations = 0
+        self.tokens = 0
+        self.seconds = 0.0
+        self.last_tokens_per_second = None
+
+    def record(self, tokens, seconds):
+        with self._lock:
+            self.generations += 1
+            self.tokens += tokens
+            self.seconds += seconds
+            if seconds > 0:
+                self.last_tokens_per_second = round(tokens / seconds, 2)
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                "generations": self.generations,
+                "generated_tokens": self.tokens,
+                "tokens_per_second": round(self.tokens / self.seconds, 2) if self.seconds else None,
+                "last_tokens_per_second": self.last_tokens_per_second,
+            }
+
+
+class LLMBackend:
+    """
+    A loaded chat model behind the interface llm_model uses.
+
+    Subclasses set tokenizer (anything with encode/decode and, ideally,
+    apply_chat_template) in load(), and implement generate() and stream().
+    supports_kv_reuse marks backends whose model can run generate_with_cache,
+    supports_speculative those that can verify a draft model's tokens.
+    """
+
+    name = None
+    supports_kv_reuse = False
+    supports_speculative = False
+
+    def __init__(self, model_name, generation_kwargs, batching=None, token_provider=None):
+        """
+        Args:
+            model_name (str): Hugging Face id or local directory of the model
+            generation_kwargs (dict): Default sampling settings
+            batching (tuple[int, float]): (max_batch_size, window_ms), or None to disable batching
+            token_provider (callable): Returns the Hugging Face token, called at load time
+        """
+        self.model_name = model_name
+        self.generation_kwargs = generation_kwargs
+        self.batching = batching
+        self.token_provider = token_provider
+        self.model = None
+        self.tokenizer = None
+        self.batcher = None
+        self.load_seconds = None
+        self.load_rss_bytes = None
+        self.generation_stats = GenerationStats()
+
+    def load(self):
+        raise NotImplementedError
+
+    def generate(self, prompt, **overrides):
+        """Complete a chat-formatted prompt; returns the new text."""
+        raise NotImplementedError
+
+    def make_streamer(self):
+        """An iterable that yields text chunks pushed by stream() until it is ended."""
+        raise NotImplementedError
+
+    def stream(self, prompt, streamer, **overrides):
+        """Generate into streamer (blocking; runs on a background worker)."""
+        raise NotImplementedError
+
+    def count_tokens(self, text):
+        return len(self.tokenizer.encode(text, add_special_tokens=False))
+
+    def record(self, text, seconds):
+        """Record one finished generation for the tokens/s statistics."""
+        tokens = self.count_tokens(text) if text else 0
+        self.generation_stats.record(tokens, seconds)
+        LLM_TOKENS.inc(tokens, direction="out")
+        if seconds > 0:
+            LLM_TOKENS_PER_SECOND.observe(tokens / seconds)
+
+    def stats(self):
+        """Tokens/s and memory, reported the same way by every backend."""
+        return {
+            "backend": self.name,
+            "model": self.model_name,
+            "load_seconds": self.load_seconds,
+            "load_rss_mb": round(self.load_rss_bytes / (1024 * 1024), 1) if self.load_rss_bytes else None,
+            "peak_rss_mb": round(peak_rss_bytes() / (1024 * 1024), 1),
+            **self.generation_stats.as_dict(),
+        }
+
+    def _timed_load(self):
+        rss_before = current_rss_bytes()
+        start = time.perf_counter()
+        self.load()
+        self.load_seconds = round(time.perf_counter() - start, 3)
+        self.load_rss_bytes = max(current_rss_bytes() - rss_before, 0)
+        logger.info(f"Loaded {self.name} backend for {self.model_name} in {self.load_seconds}s")
+        return self
+
+
+# ---------------------------------------------------------------------------
+# transformers backends
+# ---------------------------------------------------------------------------
+
+class HFBackend(LLMBackend):
+    """The transformers model as before: fp16 with device_map="auto" on GPU, fp32 on CPU."""
+
+    name = "hf"
+    supports_kv_reuse = True
+    supports_speculative = True
+    pipe = None
+
+    def _set_threads(self, torch):
+        if LLM_CPU_THREADS:
+            torch.set_num_threads(LLM_CPU_THREADS)
+
+    def _load_tokenizer(self):
+        from transformers import AutoTokenizer
+        return AutoTokenizer.from_pretrained(self.model_name, token=self._token(), trust_remote_code=True)
+
+    def _load_model(self, torch):
+        from transformers import AutoModelForCausalLM
+        cuda = torch.cuda.is_available()
+        return AutoModelForCausalLM.from_pretrained(
+            self.model_name,
+            token=self._token(),
+            torch_dtype=torch.float16 if cuda else torch.float32,
+            device_map="auto" if cuda else None,
+            trust_remote_code=True,
+            low_cpu_mem_usage=True,
+            use_safetensors=LLM_SAFETENSORS or None,
+        )
+
+    def _token(self):
+        return self.token_provider() if self.token_provider is not None else None
+
+    def load(self):
+        import torch
+        from transformers import pipeline
+
+        self._set_threads(torch)
+        try:
+            self.tokenizer = self._load_tokenizer()
+            self.model = self._load_model(torch)
+        except Exception as e:
+            logger.error(f"Error loading model: {str(e)}")
+            raise
+
+        # Create the text generation pipeline
+        try:
+            self.pipe = pipeline(
+                "text-generation",
+                model=self.model,
+                tokenizer=self.tokenizer,
+                return_full_text=False,
+                **self.generation_kwargs,
+            )
+        except Exception as e:
+            logger.error(f"Error creating pipeline: {str(e)}")
+            raise
+
+        if self.batching is not None:
+            max_batch_size, window_ms = self.batching
+            self.batcher = BatchingEngine(
+                self.model,
+                self.tokenizer,
+                max_batch_size=max_batch_size,
+                window_ms=window_ms,
+                **self.generation_kwargs,
+            )
+
+    def generate(self, prompt, **overrides):
+        if self.batcher is not None:
+            return self.batcher.generate(prompt, **overrides)
+        return self.pipe(prompt, **overrides)[0]['generated_text']
+
+    def make_streamer(self):
+        from transformers import TextIteratorStreamer
+        return TextIteratorStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True)
+
+    def stream(self, prompt, streamer, **overrides):
+        import torch
+        inputs = self.tokenizer(prompt, return_tensors="pt").to(self.model.device)
+        with torch.inference_mode():
+            self.model.generate(
+                **inputs,
+                streamer=streamer,
+                pad_token_id=self.tokenizer.pad_token_id or self.tokenizer.eos_token_id,
+                **{**self.generation_kwargs, **overrides},
+            )
+
+
+class BF16Backend(HFBackend):
+    """
+    bfloat16 weights on CPU: half the memory of fp32 (about 16 GB for 8B),
+    and faster matmuls on CPUs with AVX512-BF16/AMX.
+    """
+
+    name = "bf16"
+
+    def _load_model(self, torch):
+        from transformers import AutoModelForCausalLM
+        return AutoModelForCausalLM.from_pretrained(
+            self.model_name,
+            token=self._token(),
+            torch_dtype=torch.bfloat16,
+            trust_remote_code=True,
+            low_cpu_mem_usage=True,
+            use_safetensors=LLM_SAFETENSORS or None,
+        )
+
+
+class Int8Backend(BF16Backend):
+    """
+    Dynamically int8-quantized Linear layers on CPU (about 8 GB for 8B).
+
+    Weights are loaded in bf16 and each Linear is quantized on its own, so
+    the fp32 copy torch's quantizer needs exists for one layer at a time
+    instead of for the whole model. Embeddings and norms stay in fp32, since
+    quantized Linear takes and returns fp32 activations.
+    """
+
+    name = "int8"
+
+    def _load_model(self, torch):
+        from torch.ao.nn.quantized.dynamic import Linear as DynamicQuantizedLinear
+        from torch.ao.quantization import default_dynamic_qconfig
+
+        model = super()._load_model(torch)
+        linears = [
+            (parent, child_name, child)
+            for parent in model.modules()
+            for child_name, child in parent.named_children()
+            if isinstance(child, torch.nn.Linear)
+        ]
+        for parent, child_name, child in linears:
+            child = child.float()
+            child.qconfig = default_dynamic_qconfig
+            setattr(parent, child_name, DynamicQuantizedLinear.from_float(child))
+        logger.info(f"Quantized {len(linears)} Linear layers to int8")
+        return model.float().eval()
+
+
+class ONNXBackend(HFBackend):
+    """
+    ONNX Runtime on CPU through optimum, which keeps the transformers
+    generate()/streamer interface. The model is exported on first load unless
+    LLM_ONNX_PATH points at an existing export.
+    """
+
+    name = "onnx"
+    # generate_with_cache and assisted generation feed torch caches, which ORT sessions do not take
+    supports_kv_reuse = False
+    supports_speculative = False
+
+    def _load_tokenizer(self):
+        from transformers import AutoTokenizer
+        return AutoTokenizer.from_pretrained(LLM_ONNX_PATH or self.model_name, token=self._token())
+
+    def _load_model(self, torch):
+        from optimum.onnxruntime import ORTModelForCausalLM
+        import onnxruntime
+
+        options = onnxruntime.SessionOptions()
+        if LLM_CPU_THREADS:
+            options.intra_op_num_threads = LLM_CPU_THREADS
+        return ORTModelForCausalLM.from_pretrained(
+            LLM_ONNX_PATH or self.model_name,
+            export=LLM_ONNX_PATH is None,
+            token=self._token(),
+            provider="CPUExecutionProvider",
+            session_options=options,
+        )
+
+
+class TinyBackend(HFBackend):
+    """
+    A randomly initialised two-layer Llama with a byte-level tokenizer, built
+    in memory. Output is gibberish, but every code path (pipeline, batching,
+    KV reuse, streaming) runs in seconds with no download, for CI.
+    """
+
+    name = "tiny"
+
+    def load(self):
+        self.model_name = "tiny-random-llama"
+        super().load()
+
+    def _load_tokenizer(self):
+        from tokenizers import Tokenizer, decoders, models, pre_tokenizers
+        from transformers import PreTrainedTokenizerFast
+
+        specials = ["<|begin_of_text|>", "<|end_of_text|>", "<|pad|>"]
+        alphabet = sorted(pre_tokenizers.ByteLevel.alphabet())
+        vocab = {symbol: index for index, symbol in enumerate(alphabet + specials)}
+        tokenizer = Tokenizer(models.BPE(vocab=vocab, merges=[]))
+        tokenizer.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+        tokenizer.decoder = decoders.ByteLevel()
+        tokenizer.add_special_tokens(specials)
+        return PreTrainedTokenizerFast(
+            tokenizer_object=tokenizer, bos_token=specials[0], eos_token=specials[1], pad_token=specials[2]
+        )
+
+    def _load_model(self, torch):
+        from transformers import LlamaConfig, LlamaForCausalLM
+
+        torch.manual_seed(0)
+        config = LlamaConfig(
+            vocab_size=len(self.tokenizer),
+            hidden_size=64,
+            intermediate_size=128,
+            num_hidden_layers=2,
+            num_attention_heads=4,
+            num_key_value_heads=4,
+            max_position_embeddings=8192,
+            bos_token_id=self.tokenizer.bos_token_id,
+            eos_token_id=self.tokenizer.eos_token_id,
+            pad_token_id=self.tokenizer.pad_token_id,
+        )
+        return LlamaForCausalLM(config).eval()
+
+
+# ---------------------------------------------------------------------------
+# llama.cpp backend
+# ---------------------------------------------------------------------------
+
+class TextQueueStreamer:
+    """Minimal streamer for non-transformers backends: iterate to receive pushed text."""
+
+    def __init__(self):
+        self._queue = queue.Queue()
+
+    def put_text(self, text):
+        self._queue.put(text)
+
+    def end(self):
+        self._queue.put(None)
+
+    def __iter__(self):
+        while True:
+            text = self._queue.get()
+            if text is None:
+                return
+            yield text
+
+
+class LlamaCppTokenizer:
+    """The tokenizer interface llm_model needs, backed by llama.cpp and the GGUF's own chat template."""
+
+    def __init__(self, llama):
+        self.llama = llama
+        metadata = llama.metadata
+        self.chat_template = metadata.get("tokenizer.chat_template")
+        self.bos_token = self._token_text(llama.token_bos())
+        self.eos_token = self._token_text(llama.token_eos())
+        self._template = None
+        if self.chat_template:
+            from jinja2.sandbox import ImmutableSandboxedEnvironment
+            environment = ImmutableSandboxedEnvironment(trim_blocks=True, lstrip_blocks=True)
+            self._template = environment.from_string(self.chat_template)
+
+    def _token_text(self, token_id):
+        return self.llama.detokenize([token_id], special=True).decode("utf-8", errors="ignore")
+
+    def encode(self, text, add_special_tokens=True):
+        return self.llama.tokenize(text.encode("utf-8"), add_bos=add_special_tokens, special=False)
+
+    def decode(self, token_ids, skip_special_tokens=True):
+        return self.llama.detokenize(list(token_ids)).decode("utf-8", errors="ignore")
+
+    def apply_chat_template(self, messages, tokenize=False, add_generation_prompt=True):
+        prompt = self._template.render(
+            messages=messages, add_generation_prompt=add_generation_prompt,
+            bos_token=self.bos_token, eos_token=self.eos_token,
+        )
+        return self.encode(prompt, add_special_tokens=False) if tokenize else prompt
+
+
+class GGUFBackend(LLMBackend):
+    """
+    A quantized GGUF model (e.g. Q4_K_M, about 5 GB for 8B) on llama.cpp's
+    CPU kernels. Generation is serialised: llama.cpp keeps one context.
+    """
+
+    name = "gguf"
+
+    def load(self):
+        from llama_cpp import Llama
+
+        if not LLM_GGUF_PATH:
+            raise ValueError("LLM_BACKEND=gguf needs LLM_GGUF_PATH to point at a .gguf file")
+        self.model_name = LLM_GGUF_PATH
+        self.model = Llama(
+            model_path=LLM_GGUF_PATH,
+            n_ctx=LLM_GGUF_CONTEXT,
+            n_threads=LLM_CPU_THREADS or None,
+            verbose=False,
+        )
+        self.tokenizer = LlamaCppTokenizer(self.model)
+        self._lock = threading.Lock()
+
+    def _sampling(self, overrides):
+        settings = {**self.generation_kwargs, **overrides}
+        greedy = not settings.get("do_sample", True)
+        return {
+            "max_tokens": settings.get("max_new_tokens", 512),
+            "temperature": 0.0 if greedy else settings.get("temperature") or 0.7,
+            "top_p": 1.0 if greedy else settings.get("top_p") or 1.0,
+            "repeat_penalty": settings.get("repetition_penalty") or 1.0,
+        }
+
+    def generate(self, prompt, **overrides):
+        with self._lock:
+            output = self.model(prompt, **self._sampling(overrides))
+        return output["choices"][0]["text"]
+
+    def make_streamer(self):
+        return TextQueueStreamer()
+
+    def stream(self, prompt, streamer, **overrides):
+        try:
+            with self._lock:
+                for chunk in self.model(prompt, stream=True, **self._sampling(overrides)):
+                    streamer.put_text(chunk["choices"][0]["text"])
+        finally:
+            streamer.end()
+
+
+# ---------------------------------------------------------------------------
+# Stub backend
+# ---------------------------------------------------------------------------
+
+STUB_RESPONSE = (
+    "Based on the information provided, keep portions moderate, choose whole foods over processed ones, "
+    "stay hydrated and discuss any persistent symptoms or abnormal values with your doctor. "
+)
+
+
+class WordTokenizer:
+    """Whitespace tokenizer for the stub backend: each word is one token."""
+
+    chat_template = None
+    bos_token = None
+    eos_token = None
+
+    def encode(self, text, add_special_tokens=True):
+        return text.split()
+
+    def decode(self, token_ids, skip_special_tokens=True):
+        return " ".join(token_ids)
+
+
+class StubBackend(LLMBackend):
+    """
+    No model at all: returns a fixed answer after sleeping LLM_STUB_PREFILL_MS
+    per prompt token and LLM_STUB_TOKEN_MS per generated token. Generations
+    are serialised like a single loaded model's, so benchmarks of everything
+    around the LLM run offline with stable, realistic LLM latency.
+    """
+
+    name = "stub"
+
+    def load(self):
+        self.model_name = "stub"
+        self.tokenizer = WordTokenizer()
+        self._lock = threading.Lock()
+
+    def _words(self, overrides):
+        max_new_tokens = overrides.get("max_new_tokens", self.generation_kwargs.get("max_new_tokens", 64))
+        words = STUB_RESPONSE.split()
+        return [words[i % len(words)] for i in range(min(max_new_tokens, len(words)))]
+
+    def _decode(self, prompt, overrides):
+        with self._lock:
+            time.sleep(len(self.tokenizer.encode(prompt)) * LLM_STUB_PREFILL_MS / 1000)
+            for word in self._words(overrides):
+                time.sleep(LLM_STUB_TOKEN_MS / 1000)
+                yield word + " "
+
+    def generate(self, prompt, **overrides):
+        return "".join(self._decode(prompt, overrides))
+
+    def make_streamer(self):
+        return TextQueueStreamer()
+
+    def stream(self, prompt, streamer, **overrides):
+        try:
+            for chunk in self._decode(prompt, overrides):
+                streamer.put_text(chunk)
+        finally:
+            streamer.end()
+
+
+BACKENDS = {
+    backend.name: backend
+    for backend in (HFBackend, BF16Backend, Int8Backend, ONNXBackend, TinyBackend, GGUFBackend, StubBackend)
+}
+
+
+def create_backend(name, **kwargs):
+    """
+    Build and load the named backend.
+
+    Args:
+        name (str): One of BACKENDS
+        **kwargs: Passed to the backend's constructor
+
+    Returns:
+        LLMBackend: The loaded backend
+    """
+    try:
+        backend_class = BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Unknown LLM_BACKEND '{name}'; choose from {', '.join(BACKENDS)}") from None
+    return backend_class(**kwargs)._timed_load()
+
+
+def time_forward_passes(model):
+    """
+    Time every forward pass of a torch model into stage_duration_seconds.
+
+    A pass that feeds more than one position per sequence is the prefill (or a
+    speculative verification step) and is recorded as "llm_prefill"; single
+    positions are decode steps, recorded as "llm_decode_token" (time per output
+    token). Models without forward hooks (ONNX, llama.cpp) are left alone.
+    """
+    if not hasattr(model, "register_forward_pre_hook"):
+        return
+    local = threading.local()
+
+    def before(module, args, kwargs):
+        local.started = time.perf_counter()
+
+    def after(module, args, kwargs, output):
+        inputs = kwargs.get("input_ids")
+        if inputs is None:
+            inputs = kwargs.get("inputs_embeds", args[0] if args else None)
+        positions = inputs.shape[1] if inputs is not None and inputs.dim() > 1 else 1
+        STAGE_SECONDS.observe(
+            time.perf_counter() - local.started, stage="llm_prefill" if positions > 1 else "llm_decode_token"
+        )
+
+    model.register_forward_pre_hook(before, with_kwargs=True)
+    model.register_forward_hook(after, with_kwargs=True)
@@ -0,0 +1,196 @@
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from contextlib import closing
+
+from llm_backends import TextQueueStreamer
+from llm_model import ERROR_RESPONSE_PREFIX
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Unix socket of the model server (model_server.py). When set, API workers send
+# generations there instead of loading the LLM themselves.
+LLM_SERVER_SOCKET = os.environ.get("LLM_SERVER_SOCKET", "")
+DEFAULT_SERVER_SOCKET = "/tmp/llm-server.sock"
+# Seconds to wait for each reply from the model server (covers a whole non-streamed generation)
+LLM_SERVER_TIMEOUT = float(os.environ.get("LLM_SERVER_TIMEOUT", "300"))
+
+
+class ModelServerError(RuntimeError):
+    """The model server could not be reached or failed the request."""
+
+
+def _request(payload, path=None, timeout=LLM_SERVER_TIMEOUT):
+    """
+    Send one request to the model server and yield its replies.
+
+    Each request uses its own connection; the protocol is one JSON object per
+    line in each direction.
+
+    Args:
+        payload (dict): Request with an "op" key
+        path (str): Socket path (defaults to LLM_SERVER_SOCKET)
+        timeout (float): Seconds to wait for the connection and each reply
+
+    Yields:
+        dict: Reply messages, until the server closes the connection
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(path or LLM_SERVER_SOCKET)
+        sock.sendall(json.dumps(payload).encode("utf-8") + b"\n")
+        with sock.makefile("r", encoding="utf-8") as replies:
+            for line in replies:
+                reply = json.loads(line)
+                if "error" in reply:
+                    raise ModelServerError(reply["error"])
+                yield reply
+    finally:
+        sock.close()
+
+
+def _call(payload, **kwargs):
+    """Send a request that has exactly one reply and return it."""
+    with closing(_request(payload, **kwargs)) as replies:
+        for reply in replies:
+            return reply
+    raise ModelServerError(f"Model server closed the connection without replying to '{payload['op']}'")
+
+
+def _history(chat_history):
+    """Serialise a chat history as it is before the new message is added."""
+    return {
+        "messages": [list(pair) for pair in chat_history.messages],
+        "window_size": chat_history.window_size,
+    }
+
+
+def get_llm_response(message, chat_history, session_id=None, token_budget=None,
+                     deterministic=False, speculative=False):
+    """
+    llm_model.get_llm_response, generated by the model server.
+
+    The server rebuilds the history, adds the message and trims it exactly as
+    the in-process path does; the same steps are mirrored on chat_history here.
+    """
+    payload = {
+        "op": "generate",
+        "message": message,
+        "history": _history(chat_history),
+        "session_id": session_id,
+        "token_budget": token_budget,
+        "deterministic": deterministic,
+        "speculative": speculative,
+    }
+    chat_history.add_message(message)
+    try:
+        response = _call(payload)["response"]
+    except Exception as e:
+        logger.error(f"Error in get_llm_response (model server): {str(e)}")
+        response = f"{ERROR_RESPONSE_PREFIX}: {str(e)}"
+    chat_history.update_last_response(response)
+    return response
+
+
+def stream_llm_response(message, chat_history, launch=None, session_id=None,
+                        token_budget=None, speculative=False):
+    """
+    llm_model.stream_llm_response, generated by the model server.
+
+    Chunks are relayed from the socket by a background task (run through
+    launch, so the caller's pool still admits or rejects the stream). If
+    launch raises, chat_history is left as it was.
+
+    Returns:
+        Iterator[str]: Text chunks as the server decodes them
+    """
+    payload = {
+        "op": "stream",
+        "message": message,
+        "history": _history(chat_history),
+        "session_id": session_id,
+        "token_budget": token_budget,
+        "speculative": speculative,
+    }
+    snapshot = chat_history.snapshot()
+    chat_history.add_message(message)
+    streamer = TextQueueStreamer()
+    outcome = {}
+
+    def relay():
+        try:
+            with closing(_request(payload)) as replies:
+                for reply in replies:
+                    if "chunk" in reply:
+                        streamer.put_text(reply["chunk"])
+                    elif reply.get("done"):
+                        outcome["response"] = reply["response"]
+        except Exception as e:
+            outcome["error"] = e
+        finally:
+            streamer.end()
+
+    try:
+        if launch is None:
+            threading.Thread(target=relay, name="llm-stream-relay", daemon=True).start()
+        else:
+            launch(relay)
+    except Exception:
+        # Rejected before generating: leave no unanswered turn behind
+        chat_history.restore(snapshot)
+        raise
+
+    def iterate():
+        chunks = []
+        for chunk in streamer:
+            chunks.append(chunk)
+            yield chunk
+
+        if "error" in outcome:
+            logger.error(f"Error in stream_llm_response (model server): {str(outcome['error'])}")
+            error_message = f"{ERROR_RESPONSE_PREFIX}: {str(outcome['error'])}"
+            chat_history.update_last_response(error_message)
+            yield error_message
+            return
+
+        chat_history.update_last_response(outcome.get("response", "".join(chunks).strip()))
+
+    return iterate()
+
+
+def llm_stats():
+    """The model server's LLM statistics (llm_model.llm_stats), or the error if it is unreachable."""
+    try:
+        return {**_call({"op": "stats"}, timeout=5), "server": LLM_SERVER_SOCKET}
+    except Exception as e:
+        return {"server": LLM_SERVER_SOCKET, "error": str(e)}
+
+
+def metrics_snapshot():
+    """The model server's metric families (metrics.MetricsRegistry.snapshot), or [] if it is unreachable."""
+    try:
+        return _call({"op": "metrics"}, timeout=5)["families"]
+    except Exception as e:
+        logger.warning(f"Could not read model server metrics: {e}")
+        return []
+
+
+def wait_for_server(timeout=600, interval=0.5):
+    """
+    Block until the model server answers a ping. The server only binds its
+    socket once the model is loaded and warm, so this doubles as the "llm"
+    startup step of API workers.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return _call({"op": "ping"}, timeout=5)
+        except (OSError, ModelServerError) as e:
+            if time.monotonic() >= deadline:
+                raise ModelServerError(f"Model server at {LLM_SERVER_SOCKET} not ready after {timeout}s: {e}")
+            time.sleep(interval)
@@ -1,115 +1,381 @@
-from transformers import AutoTokenizer, AutoModelForCausalLM
-import torch
-from transformers import pipeline
 import logging
+import threading
+import time
+from functools import lru_cache
 from typing import List, Tuple
 import os
 # Set up logging
-from kaggle_secrets import UserSecretsClient
+from kv_cache import SessionKVCache, generate_with_cache
+from llm_backends import LLM_BACKEND, create_backend, time_forward_passes
+from metrics import LLM_TOKENS, STAGE_SECONDS, stage
+from request_log import annotate, truncate
+from model_registry import registry
+from speculative import LLM_DRAFT_MODEL, SpeculativeDecoder
 
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Check for GPU availability
-device = "cuda" if torch.cuda.is_available() else "cpu"
-
-# HF_TOKEN = os.environ.get('hf_token', None)
-user_secrets = UserSecretsClient()
-HF_TOKEN = user_secrets.get_secret("hf_token")
-
-# Validate token
-if not HF_TOKEN:
-    logger.warning("No Hugging Face token found in Kaggle secrets. Some models may require authentication.")
-
 # Load Qwen-1.5-0.5B-Chat amasfodel and tokenizer
 # MODEL_NAME = "Qwen/Qwen-1.5-0.5B-Chat"
 # MODEL_NAME = "ContactDoctor/Bio-Medical-MultiModal-Llama-3-8B-V1"
 MODEL_NAME = "ContactDoctor/Bio-Medical-Llama-3-8B"
-try:
-    tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME,token=HF_TOKEN, trust_remote_code=True)
-    model = AutoModelForCausalLM.from_pretrained(
-        MODEL_NAME,
-        torch_dtype=torch.float16 if device == "cuda" else torch.float32,
-        device_map="auto" if device == "cuda" else None,
-        trust_remote_code=True,
-        low_cpu_mem_usage=True,
+# Hugging Face id or local directory loaded by the transformers backends
+LLM_MODEL = os.environ.get("LLM_MODEL", MODEL_NAME)
+
+# Sampling settings shared by the pipeline and the batching engine
+GENERATION_KWARGS = {
+    "max_new_tokens": 512,
+    "temperature": 0.7,
+    "top_p": 0.9,
+    "repetition_penalty": 1.1,
+    "do_sample": True,
+}
+
+# Overrides for greedy decoding, used where responses are cached
+DETERMINISTIC_KWARGS = {"do_sample": False, "temperature": None, "top_p": None}
+
+# Batch concurrent prompts into a single generate() call (LLM_BATCHING=0 disables; transformers backends only)
+LLM_BATCHING = os.environ.get("LLM_BATCHING", "1") == "1"
+LLM_MAX_BATCH_SIZE = int(os.environ.get("LLM_MAX_BATCH_SIZE", "8"))
+LLM_BATCH_WINDOW_MS = float(os.environ.get("LLM_BATCH_WINDOW_MS", "20"))
+
+
+def _hf_token():
+    # HF_TOKEN = os.environ.get('hf_token', None)
+    from kaggle_secrets import UserSecretsClient
+    user_secrets = UserSecretsClient()
+    token = user_secrets.get_secret("hf_token")
+
+    # Validate token
+    if not token:
+        logger.warning("No Hugging Face token found in Kaggle secrets. Some models may require authentication.")
+    return token
+
+
+def load_llm():
+    """
+    Load the configured inference backend (LLM_BACKEND). Registered with the
+    model registry as "llm", so this runs on first use (or during startup
+    warmup), never at import.
+    """
+    backend = create_backend(
+        LLM_BACKEND,
+        model_name=LLM_MODEL,
+        generation_kwargs=GENERATION_KWARGS,
+        batching=(LLM_MAX_BATCH_SIZE, LLM_BATCH_WINDOW_MS) if LLM_BATCHING else None,
+        # Local model directories need no Hugging Face token
+        token_provider=None if os.path.isdir(LLM_MODEL) else _hf_token,
     )
-except Exception as e:
-    logger.error(f"Error loading model: {str(e)}")
-    raise
-
-# Create the text generation pipeline
-try:
-    pipe = pipeline(
-        "text-generation",
-        model=model,
-        tokenizer=tokenizer,
-        max_new_tokens=512,
-        temperature=0.7,
-        top_p=0.9,
-        repetition_penalty=1.1,
-        do_sample=True,
-        return_full_text=False,
+    time_forward_passes(backend.model)
+    return backend
+
+
+# Pinned: the chat endpoints always need it, so it is never evicted for the RSS budget
+registry.register("llm", load_llm, pinned=True)
+
+
+def llm():
+    """The shared LLM backend, loading it on first use."""
+    return registry.get("llm")
+
+
+def warmup_llm():
+    """Run one single-token greedy generation so kernels and allocator pools are initialised."""
+    backend = llm()
+    prompt = format_chat([{"role": "user", "content": "Hello"}])
+    if backend.batcher is not None:
+        # Bypass the batcher so warmup does not count as a served batch
+        streamer = backend.make_streamer()
+        backend.stream(prompt, streamer, max_new_tokens=1, **DETERMINISTIC_KWARGS)
+        for _ in streamer:
+            pass
+    else:
+        backend.generate(prompt, max_new_tokens=1, **DETERMINISTIC_KWARGS)
+
+
+def load_draft():
+    """Load the draft model with the same backend as the main model (registered as "llm-draft")."""
+    draft = create_backend(
+        LLM_BACKEND,
+        model_name=LLM_DRAFT_MODEL,
+        generation_kwargs=GENERATION_KWARGS,
+        token_provider=None if os.path.isdir(LLM_DRAFT_MODEL) else _hf_token,
     )
-except Exception as e:
-    logger.error(f"Error creating pipeline: {str(e)}")
-    raise
+    return SpeculativeDecoder(llm(), draft)
+
+
+# Not pinned: the draft is optional, so the RSS budget may evict it (it reloads on next use)
+registry.register("llm-draft", load_draft)
+
+# Set once the draft fails to load, so requests stop retrying and decode normally
+_draft_error = None
+
+
+def speculative_decoder():
+    """The draft-model decoder, or None if the backend cannot speculate or the draft failed to load."""
+    global _draft_error
+    if _draft_error is not None or not llm().supports_speculative:
+        return None
+    try:
+        return registry.get("llm-draft")
+    except Exception as e:
+        _draft_error = str(e)
+        logger.error(f"Draft model failed to load; decoding without it: {_draft_error}")
+        return None
+
+
+def require_draft():
+    """speculative_decoder(), raising if there is none (for startup, where a missing draft is a failure)."""
+    decoder = speculative_decoder()
+    if decoder is None:
+        raise RuntimeError(_draft_error or f"The {LLM_BACKEND} backend does not support speculative decoding")
+    return decoder
+
+
+def warmup_draft():
+    """Run one short assisted generation."""
+    require_draft().generate(format_chat([{"role": "user", "content": "Hello"}]), max_new_tokens=2, **DETERMINISTIC_KWARGS)
+
+
+def speculative_stats():
+    """Forward passes, tokens per target pass and tokens/s of draft-assisted generations, if the draft is loaded."""
+    decoder = registry.peek("llm-draft")
+    if decoder is None:
+        return {"loaded": False, "draft_model": LLM_DRAFT_MODEL, "error": _draft_error}
+    return {**decoder.stats(), "loaded": True}
+
+
+def batching_stats():
+    """Batching engine counters, or None if batching is off or the model is not loaded yet."""
+    backend = registry.peek("llm")
+    if backend is None or backend.batcher is None:
+        return None
+    return backend.batcher.stats()
+
+
+def backend_stats():
+    """Tokens/s and peak RSS of the loaded backend, or just its name if it is not loaded yet."""
+    backend = registry.peek("llm")
+    if backend is None:
+        return {"backend": LLM_BACKEND, "loaded": False}
+    return {**backend.stats(), "loaded": True}
+
+# Reuse each chat session's past_key_values across turns (LLM_KV_REUSE=0 disables)
+LLM_KV_REUSE = os.environ.get("LLM_KV_REUSE", "1") == "1"
+kv_cache = SessionKVCache() if LLM_KV_REUSE else None
+
+# Prompt token budgets per endpoint; oldest turns are dropped to stay inside them.
+# Override with TOKEN_BUDGET_<ENDPOINT>, e.g. TOKEN_BUDGET_HEALTH_OCR=4096
+TOKEN_BUDGETS = {
+    endpoint: int(os.environ.get(f"TOKEN_BUDGET_{endpoint.upper().replace('-', '_')}", default))
+    for endpoint, default in {
+        "llm-chat": 2048,
+        "health-llm-chat": 2048,
+        "ocr": 3072,
+        "health-ocr": 3072,
+    }.items()
+}
+DEFAULT_TOKEN_BUDGET = 2048
+
+# Endpoints that decode with the draft model (speculative decoding); off by default.
+# Enable with SPECULATIVE_<ENDPOINT>=1, e.g. SPECULATIVE_HEALTH_LLM_CHAT=1
+SPECULATIVE_ENDPOINTS = {
+    endpoint: os.environ.get(f"SPECULATIVE_{endpoint.upper().replace('-', '_')}", "0") == "1"
+    for endpoint in TOKEN_BUDGETS
+}
+
+# Tokens the chat template adds around each message (role header + end-of-turn)
+MESSAGE_OVERHEAD_TOKENS = 5
+
+def count_tokens(text: str) -> int:
+    """Number of tokens in text, without special tokens."""
+    return len(llm().tokenizer.encode(text, add_special_tokens=False))
 
 # Define a chat history class to manage conversation history
 class ChatHistory:
+    __slots__ = ("messages", "window_size", "_token_counts")
+
     def __init__(self, window_size=5):  # Changed to 5 as requested
         self.messages: List[Tuple[str, str]] = []
         self.window_size = window_size
+        # Cached [user_tokens, ai_tokens] per message; None until first counted
+        self._token_counts: List[List] = []
+
+    @classmethod
+    def from_messages(cls, messages, window_size=5):
+        """Rebuild a history from serialised (user, ai) pairs."""
+        history = cls(window_size=window_size)
+        history.messages = [(user_msg, ai_msg) for user_msg, ai_msg in messages][-window_size:]
+        history._token_counts = [[None, None] for _ in history.messages]
+        return history
 
     def add_message(self, user_message: str, ai_response: str = ""):
         """Add a message pair to history. If ai_response is empty, it will be filled later."""
         self.messages.append((user_message, ai_response))
+        self._token_counts.append([None, None])
         # Keep only the last window_size messages
         if len(self.messages) > self.window_size:
             self.messages = self.messages[-self.window_size:]
+            self._token_counts = self._token_counts[-self.window_size:]
+
+    def snapshot(self):
+        """Copy of the history, for restore() if the turn about to be added is abandoned."""
+        return list(self.messages), [list(counts) for counts in self._token_counts]
+
+    def restore(self, snapshot):
+        """Return to a snapshot(), dropping any turn added (and undoing any trim) since."""
+        messages, token_counts = snapshot
+        self.messages = list(messages)
+        self._token_counts = [list(counts) for counts in token_counts]
 
     def update_last_response(self, ai_response: str):
         """Update the last AI response in the history."""
         if self.messages:
             user_msg, _ = self.messages[-1]
             self.messages[-1] = (user_msg, ai_response)
+            self._token_counts[-1][1] = None
 
-    def get_chat_history_text(self):
-        """Format the chat history in a way that works well with Qwen models."""
-        history_text = ""
-        for user_msg, ai_msg in self.messages[:-1]:  # Exclude the current message
-            if ai_msg:  # Only include complete exchanges
-                history_text += f"<|im_start|>user\n{user_msg}<|im_end|>\n"
-                history_text += f"<|im_start|>assistant\n{ai_msg}<|im_end|>\n"
-        return history_text
+    def message_tokens(self, index: int, count_fn=count_tokens):
+        """Token counts (user, ai) of one message pair, tokenized at most once."""
+        counts = self._token_counts[index]
+        user_msg, ai_msg = self.messages[index]
+        if counts[0] is None:
+            counts[0] = count_fn(user_msg)
+        if counts[1] is None:
+            counts[1] = count_fn(ai_msg) if ai_msg else 0
+        return counts[0], counts[1]
 
-# Function to generate response using model
-def get_llm_response(message: str, chat_history: ChatHistory):
-    try:
-        # Add the current message to history
-        chat_history.add_message(message)
+    def get_chat_messages(self, token_budget: int, reserved_tokens: int = 0, count_fn=count_tokens):
+        """
+        Return the newest complete exchanges that fit the token budget.
+
+        Args:
+            token_budget (int): Maximum prompt tokens
+            reserved_tokens (int): Tokens already used by the system prompt and current message
+            count_fn (callable): Token counter for messages not yet counted
+
+        Returns:
+            list: Chat messages as {"role", "content"} dicts, oldest first
+        """
+        selected = []
+        used = reserved_tokens
+        # Walk back from the newest exchange, excluding the current message
+        for index in range(len(self.messages) - 2, -1, -1):
+            user_msg, ai_msg = self.messages[index]
+            if not ai_msg:  # Only include complete exchanges
+                continue
+            user_tokens, ai_tokens = self.message_tokens(index, count_fn)
+            cost = user_tokens + ai_tokens + 2 * MESSAGE_OVERHEAD_TOKENS
+            if used + cost > token_budget:
+                break
+            used += cost
+            selected.append({"role": "assistant", "content": ai_msg})
+            selected.append({"role": "user", "content": user_msg})
+        selected.reverse()
+        return selected
+
+SYSTEM_PROMPT = "You are a helpful, friendly AI assistant. Provide clear, concise, and accurate responses to user questions."
 
-        # Get conversation history (excluding the current message)
-        history_text = chat_history.get_chat_history_text()
+@lru_cache(maxsize=1)
+def system_prompt_tokens():
+    """Token count of SYSTEM_PROMPT, computed once the tokenizer is loaded."""
+    return count_tokens(SYSTEM_PROMPT)
+
+def elide_text(text: str, max_tokens: int) -> str:
+    """Shorten text to max_tokens by keeping its head and tail around an ellipsis."""
+    tokenizer = llm().tokenizer
+    token_ids = tokenizer.encode(text, add_special_tokens=False)
+    if len(token_ids) <= max_tokens:
+        return text
+    keep = max(max_tokens - 3, 2)
+    head = tokenizer.decode(token_ids[:keep // 2])
+    tail = tokenizer.decode(token_ids[-(keep - keep // 2):])
+    return f"{head}\n...\n{tail}"
+
+def format_chat(messages):
+    """Render chat messages with the model's own chat template."""
+    tokenizer = llm().tokenizer
+    if getattr(tokenizer, "chat_template", None):
+        prompt = tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+        # The template already starts with BOS and every generation path
+        # tokenizes with special tokens, so drop it to avoid a double BOS
+        if tokenizer.bos_token and prompt.startswith(tokenizer.bos_token):
+            prompt = prompt[len(tokenizer.bos_token):]
+        return prompt
+    # Fallback for tokenizers without a template: ChatML
+    prompt = "".join(f"<|im_start|>{m['role']}\n{m['content']}<|im_end|>\n" for m in messages)
+    return prompt + "<|im_start|>assistant\n"
+
+def build_prompt(message: str, chat_history: ChatHistory, token_budget: int = None):
+    """Add the message to history and return the full chat-formatted prompt within the token budget."""
+    with stage("llm_prompt_build"):
+        full_prompt = _build_prompt(message, chat_history, token_budget or DEFAULT_TOKEN_BUDGET)
+    # Tokenized again by the generation path; counted here so tokenizer cost and tokens in are visible
+    with stage("llm_tokenize"):
+        prompt_tokens = len(llm().tokenizer.encode(full_prompt))
+    LLM_TOKENS.inc(prompt_tokens, direction="in")
+    annotate(prompt_tokens=prompt_tokens)
+    return full_prompt
+
+def _build_prompt(message, chat_history, token_budget):
+    # Add the current message to history
+    chat_history.add_message(message)
+
+    # The system prompt and current message always go in; elide the message if it alone is too long
+    reserved_tokens = system_prompt_tokens() + chat_history.message_tokens(-1)[0] + 3 * MESSAGE_OVERHEAD_TOKENS
+    if reserved_tokens > token_budget:
+        message = elide_text(message, token_budget - system_prompt_tokens() - 3 * MESSAGE_OVERHEAD_TOKENS)
+        reserved_tokens = token_budget
+
+    # Fill the rest of the budget with the newest complete exchanges
+    history_messages = chat_history.get_chat_messages(token_budget, reserved_tokens)
+
+    return format_chat(
+        [{"role": "system", "content": SYSTEM_PROMPT}]
+        + history_messages
+        + [{"role": "user", "content": message}]
+    )
+
+# Function to generate response using model
+ERROR_RESPONSE_PREFIX = "I'm sorry, I encountered an error"
 
-        # Create a system prompt
-        system_prompt = "You are a helpful, friendly AI assistant. Provide clear, concise, and accurate responses to user questions."
+def is_error_response(response: str) -> bool:
+    """True if get_llm_response returned its error message instead of an answer."""
+    return response.startswith(ERROR_RESPONSE_PREFIX)
 
-        # Construct the prompt in Qwen's expected chat format
-        full_prompt = f"<|im_start|>system\n{system_prompt}<|im_end|>\n{history_text}<|im_start|>user\n{message}<|im_end|>\n<|im_start|>assistant\n"
+def get_llm_response(message: str, chat_history: ChatHistory, session_id: str = None, token_budget: int = None,
+                     deterministic: bool = False, speculative: bool = False):
+    try:
+        backend = llm()
+        full_prompt = build_prompt(message, chat_history, token_budget)
+        overrides = DETERMINISTIC_KWARGS if deterministic else {}
 
-        # Log the prompt for debugging
-        logger.info(f"Prompt sent to LLM: {full_prompt}")
+        # Prompts carry patient data: only a truncated copy, and only at DEBUG
+        logger.debug("Prompt sent to LLM: %s", truncate(full_prompt))
 
-        # Generate the response using the pipeline
-        response = pipe(full_prompt)[0]['generated_text']
+        # Draft-assisted endpoints verify draft tokens; chat sessions only
+        # prefill the new turn; stateless calls are batched
+        decoder = speculative_decoder() if speculative else None
+        started = time.perf_counter()
+        with stage("llm_generate"):
+            if decoder is not None:
+                response = decoder.generate(full_prompt, **overrides)
+            elif session_id is not None and kv_cache is not None and backend.supports_kv_reuse:
+                response = generate_with_cache(
+                    backend.model, backend.tokenizer, kv_cache, session_id, full_prompt,
+                    **{**GENERATION_KWARGS, **overrides}
+                )
+            else:
+                response = backend.generate(full_prompt, **overrides)
+        if decoder is None:
+            backend.record(response, time.perf_counter() - started)
 
         # Clean up the response if needed
         response = response.strip()
 
-        # Log the response for debugging
-        logger.info(f"Generated response: {response}")
+        annotate(response_chars=len(response))
+        logger.debug("Generated response: %s", truncate(response))
 
         # Update the chat history with the AI's response
         chat_history.update_last_response(response)
@@ -118,10 +384,136 @@ def get_llm_response(message: str, chat_history: ChatHistory):
 
     except Exception as e:
         logger.error(f"Error in get_llm_response: {str(e)}")
-        error_message = f"I'm sorry, I encountered an error: {str(e)}"
+        error_message = f"{ERROR_RESPONSE_PREFIX}: {str(e)}"
         chat_history.update_last_response(error_message)
         return error_message
 
+class StreamStats:
+    """Running time-to-first-token and decode statistics for streamed responses."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.streams = 0
+        self.ttft_seconds_total = 0.0
+        self.ttft_seconds_max = 0.0
+        self.last_ttft_seconds = None
+
+    def record(self, ttft_seconds):
+        with self._lock:
+            self.streams += 1
+            self.ttft_seconds_total += ttft_seconds
+            self.ttft_seconds_max = max(self.ttft_seconds_max, ttft_seconds)
+            self.last_ttft_seconds = ttft_seconds
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                "streams": self.streams,
+                "avg_ttft_seconds": round(self.ttft_seconds_total / self.streams, 4) if self.streams else None,
+                "max_ttft_seconds": round(self.ttft_seconds_max, 4),
+                "last_ttft_seconds": self.last_ttft_seconds,
+            }
+
+stream_stats = StreamStats()
+
+def llm_stats():
+    """Backend throughput and memory, speculative decoding, batching, KV-cache reuse and streaming counters."""
+    return {
+        "backend": backend_stats(),
+        "speculative": speculative_stats(),
+        "batching": batching_stats(),
+        "kv_cache": kv_cache.stats() if kv_cache is not None else None,
+        "streaming": stream_stats.as_dict()
+    }
+
+def stream_llm_response(message: str, chat_history: ChatHistory, launch=None, session_id: str = None,
+                        token_budget: int = None, speculative: bool = False):
+    """
+    Start generating a response and return an iterator over decoded text chunks.
+
+    Generation runs in the background (through launch, which defaults to a new
+    thread) so that the caller can be rejected before any output is produced.
+    If launch raises (e.g. PoolSaturated), chat_history is left as it was.
+    When the iterator is exhausted the full response is written to chat_history.
+
+    Args:
+        message (str): User message / prompt
+        chat_history (ChatHistory): History to read from and update
+        launch (callable): Runs a zero-argument callable in the background
+        session_id (str): Reuse this session's cached prefix, if KV reuse is on
+        token_budget (int): Maximum prompt tokens
+        speculative (bool): Decode with the draft model, if one is available
+
+    Returns:
+        Iterator[str]: Text chunks as they are decoded
+    """
+    backend = llm()
+    snapshot = chat_history.snapshot()
+    full_prompt = build_prompt(message, chat_history, token_budget)
+    logger.debug("Prompt sent to LLM (streaming): %s", truncate(full_prompt))
+
+    decoder = speculative_decoder() if speculative else None
+    streamer = backend.make_streamer()
+    errors = []
+
+    def generate():
+        try:
+            if decoder is not None:
+                decoder.generate(full_prompt, streamer=streamer)
+                return
+            if session_id is not None and kv_cache is not None and backend.supports_kv_reuse:
+                generate_with_cache(
+                    backend.model, backend.tokenizer, kv_cache, session_id, full_prompt,
+                    streamer=streamer, **GENERATION_KWARGS
+                )
+                return
+            backend.stream(full_prompt, streamer)
+        except Exception as e:
+            errors.append(e)
+            # Unblock the consumer; generate() may have failed before streaming began
+            streamer.end()
+
+    try:
+        if launch is None:
+            threading.Thread(target=generate, name="llm-stream", daemon=True).start()
+        else:
+            launch(generate)
+    except Exception:
+        # Rejected before generating: leave no unanswered turn behind
+        chat_history.restore(snapshot)
+        raise
+    started = time.perf_counter()
+
+    def iterate():
+        chunks = []
+        for chunk in streamer:
+            if not chunk:
+                continue
+            if not chunks:
+                ttft = time.perf_counter() - started
+                stream_stats.record(ttft)
+                STAGE_SECONDS.observe(ttft, stage="llm_first_token")
+                annotate(first_token_ms=round(ttft * 1000, 1))
+            chunks.append(chunk)
+            yield chunk
+
+        if errors:
+            logger.error(f"Error in stream_llm_response: {str(errors[0])}")
+            error_message = f"{ERROR_RESPONSE_PREFIX}: {str(errors[0])}"
+            chat_history.update_last_response(error_message)
+            yield error_message
+            return
+
+        response = "".join(chunks).strip()
+        STAGE_SECONDS.observe(time.perf_counter() - started, stage="llm_generate")
+        if decoder is None:
+            backend.record(response, time.perf_counter() - started)
+        annotate(response_chars=len(response))
+        logger.debug("Generated response: %s", truncate(response))
+        chat_history.update_last_response(response)
+
+    return iterate()
+
 # Example usage
 if __name__ == "__main__":
     # Initialize chat history with 5-message window
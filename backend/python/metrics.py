@@ -0,0 +1,243 @@
+import bisect
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from request_log import current_trace
+
+# Record metrics (METRICS_ENABLED=0 turns every observation into a no-op)
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1") == "1"
+
+# Histogram bucket upper bounds
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+LOAD_BUCKETS = (0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+TOKEN_RATE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self):
+        """[(suffix, {label: value}, value)] for the exposition format."""
+        raise NotImplementedError
+
+    def family(self):
+        return {"name": self.name, "type": self.type, "help": self.help, "samples": self.samples()}
+
+
+class Counter(_Metric):
+    """A monotonically increasing total per label set."""
+
+    type = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        super().__init__(name, help, labelnames)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = list(self._values.items())
+        return [("_total", dict(zip(self.labelnames, key)), value) for key, value in values]
+
+
+class Gauge(_Metric):
+    """
+    A value read at scrape time, so keeping it current costs nothing on the
+    request path. collect() returns {label values tuple: value}.
+    """
+
+    type = "gauge"
+
+    def __init__(self, name, help, labelnames=(), collect=None):
+        super().__init__(name, help, labelnames)
+        self.collect = collect
+
+    def samples(self):
+        try:
+            values = self.collect()
+        except Exception:
+            return []
+        return [
+            ("", dict(zip(self.labelnames, key)), value)
+            for key, value in values.items() if value is not None
+        ]
+
+
+class Histogram(_Metric):
+    """Counts of observations per bucket, with their sum, per label set."""
+
+    type = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+        # label values -> [per-bucket counts (+Inf last), sum, count]
+        self._series = {}
+
+    def observe(self, value, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the with-block, including when it raises."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self):
+        with self._lock:
+            series = [(key, list(counts), total, count) for key, (counts, total, count) in self._series.items()]
+        samples = []
+        for key, counts, total, count in series:
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                samples.append(("_bucket", {**labels, "le": _format_value(bound)}, cumulative))
+            samples.append(("_sum", labels, total))
+            samples.append(("_count", labels, count))
+        return samples
+
+
+class MetricsRegistry:
+    """The process's metrics, rendered in the Prometheus text exposition format."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric '{metric.name}' is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self.register(Counter(name, help, labelnames))
+
+    def gauge(self, name, help, labelnames=(), collect=None):
+        return self.register(Gauge(name, help, labelnames, collect))
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def snapshot(self):
+        """Every metric as a JSON-serialisable family, e.g. to merge another process's metrics."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return [metric.family() for metric in metrics]
+
+
+def render(*snapshots):
+    """
+    Render one or more snapshots as Prometheus text. Families with the same
+    name (from different processes) are merged under one HELP/TYPE header.
+    """
+    families = {}
+    for snapshot in snapshots:
+        for family in snapshot:
+            merged = families.setdefault(family["name"], {**family, "samples": []})
+            merged["samples"].extend(family["samples"])
+
+    lines = []
+    for name, family in families.items():
+        lines.append(f"# HELP {name} {family['help']}")
+        lines.append(f"# TYPE {name} {family['type']}")
+        for suffix, labels, value in family["samples"]:
+            label_text = ",".join(f'{key}="{_escape(val)}"' for key, val in labels.items())
+            lines.append(f"{name}{suffix}{{{label_text}}} {_format_value(value)}" if label_text
+                         else f"{name}{suffix} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+def with_labels(snapshot, **labels):
+    """Copy a snapshot with extra labels on every sample (e.g. process="model_server")."""
+    return [
+        {**family, "samples": [(suffix, {**sample_labels, **labels}, value) for suffix, sample_labels, value in family["samples"]]}
+        for family in snapshot
+    ]
+
+
+# ---------------------------------------------------------------------------
+# Shared registry and the metrics the pipeline records
+# ---------------------------------------------------------------------------
+
+metrics = MetricsRegistry()
+
+REQUEST_SECONDS = metrics.histogram(
+    "http_request_duration_seconds", "Time to response headers per route", ("method", "route", "status")
+)
+STAGE_SECONDS = metrics.histogram("stage_duration_seconds", "Time spent in each pipeline stage", ("stage",))
+QUEUE_WAIT_SECONDS = metrics.histogram(
+    "queue_wait_seconds", "Time a job waited for a worker pool or the LLM batcher", ("queue",)
+)
+LLM_TOKENS = metrics.counter("llm_tokens", "Prompt (in) and generated (out) tokens", ("direction",))
+LLM_TOKENS_PER_SECOND = metrics.histogram(
+    "llm_generation_tokens_per_second", "Generated tokens per second of each generation", buckets=TOKEN_RATE_BUCKETS
+)
+MODEL_LOADS = metrics.counter("model_loads", "Model loads by the model registry", ("model",))
+MODEL_UNLOADS = metrics.counter("model_unloads", "Models unloaded or evicted by the model registry", ("model",))
+MODEL_LOAD_SECONDS = metrics.histogram(
+    "model_load_seconds", "Model load time", ("model",), buckets=LOAD_BUCKETS
+)
+
+
+@contextmanager
+def stage(name):
+    """
+    Time a pipeline stage into stage_duration_seconds and the current request's trace.
+
+    Example:
+        with stage("ocr_tesseract"):
+            text = ocr_engine.image_to_string(image)
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - started
+        STAGE_SECONDS.observe(seconds, stage=name)
+        trace = current_trace.get()
+        if trace is not None:
+            trace.add_stage(name, seconds)
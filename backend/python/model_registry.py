@@ -0,0 +1,300 @@
+import gc
+import logging
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from metrics import MODEL_LOAD_SECONDS, MODEL_LOADS, MODEL_UNLOADS
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Resident-memory budget for all registry-managed models, in MB (0 = unlimited)
+RSS_BUDGET_MB = int(os.environ.get("MODEL_RSS_BUDGET_MB", "0"))
+
+
+def current_rss_bytes():
+    """
+    Return the resident set size of this process in bytes.
+
+    Uses psutil when it is installed, otherwise /proc/self/statm, and finally
+    falls back to the peak RSS reported by getrusage.
+    """
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+
+    try:
+        with open("/proc/self/statm") as statm:
+            resident_pages = int(statm.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+
+    return peak_rss_bytes()
+
+
+def peak_rss_bytes():
+    """Highest resident set size this process has reached, in bytes."""
+    import resource
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes on Linux
+    return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
+def children_rss_bytes():
+    """
+    Resident set size of this process's worker processes, in bytes.
+
+    With psutil, the summed current RSS of all live descendants (process
+    pools stay up between requests, so they are never reaped). Without it,
+    getrusage(RUSAGE_CHILDREN), which covers only the largest child that has
+    already exited.
+    """
+    try:
+        import psutil
+    except ImportError:
+        import resource
+        max_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+        return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+    total = 0
+    for child in psutil.Process().children(recursive=True):
+        try:
+            total += child.memory_info().rss
+        except psutil.Error:
+            pass  # exited since it was listed
+    return total
+
+
+def _parameter_bytes(model):
+    """Size of a torch model's parameters and buffers, or 0 if not a torch model."""
+    # Text-generation pipelines keep the torch module on .model
+    module = getattr(model, "model", model)
+    if not hasattr(module, "parameters"):
+        return 0
+    try:
+        total = sum(p.numel() * p.element_size() for p in module.parameters())
+        total += sum(b.numel() * b.element_size() for b in module.buffers())
+        return total
+    except Exception:
+        return 0
+
+
+class ModelEntry:
+    """Book-keeping for one registered model."""
+
+    def __init__(self, name, loader, pinned=False):
+        self.name = name
+        self.loader = loader
+        self.pinned = pinned
+        self.model = None
+        # Serialises loading and inference on this model
+        self.lock = threading.RLock()
+        self.in_use = 0
+        self.load_count = 0
+        self.load_seconds = None
+        self.resident_bytes = None
+        self.last_used = None
+
+    @property
+    def loaded(self):
+        return self.model is not None
+
+    def stats(self):
+        return {
+            "loaded": self.loaded,
+            "pinned": self.pinned,
+            "in_use": self.in_use,
+            "load_count": self.load_count,
+            "load_seconds": self.load_seconds,
+            "resident_mb": round(self.resident_bytes / (1024 * 1024), 1) if self.resident_bytes else None,
+            "last_used": self.last_used,
+        }
+
+
+class ModelRegistry:
+    """
+    Process-wide registry that loads models lazily and keeps them resident.
+
+    Models are registered by name with a zero-argument loader. The first call to
+    get() or use() loads the model; later calls reuse the same instance. When the
+    process RSS exceeds the configured budget, the least-recently-used models
+    that are neither pinned nor in use are unloaded.
+    """
+
+    def __init__(self, rss_budget_bytes=None):
+        self.rss_budget_bytes = rss_budget_bytes
+        self._entries = OrderedDict()  # LRU order: oldest first
+        self._lock = threading.Lock()
+
+    def register(self, name, loader, pinned=False):
+        """
+        Register a model loader under a name.
+
+        Args:
+            name (str): Registry key
+            loader (callable): Zero-argument function returning the loaded model
+            pinned (bool): Never evict this model to satisfy the RSS budget
+        """
+        with self._lock:
+            if name in self._entries:
+                raise ValueError(f"Model '{name}' is already registered")
+            self._entries[name] = ModelEntry(name, loader, pinned)
+
+    def _entry(self, name):
+        with self._lock:
+            try:
+                entry = self._entries[name]
+            except KeyError:
+                raise KeyError(f"Model '{name}' is not registered") from None
+            self._entries.move_to_end(name)
+            entry.last_used = time.time()
+            return entry
+
+    def _load(self, entry):
+        """Load the entry's model if needed. Caller must hold entry.lock."""
+        if entry.model is not None:
+            return entry.model
+
+        logger.info(f"Loading model '{entry.name}'")
+        rss_before = current_rss_bytes()
+        start = time.perf_counter()
+        model = entry.loader()
+        entry.load_seconds = round(time.perf_counter() - start, 3)
+        rss_delta = current_rss_bytes() - rss_before
+        # RSS deltas are noisy for lazily-mapped weights, so fall back to parameter size
+        entry.resident_bytes = max(rss_delta, _parameter_bytes(model))
+        entry.model = model
+        entry.load_count += 1
+        MODEL_LOADS.inc(model=entry.name)
+        MODEL_LOAD_SECONDS.observe(entry.load_seconds, model=entry.name)
+        logger.info(
+            f"Loaded model '{entry.name}' in {entry.load_seconds}s "
+            f"(~{entry.resident_bytes / (1024 * 1024):.1f} MB resident)"
+        )
+
+        self._enforce_budget(keep=entry.name)
+        return model
+
+    def get(self, name):
+        """
+        Return the model registered under name, loading it on first use.
+
+        The returned object is shared; callers that run inference concurrently
+        should prefer use(), which serialises access.
+        """
+        entry = self._entry(name)
+        with entry.lock:
+            return self._load(entry)
+
+    def peek(self, name):
+        """Return the model if it is already loaded, else None; never loads it."""
+        with self._lock:
+            entry = self._entries.get(name)
+        return entry.model if entry is not None else None
+
+    @contextmanager
+    def use(self, name):
+        """
+        Context manager yielding an exclusive, eviction-safe handle to a model.
+
+        Example:
+            with registry.use("whisper-tiny") as model:
+                result = model.transcribe(path)
+        """
+        entry = self._entry(name)
+        with entry.lock:
+            model = self._load(entry)
+            entry.in_use += 1
+            try:
+                yield model
+            finally:
+                entry.in_use -= 1
+
+    def unload(self, name):
+        """Drop the loaded instance of a model so its memory can be reclaimed."""
+        entry = self._entry(name)
+        with entry.lock:
+            self._release(entry)
+
+    def _release(self, entry):
+        if entry.model is None:
+            return
+        entry.model = None
+        MODEL_UNLOADS.inc(model=entry.name)
+        gc.collect()
+        torch = sys.modules.get("torch")
+        if torch is not None and torch.cuda.is_available():
+            torch.cuda.empty_cache()
+        logger.info(f"Unloaded model '{entry.name}'")
+
+    def _enforce_budget(self, keep=None):
+        """Evict least-recently-used models until RSS fits the budget."""
+        if not self.rss_budget_bytes:
+            return
+
+        rss = current_rss_bytes()
+        if rss <= self.rss_budget_bytes:
+            return
+
+        with self._lock:
+            candidates = [
+                entry for entry in self._entries.values()
+                if entry.loaded and not entry.pinned and entry.name != keep
+            ]
+
+        # Freed memory is not always returned to the OS, so track the expected
+        # saving instead of re-reading RSS after every eviction
+        for entry in candidates:
+            if rss <= self.rss_budget_bytes:
+                break
+            # Skip models that are busy; acquiring without blocking avoids
+            # deadlocking against a thread that is loading another model
+            if not entry.lock.acquire(blocking=False):
+                continue
+            try:
+                if entry.in_use or entry.model is None:
+                    continue
+                self._release(entry)
+                rss -= entry.resident_bytes or 0
+            finally:
+                entry.lock.release()
+
+        if rss > self.rss_budget_bytes:
+            logger.warning(
+                f"Model RSS budget of {self.rss_budget_bytes / (1024 * 1024):.0f} MB "
+                f"still exceeded after eviction"
+            )
+
+    def stats(self):
+        """Return load time, resident size and usage state for every model."""
+        with self._lock:
+            entries = list(self._entries.values())
+        return {
+            "rss_mb": round(current_rss_bytes() / (1024 * 1024), 1),
+            "rss_budget_mb": round(self.rss_budget_bytes / (1024 * 1024), 1) if self.rss_budget_bytes else None,
+            "models": {entry.name: entry.stats() for entry in entries},
+        }
+
+
+# ---------------------------------------------------------------------------
+# Shared registry and default models
+# ---------------------------------------------------------------------------
+
+registry = ModelRegistry(rss_budget_bytes=RSS_BUDGET_MB * 1024 * 1024 or None)
+
+WHISPER_MODEL = os.environ.get("WHISPER_MODEL", "tiny")
+
+
+def _load_whisper():
+    import whisper
+    return whisper.load_model(WHISPER_MODEL)
+
+
+registry.register("whisper", _load_whisper)
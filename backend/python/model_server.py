@@ -0,0 +1,162 @@
+"""
+Model server: one process that holds the LLM for every API worker.
+
+Usage:
+    python model_server.py --socket /tmp/llm-server.sock
+    LLM_SERVER_SOCKET=/tmp/llm-server.sock uvicorn app:app --workers 4
+
+With several uvicorn workers, each one importing llm_model would load its own
+copy of the weights. Instead the model is loaded (and warmed) once here, and
+workers started with LLM_SERVER_SOCKET send generations over a Unix socket
+(see llm_client.py). `python app.py` with API_WORKERS > 1 starts both.
+
+Protocol: one JSON object per line in each direction, one request per
+connection. Each connection is served on its own thread, so concurrent
+generations still meet in the batching engine and the session KV cache.
+"""
+import argparse
+import json
+import logging
+import os
+import signal
+import socketserver
+import sys
+
+import llm_model
+from llm_client import DEFAULT_SERVER_SOCKET, LLM_SERVER_SOCKET
+from metrics import metrics
+from request_log import configure_logging
+from model_registry import current_rss_bytes
+from startup import STARTUP_WARMUP
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def _history(state):
+    """Rebuild the worker's chat history (before the new message) from its serialised form."""
+    return llm_model.ChatHistory.from_messages(state["messages"], state["window_size"])
+
+
+def handle_generate(request):
+    history = _history(request["history"])
+    response = llm_model.get_llm_response(
+        request["message"], history, session_id=request.get("session_id"),
+        token_budget=request.get("token_budget"), deterministic=request.get("deterministic", False),
+        speculative=request.get("speculative", False)
+    )
+    yield {"response": response}
+
+
+def handle_stream(request):
+    history = _history(request["history"])
+    chunks = llm_model.stream_llm_response(
+        request["message"], history, session_id=request.get("session_id"),
+        token_budget=request.get("token_budget"), speculative=request.get("speculative", False)
+    )
+    for chunk in chunks:
+        yield {"chunk": chunk}
+    # The text stored in the history (stripped, or the error message) for the worker to record
+    yield {"done": True, "response": history.messages[-1][1]}
+
+
+def handle_stats(request):
+    yield llm_model.llm_stats()
+
+
+def handle_metrics(request):
+    yield {"families": metrics.snapshot()}
+
+
+def handle_ping(request):
+    yield {"ok": True, "model": llm_model.llm().model_name, "pid": os.getpid()}
+
+
+OPS = {
+    "generate": handle_generate,
+    "stream": handle_stream,
+    "stats": handle_stats,
+    "metrics": handle_metrics,
+    "ping": handle_ping,
+}
+
+
+class ModelRequestHandler(socketserver.StreamRequestHandler):
+    """Reads one request line and writes each reply as a line."""
+
+    def send(self, reply):
+        self.wfile.write(json.dumps(reply).encode("utf-8") + b"\n")
+        self.wfile.flush()
+
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            return
+        try:
+            request = json.loads(line)
+            handler = OPS.get(request.get("op"))
+            if handler is None:
+                raise ValueError(f"Unknown op '{request.get('op')}'")
+            for reply in handler(request):
+                self.send(reply)
+        except (BrokenPipeError, ConnectionResetError):
+            logger.info("API worker disconnected before the reply was complete")
+        except Exception as e:
+            logger.error(f"Model server request failed: {e}")
+            try:
+                self.send({"error": str(e)})
+            except OSError:
+                pass
+
+
+class ModelServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+metrics.gauge(
+    "process_resident_memory_bytes", "Resident set size of the process", collect=lambda: {(): current_rss_bytes()}
+)
+
+
+def prepare_models():
+    """Load the LLM (and the draft model, if any endpoint speculates) before accepting connections."""
+    llm_model.llm()
+    if STARTUP_WARMUP:
+        llm_model.warmup_llm()
+    if any(llm_model.SPECULATIVE_ENDPOINTS.values()) and llm_model.speculative_decoder() is not None and STARTUP_WARMUP:
+        llm_model.warmup_draft()
+
+
+def serve(path):
+    """Bind the socket (owner-only) and serve until SIGTERM or SIGINT."""
+    # A socket left behind by a killed server would make bind() fail
+    if os.path.exists(path):
+        os.unlink(path)
+    server = ModelServer(path, ModelRequestHandler)
+    os.chmod(path, 0o600)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    logger.info(f"Model server listening on {path}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        server.server_close()
+        if os.path.exists(path):
+            os.unlink(path)
+        logger.info("Model server stopped")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--socket", default=LLM_SERVER_SOCKET or DEFAULT_SERVER_SOCKET, help="Unix socket path")
+    args = parser.parse_args()
+
+    configure_logging(logging.INFO)
+    prepare_models()
+    serve(args.socket)
+
+
+if __name__ == "__main__":
+    main()
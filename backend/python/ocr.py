@@ -1,11 +1,176 @@
-import pytesseract
-from PIL import Image, ImageEnhance, ImageFilter
+from PIL import Image
 import cv2
 import numpy as np
 import os
 import re
+import io
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from metrics import stage
+from ocr_engine import create_engine
+from ocr_layout import find_text_regions, reading_order
 
-def enhance_image_for_ocr(image_path, scale_factor=2):
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Characters Tesseract may emit
+OCR_WHITELIST = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789"
+# Symbols lab reports need to keep values and ranges intact (5.6, 4.0-5.6, mg/dL, %, <200)
+REPORT_SYMBOLS = ".,%/-:<>()"
+REPORT_WHITELIST = OCR_WHITELIST + REPORT_SYMBOLS
+
+# Warm Tesseract workers (tesserocr) when available, pytesseract otherwise
+ocr_engine = create_engine(whitelist=OCR_WHITELIST)
+
+def warmup_ocr():
+    """Start the OCR workers and recognise one blank strip on each, so language data is loaded before traffic."""
+    ocr_engine.warmup(np.full((32, 256), 255, dtype=np.uint8))
+
+# Size budget for cached OCR results, in MB
+OCR_CACHE_MAX_MB = float(os.environ.get("OCR_CACHE_MAX_MB", "32"))
+# Side of the dHash grid; the hash has OCR_DHASH_SIZE ** 2 bits
+OCR_DHASH_SIZE = int(os.environ.get("OCR_DHASH_SIZE", "16"))
+# Maximum Hamming distance for two images to count as the same photo (0 disables)
+OCR_NEAR_DUP_DISTANCE = int(os.environ.get("OCR_NEAR_DUP_DISTANCE", "10"))
+
+def dhash(gray, hash_size=OCR_DHASH_SIZE):
+    """
+    Difference hash of an image: compares neighbouring pixels of a downscaled
+    grayscale copy, so re-encoded or slightly re-framed photos hash alike.
+
+    Args:
+        gray (numpy.ndarray): Grayscale image
+        hash_size (int): Hash grid side
+
+    Returns:
+        int: hash_size * hash_size bit perceptual hash
+    """
+    small = cv2.resize(gray, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA).astype(np.int16)
+    bits = small[:, 1:] > small[:, :-1]
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+class OCRCache:
+    """
+    Size-bounded LRU cache of OCR text.
+
+    Results are keyed on the SHA-256 of the upload bytes. Each entry also
+    stores a perceptual hash, indexed in 16-bit bands: two hashes within
+    fewer bit flips than there are bands must share a band, so near-duplicate
+    lookups only compare against candidates from matching bands. Bands are
+    scoped by language and OCR mode, so a near-duplicate never returns text
+    read with a different language or layout/report setting.
+    """
+
+    BAND_BITS = 16
+
+    def __init__(self, max_bytes=int(OCR_CACHE_MAX_MB * 1024 * 1024), max_distance=OCR_NEAR_DUP_DISTANCE,
+                 hash_bits=OCR_DHASH_SIZE ** 2):
+        self.max_bytes = max_bytes
+        self.max_distance = max_distance
+        self.bands = hash_bits // self.BAND_BITS
+        self._entries = OrderedDict()  # key -> (phash, text, size, scope)
+        self._band_index = {}  # (scope, band, value) -> set of keys
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.exact_hits = 0
+        self.near_hits = 0
+        self.misses = 0
+
+    def _band_keys(self, scope, phash):
+        mask = (1 << self.BAND_BITS) - 1
+        return [(scope, band, (phash >> (band * self.BAND_BITS)) & mask) for band in range(self.bands)]
+
+    def get(self, key, scope, phash=None):
+        """
+        Look up by exact key, then (if phash is given) by perceptual similarity
+        among entries of the same scope (language and OCR mode).
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.exact_hits += 1
+                return entry[1]
+
+            if phash is not None and self.max_distance:
+                best_key, best_distance = None, self.max_distance + 1
+                for band_key in self._band_keys(scope, phash):
+                    for candidate in self._band_index.get(band_key, ()):
+                        distance = bin(self._entries[candidate][0] ^ phash).count('1')
+                        if distance < best_distance:
+                            best_key, best_distance = candidate, distance
+                if best_key is not None:
+                    self._entries.move_to_end(best_key)
+                    self.near_hits += 1
+                    return self._entries[best_key][1]
+
+            self.misses += 1
+            return None
+
+    def put(self, key, scope, phash, text):
+        size = len(text) + 256  # text plus rough entry overhead
+        with self._lock:
+            if key in self._entries or size > self.max_bytes:
+                return
+            self._entries[key] = (phash, text, size, scope)
+            self._bytes += size
+            for band_key in self._band_keys(scope, phash):
+                self._band_index.setdefault(band_key, set()).add(key)
+            while self._bytes > self.max_bytes:
+                old_key, (old_phash, _, old_size, old_scope) = self._entries.popitem(last=False)
+                self._bytes -= old_size
+                for band_key in self._band_keys(old_scope, old_phash):
+                    keys = self._band_index.get(band_key)
+                    if keys is not None:
+                        keys.discard(old_key)
+                        if not keys:
+                            del self._band_index[band_key]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "size_mb": round(self._bytes / (1024 * 1024), 3),
+                "max_mb": round(self.max_bytes / (1024 * 1024), 1),
+                "exact_hits": self.exact_hits,
+                "near_hits": self.near_hits,
+                "misses": self.misses,
+            }
+
+ocr_cache = OCRCache()
+
+# Same kernel as PIL's ImageFilter.SHARPEN
+SHARPEN_KERNEL = np.array([[-2, -2, -2], [-2, 32, -2], [-2, -2, -2]], dtype=np.float32) / 16
+
+def decode_image(source):
+    """
+    Decode an image straight into a grayscale NumPy array.
+
+    Args:
+        source (str | bytes | bytearray | memoryview | file-like | numpy.ndarray):
+            Path, encoded image bytes, a readable buffer, or an already decoded array
+
+    Returns:
+        numpy.ndarray: 8-bit grayscale image
+    """
+    if isinstance(source, np.ndarray):
+        return source if source.ndim == 2 else cv2.cvtColor(source, cv2.COLOR_BGR2GRAY)
+    if isinstance(source, str):
+        with open(source, 'rb') as image_file:
+            source = image_file.read()
+    elif hasattr(source, 'read'):
+        source = source.read()
+
+    # np.frombuffer wraps the bytes without copying them
+    gray = cv2.imdecode(np.frombuffer(source, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+    if gray is None:
+        # Formats the OpenCV build cannot decode (e.g. some WebP/GIF variants)
+        gray = np.asarray(Image.open(io.BytesIO(source)).convert('L'))
+    return gray
+
+def enhance_image_for_ocr(image, scale_factor=2):
     """
     Enhance image for better OCR performance by:
     1. Grayscaling
@@ -14,74 +179,143 @@ def enhance_image_for_ocr(image_path, scale_factor=2):
     4. Sharpening
 
     Args:
-        image_path (str): Path to input image
+        image: Path, encoded bytes, buffer or grayscale array (see decode_image)
         scale_factor (int): Factor to upscale the image (default: 2)
 
     Returns:
-        PIL.Image: Enhanced image for OCR
+        numpy.ndarray: Enhanced grayscale image for OCR
     """
-    # Read image
-    image = Image.open(image_path)
-
-    # Convert to grayscale
-    grayscale_image = image.convert('L')
+    # Read image and convert to grayscale
+    gray = decode_image(image)
 
     # Upscale the image
-    width, height = grayscale_image.size
-    upscaled_image = grayscale_image.resize(
+    height, width = gray.shape
+    upscaled = cv2.resize(
+        gray,
         (width * scale_factor, height * scale_factor),
-        Image.LANCZOS  # High-quality upscaling algorithm
+        interpolation=cv2.INTER_LANCZOS4  # High-quality upscaling algorithm
     )
 
-    # Enhance contrast
-    enhancer = ImageEnhance.Contrast(upscaled_image)
-    enhanced_image = enhancer.enhance(2.0)
+    # Enhance contrast: stretch around the mean by 2x, like ImageEnhance.Contrast(2.0).
+    # addWeighted saturates to 0..255 (convertScaleAbs would fold dark text back to grey).
+    mean = float(upscaled.mean())
+    contrasted = cv2.addWeighted(upscaled, 2.0, upscaled, 0, -mean)
 
     # Apply sharpening filter
-    sharpened_image = enhanced_image.filter(ImageFilter.SHARPEN)
+    return cv2.filter2D(contrasted, -1, SHARPEN_KERNEL)
+
+def is_meaningful(text):
+    """Reject region output that is mostly OCR noise (stray marks, border fragments)."""
+    alphanumeric = sum(char.isalnum() for char in text)
+    return alphanumeric >= 2 and alphanumeric >= 0.5 * len(text.replace(' ', ''))
+
+def extract_text_by_regions(gray, lang='eng', whitelist=OCR_WHITELIST, keep=''):
+    """
+    OCR a page region by region and reassemble it in reading order.
 
-    return sharpened_image
+    Text lines and table cells are located with cv2, enhanced individually and
+    recognised in parallel by the OCR engine. Cells on the same row are joined
+    with " | " and rows with newlines, so table structure survives.
 
-def extract_text_from_enhanced_image(image_path, lang='eng'):
+    Args:
+        gray (numpy.ndarray): Grayscale page
+        lang (str): OCR language
+        whitelist (str): Characters Tesseract may emit
+        keep (str): Punctuation that clean_text should preserve
+
+    Returns:
+        str | None: Reassembled text, or None if no regions were found
+    """
+    with stage("ocr_layout"):
+        rows = reading_order(find_text_regions(gray))
+    if not rows:
+        return None
+
+    regions = [region for row in rows for region in row]
+    with stage("ocr_enhance"):
+        crops = [enhance_image_for_ocr(region.crop(gray)) for region in regions]
+    with stage("ocr_tesseract"):
+        texts = iter(ocr_engine.map(crops, lang=lang, psm=6, whitelist=whitelist))
+
+    lines = []
+    for row in rows:
+        parts = [clean_text(next(texts), keep) for _ in row]
+        parts = [part for part in parts if part and is_meaningful(part)]
+        if not parts:
+            continue
+        separator = ' | ' if any(region.kind == 'cell' for region in row) else ' '
+        lines.append(separator.join(parts))
+    return '\n'.join(lines)
+
+def extract_text_from_enhanced_image(image, lang='eng', near_duplicates=True, layout=False, report=False):
     """
     Extract text using enhanced image preprocessing
 
+    Works entirely in memory. Results are cached by the image's bytes, and
+    re-photographed copies of a cached image are matched by perceptual hash
+    unless near_duplicates is off.
+
     Args:
-        image_path (str): Path to input image
+        image (str | bytes | file-like): Image path, encoded image bytes or a readable buffer
         lang (str): OCR language (default: English)
+        near_duplicates (bool): Allow perceptual near-duplicate cache hits
+        layout (bool): OCR text blocks and table cells separately, in parallel,
+            and keep rows on separate lines (for multi-section reports)
+        report (bool): Keep decimal points, units and range punctuation
+            (REPORT_SYMBOLS) so lab values survive OCR
 
     Returns:
         str: Extracted and cleaned text
     """
-    # Enhance the image
-    enhanced_image = enhance_image_for_ocr(image_path)
-
-    # Tesseract configuration for improved accuracy
-    config = (
-        '--oem 3 '  # OCR Engine Mode 3 (default)
-        '--psm 6 '  # Assume a single uniform block of text
-        '-c tessedit_char_whitelist=ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789 '
-    )
+    if isinstance(image, str):
+        with open(image, 'rb') as image_file:
+            image = image_file.read()
+    elif hasattr(image, 'read'):
+        image = image.read()
+
+    whitelist, keep = (REPORT_WHITELIST, REPORT_SYMBOLS) if report else (OCR_WHITELIST, '')
+    mode = ('layout' if layout else 'page') + ('-report' if report else '')
+    scope = f"{lang}:{mode}"
+    cache_key = f"{scope}:{hashlib.sha256(image).hexdigest()}"
+    with stage("ocr_decode"):
+        gray = decode_image(image)
+        phash = dhash(gray)
+
+    cached_text = ocr_cache.get(cache_key, scope, phash if near_duplicates else None)
+    if cached_text is not None:
+        return cached_text
 
     try:
-        # Extract text
-        raw_text = pytesseract.image_to_string(enhanced_image, lang=lang, config=config)
+        cleaned_text = extract_text_by_regions(gray, lang, whitelist, keep) if layout else None
+
+        if cleaned_text is None:
+            # Enhance the image
+            with stage("ocr_enhance"):
+                enhanced_image = enhance_image_for_ocr(gray)
 
-        # Clean the text
-        cleaned_text = clean_text(raw_text)
+            # Extract text: OEM 3 (default engine), PSM 6 (a single uniform block of text)
+            with stage("ocr_tesseract"):
+                raw_text = ocr_engine.image_to_string(enhanced_image, lang=lang, psm=6, whitelist=whitelist)
+
+            # Clean the text
+            cleaned_text = clean_text(raw_text, keep)
+
+        if cleaned_text:
+            ocr_cache.put(cache_key, scope, phash, cleaned_text)
 
         return cleaned_text
 
-    except Exception as e:
-        print(f"OCR Error: {e}")
+    except Exception:
+        logger.exception("OCR failed")
         return ""
 
-def clean_text(text):
+def clean_text(text, keep=''):
     """
     Clean extracted text
 
     Args:
         text (str): Raw extracted text
+        keep (str): Punctuation to preserve besides letters and digits
 
     Returns:
         str: Cleaned text
@@ -94,7 +328,7 @@ def clean_text(text):
     text = re.sub(r'\s+', ' ', text).strip()
 
     # Optional: Remove non-alphanumeric characters
-    text = re.sub(r'[^a-zA-Z0-9\s]', '', text)
+    text = re.sub(rf'[^a-zA-Z0-9\s{re.escape(keep)}]', '', text)
 
     return text
 
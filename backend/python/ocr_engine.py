@@ -0,0 +1,175 @@
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import pytesseract
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# "auto" uses tesserocr when installed, otherwise pytesseract
+OCR_ENGINE = os.environ.get("OCR_ENGINE", "auto")
+# Number of warm Tesseract worker processes
+OCR_ENGINE_WORKERS = int(os.environ.get("OCR_ENGINE_WORKERS", os.cpu_count() or 2))
+# Languages loaded into each worker at start-up
+OCR_PRELOAD_LANGS = os.environ.get("OCR_PRELOAD_LANGS", "eng").split(",")
+
+DEFAULT_PSM = 6  # Assume a single uniform block of text
+DEFAULT_OEM = 3  # Default engine mode
+
+
+# ---------------------------------------------------------------------------
+# Worker-process side
+# ---------------------------------------------------------------------------
+
+# Per-worker Tesseract API instances, keyed by (lang, psm, whitelist)
+_worker_apis = {}
+
+
+def _worker_api(lang, psm, whitelist):
+    import tesserocr
+
+    key = (lang, psm, whitelist)
+    api = _worker_apis.get(key)
+    if api is None:
+        api = tesserocr.PyTessBaseAPI(lang=lang, psm=psm, oem=DEFAULT_OEM)
+        if whitelist:
+            api.SetVariable("tessedit_char_whitelist", whitelist)
+        _worker_apis[key] = api
+    return api
+
+
+def _init_worker(langs, psm, whitelist):
+    """Load language data once per worker so requests never pay for it."""
+    for lang in langs:
+        _worker_api(lang, psm, whitelist)
+
+
+def _recognize(image, lang, psm, whitelist):
+    """OCR a grayscale uint8 array inside a worker process."""
+    api = _worker_api(lang, psm, whitelist)
+    height, width = image.shape[:2]
+    # Raw 8-bit pixels go straight to Tesseract; no PNG round trip
+    api.SetImageBytes(image.tobytes(), width, height, 1, width)
+    return api.GetUTF8Text()
+
+
+# ---------------------------------------------------------------------------
+# Engines
+# ---------------------------------------------------------------------------
+
+class PytesseractEngine:
+    """Runs the tesseract CLI per call via pytesseract."""
+
+    name = "pytesseract"
+
+    def __init__(self, workers=OCR_ENGINE_WORKERS):
+        self.workers = workers
+
+    def image_to_string(self, image, lang="eng", psm=DEFAULT_PSM, whitelist=None):
+        config = f"--oem {DEFAULT_OEM} --psm {psm} "
+        if whitelist:
+            config += f"-c tessedit_char_whitelist={whitelist} "
+        return pytesseract.image_to_string(image, lang=lang, config=config)
+
+    def warmup(self, image):
+        """Run tesseract once, which also checks the binary and language data are installed."""
+        self.image_to_string(image)
+
+    def map(self, images, lang="eng", psm=DEFAULT_PSM, whitelist=None):
+        """OCR several images, preserving order; each call is its own tesseract process, so threads parallelise."""
+        if len(images) <= 1:
+            return [self.image_to_string(image, lang, psm, whitelist) for image in images]
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(images))) as executor:
+            return list(executor.map(lambda image: self.image_to_string(image, lang, psm, whitelist), images))
+
+    def shutdown(self):
+        pass
+
+
+class TesserocrEngine:
+    """
+    Keeps warm Tesseract API instances in a pool of worker processes.
+
+    Each worker loads its language data once at start-up, and images are
+    passed as raw pixel buffers instead of temporary PNG files.
+    """
+
+    name = "tesserocr"
+
+    def __init__(self, workers=OCR_ENGINE_WORKERS, preload_langs=OCR_PRELOAD_LANGS,
+                 psm=DEFAULT_PSM, whitelist=None):
+        self.workers = workers
+        self.preload_langs = preload_langs
+        self.psm = psm
+        self.whitelist = whitelist
+        self._pool = None
+        self._lock = threading.Lock()
+        self._fallback = PytesseractEngine()
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                # Spawn, so workers do not inherit the API process's threads and model weights
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(self.preload_langs, self.psm, self.whitelist),
+                )
+            return self._pool
+
+    def _reset_pool(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+    def submit(self, image, lang="eng", psm=DEFAULT_PSM, whitelist=None):
+        """Queue an image on the worker pool and return a Future of its text."""
+        return self._get_pool().submit(_recognize, image, lang, psm, whitelist)
+
+    def image_to_string(self, image, lang="eng", psm=DEFAULT_PSM, whitelist=None):
+        try:
+            return self.submit(image, lang, psm, whitelist).result()
+        except BrokenProcessPool:
+            logger.error("Tesseract worker pool crashed; restarting it and using pytesseract for this call")
+            self._reset_pool()
+            return self._fallback.image_to_string(image, lang, psm, whitelist)
+
+    def map(self, images, lang="eng", psm=DEFAULT_PSM, whitelist=None):
+        """OCR several images in parallel across the workers, preserving order."""
+        futures = [self.submit(image, lang, psm, whitelist) for image in images]
+        try:
+            return [future.result() for future in futures]
+        except BrokenProcessPool:
+            logger.error("Tesseract worker pool crashed; restarting it and using pytesseract for this batch")
+            self._reset_pool()
+            return self._fallback.map(images, lang, psm, whitelist)
+
+    def warmup(self, image):
+        """Start every worker (loading its language data) and recognise one image on each."""
+        self.map([image] * self.workers)
+
+    def shutdown(self):
+        self._reset_pool()
+
+
+def create_engine(name=OCR_ENGINE, **kwargs):
+    """
+    Build an OCR engine by name ("auto", "tesserocr" or "pytesseract").
+
+    "auto" picks tesserocr when it is installed and falls back to pytesseract.
+    """
+    if name in ("auto", "tesserocr"):
+        try:
+            import tesserocr  # noqa: F401
+            return TesserocrEngine(**kwargs)
+        except ImportError:
+            if name == "tesserocr":
+                raise
+            logger.info("tesserocr not installed; using pytesseract for OCR")
+    return PytesseractEngine()
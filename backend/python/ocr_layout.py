@@ -0,0 +1,128 @@
+import cv2
+import numpy as np
+
+# Regions smaller than this (in pixels of the original page) are noise
+MIN_REGION_AREA = 120
+MIN_REGION_SIDE = 8
+# Padding added around each region before OCR
+REGION_PADDING = 4
+
+
+class Region:
+    """Axis-aligned box on the page; kind is "cell" (table cell) or "text"."""
+
+    __slots__ = ("x", "y", "w", "h", "kind")
+
+    def __init__(self, x, y, w, h, kind):
+        self.x = x
+        self.y = y
+        self.w = w
+        self.h = h
+        self.kind = kind
+
+    @property
+    def center_y(self):
+        return self.y + self.h / 2
+
+    def crop(self, image, padding=REGION_PADDING):
+        height, width = image.shape[:2]
+        x0, y0 = max(self.x - padding, 0), max(self.y - padding, 0)
+        x1, y1 = min(self.x + self.w + padding, width), min(self.y + self.h + padding, height)
+        return image[y0:y1, x0:x1]
+
+    def __repr__(self):
+        return f"Region({self.kind}, x={self.x}, y={self.y}, w={self.w}, h={self.h})"
+
+
+def _binarize(gray):
+    """Ink = 255, paper = 0; adaptive so uneven lighting in phone photos is tolerated."""
+    return cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY_INV, 25, 15)
+
+
+def _ruling_lines(binary):
+    """Long horizontal and vertical strokes, i.e. table borders."""
+    height, width = binary.shape
+    horizontal = cv2.morphologyEx(
+        binary, cv2.MORPH_OPEN, cv2.getStructuringElement(cv2.MORPH_RECT, (max(width // 25, 20), 1))
+    )
+    vertical = cv2.morphologyEx(
+        binary, cv2.MORPH_OPEN, cv2.getStructuringElement(cv2.MORPH_RECT, (1, max(height // 25, 20)))
+    )
+    return horizontal, vertical
+
+
+def _is_region(w, h):
+    return w >= MIN_REGION_SIDE and h >= MIN_REGION_SIDE and w * h >= MIN_REGION_AREA
+
+
+def find_text_regions(gray):
+    """
+    Locate table cells and free-text lines on a grayscale page.
+
+    Table cells are the enclosed holes of the ruling-line grid. Remaining ink
+    is dilated horizontally so characters merge into words and lines, and each
+    connected blob becomes a text region.
+
+    Args:
+        gray (numpy.ndarray): Grayscale page
+
+    Returns:
+        list[Region]: Unordered regions that contain ink
+    """
+    binary = _binarize(gray)
+    horizontal, vertical = _ruling_lines(binary)
+    grid = cv2.bitwise_or(horizontal, vertical)
+    ink = cv2.subtract(binary, grid)
+
+    regions = []
+    if cv2.countNonZero(horizontal) and cv2.countNonZero(vertical):
+        # Close small gaps so cell borders form closed loops
+        closed = cv2.dilate(grid, np.ones((3, 3), np.uint8))
+        contours, hierarchy = cv2.findContours(closed, cv2.RETR_CCOMP, cv2.CHAIN_APPROX_SIMPLE)
+        for contour, (_, _, _, parent) in zip(contours, hierarchy[0] if hierarchy is not None else []):
+            if parent == -1:
+                continue  # outer border of a table; its holes are the cells
+            x, y, w, h = cv2.boundingRect(contour)
+            if not _is_region(w, h):
+                continue
+            cell_ink = ink[y:y + h, x:x + w]
+            if cv2.countNonZero(cell_ink) < MIN_REGION_SIDE:
+                continue  # empty cell
+            regions.append(Region(x, y, w, h, "cell"))
+            # Text inside a cell is already covered by the cell region
+            ink[y:y + h, x:x + w] = 0
+
+    # Merge characters into words and lines, but not lines into paragraphs
+    height, width = ink.shape
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (max(width // 60, 12), 3))
+    merged = cv2.dilate(ink, kernel)
+    contours, _ = cv2.findContours(merged, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    for contour in contours:
+        x, y, w, h = cv2.boundingRect(contour)
+        if _is_region(w, h):
+            regions.append(Region(x, y, w, h, "text"))
+
+    return regions
+
+
+def reading_order(regions):
+    """
+    Group regions into rows (top to bottom) with regions left to right in each row.
+
+    Regions whose vertical centres are within half a typical line height of
+    the row's first region are treated as the same row, which keeps table rows
+    and label/value pairs together.
+
+    Returns:
+        list[list[Region]]: Rows in reading order
+    """
+    if not regions:
+        return []
+    tolerance = max(float(np.median([region.h for region in regions])) / 2, MIN_REGION_SIDE / 2)
+    rows = []
+    for region in sorted(regions, key=lambda r: r.center_y):
+        if rows and abs(region.center_y - rows[-1][0].center_y) <= tolerance:
+            rows[-1].append(region)
+        else:
+            rows.append([region])
+    return [sorted(row, key=lambda r: r.x) for row in rows]
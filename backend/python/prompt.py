@@ -1,3 +1,6 @@
+# Bump whenever a prompt template changes so cached LLM responses are invalidated
+PROMPT_VERSION = "2"
+
 def create_nutrition_analysis_prompt(age, gender, description, text):
     """Nutrition analysis prompt"""
     return f"""
@@ -76,4 +79,29 @@ def create_health_report_analysis_prompt(age, gender, description, ocr_text, use
     - If the OCR data is irrelevant to the user query (e.g., the OCR data is about a urine test and the user asks about an eye check), acknowledge the discrepancy.
     - Politely inform the user that the provided data does not pertain to their question and suggest they provide relevant information or ask a different question.
     - Always prioritize the user's query and ensure the response is tailored to their needs.
-    """
\ No newline at end of file
+    """
+
+def create_lab_table_analysis_prompt(age, gender, description, lab_table, user_query):
+    """Health report analysis prompt carrying only the extracted lab-value table"""
+    return f"""
+    Patient: {age}, {gender}. Condition: {description}
+    Lab results (Flag: H high, L low, N normal vs Ref):
+{lab_table}
+    User Query: {user_query}
+
+    Be concise, professional and structured in points.
+    Provide: 1. Key findings, focusing on H/L results. 2. Risks for the patient. 3. Recommendations.
+    If the results are unrelated to the query, say so and ask for relevant information.
+    """
+
+def create_sentiment_explanation_prompt(text, sentiment, drivers):
+    """Prompt for the optional generative sentiment explanation"""
+    phrases = ", ".join(f'"{driver["phrase"]}" ({driver["valence"]:+.1f})' for driver in drivers[:6]) or "none"
+    return f"""
+    Statement: "{text}"
+    Overall sentiment: {sentiment}
+    Phrases driving the sentiment (VADER valence): {phrases}
+
+    In 3-5 sentences, explain how the user feels and the likely reasons, referring to the phrases above.
+    Be empathetic and do not speculate beyond the statement.
+    """
@@ -0,0 +1,235 @@
+import atexit
+import itertools
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from functools import lru_cache
+
+# Fraction of requests whose trace is written to the log. Override per route with
+# LOG_SAMPLE_<ROUTE>, e.g. LOG_SAMPLE_HEALTH_OCR=1 for /health-ocr. Server errors and
+# slow requests are always logged; every trace goes to the in-memory buffer regardless.
+LOG_SAMPLE_RATE = float(os.environ.get("LOG_SAMPLE_RATE", "0.1"))
+# Requests at least this slow are always logged, in milliseconds
+LOG_SLOW_MS = float(os.environ.get("LOG_SLOW_MS", "5000"))
+# Longest string kept in a trace field or debug log line; the rest is replaced by its length
+LOG_MAX_FIELD_CHARS = int(os.environ.get("LOG_MAX_FIELD_CHARS", "120"))
+# Recent request traces kept for /debug/traces
+TRACE_BUFFER_SIZE = int(os.environ.get("TRACE_BUFFER_SIZE", "256"))
+# Log records waiting for the writer thread; beyond this they are dropped instead of blocking a request
+LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", "10000"))
+
+logger = logging.getLogger(__name__)
+
+
+def truncate(value, max_chars=LOG_MAX_FIELD_CHARS):
+    """Cut long strings to max_chars, noting the original length; other values pass through."""
+    if isinstance(value, str) and len(value) > max_chars:
+        return f"{value[:max_chars]}... [{len(value)} chars]"
+    return value
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that counts and drops records when the queue is full rather than raising or blocking."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_listener = None
+_queue_handler = None
+
+
+def configure_logging(level=logging.INFO):
+    """
+    Route every log record through a bounded queue to a writer thread.
+
+    The handlers the root logger already has (the modules' basicConfig
+    StreamHandler) are moved behind a QueueListener, so a request thread only
+    enqueues its record and never waits on stderr. Safe to call more than once.
+
+    Returns:
+        logging.handlers.QueueListener: The running listener
+    """
+    global _listener, _queue_handler
+    if _listener is not None:
+        return _listener
+
+    root = logging.getLogger()
+    handlers = root.handlers[:] or [logging.StreamHandler()]
+    for handler in handlers:
+        root.removeHandler(handler)
+        if handler.formatter is None:
+            handler.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+
+    log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    _queue_handler = DroppingQueueHandler(log_queue)
+    root.addHandler(_queue_handler)
+    root.setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    # Flush what is still queued when the process exits
+    atexit.register(_listener.stop)
+    return _listener
+
+
+def logging_stats():
+    if _queue_handler is None:
+        return {"queued": None, "dropped": None}
+    return {"queued": _queue_handler.queue.qsize(), "dropped": _queue_handler.dropped}
+
+
+# ---------------------------------------------------------------------------
+# Request traces
+# ---------------------------------------------------------------------------
+
+class RequestTrace:
+    """
+    Timing and small annotations of one request.
+
+    Stages are aggregated by name (count and total milliseconds) and string
+    fields are truncated when set, so a trace stays the same size however
+    many tokens or OCR regions the request produced.
+    """
+
+    __slots__ = ("id", "method", "path", "route", "status", "started_at", "_started", "duration_ms", "stages", "fields")
+
+    _ids = itertools.count(1)
+
+    def __init__(self, method, path):
+        self.id = f"{os.getpid():x}-{next(self._ids):x}"
+        self.method = method
+        self.path = path
+        self.route = None
+        self.status = None
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+        self.duration_ms = None
+        self.stages = {}
+        self.fields = {}
+
+    def add_stage(self, name, seconds):
+        totals = self.stages.get(name)
+        if totals is None:
+            totals = self.stages[name] = [0, 0.0]
+        totals[0] += 1
+        totals[1] += seconds * 1000
+
+    def set(self, **fields):
+        for key, value in fields.items():
+            self.fields[key] = truncate(value)
+
+    def finish(self, status, route=None):
+        self.status = status
+        self.route = route or self.path
+        self.duration_ms = round((time.perf_counter() - self._started) * 1000, 2)
+
+    def as_dict(self):
+        return {
+            "id": self.id,
+            "method": self.method,
+            "route": self.route or self.path,
+            "path": self.path,
+            "status": self.status,
+            "started_at": self.started_at,
+            "duration_ms": self.duration_ms,
+            "stages": {name: {"count": count, "ms": round(ms, 2)} for name, (count, ms) in self.stages.items()},
+            "fields": dict(self.fields),
+        }
+
+    def summary(self):
+        """One bounded log line: request line, status, duration, stages and fields."""
+        stages = " ".join(f"{name}={ms:.1f}ms" for name, (_, ms) in self.stages.items())
+        fields = " ".join(f"{key}={value}" for key, value in self.fields.items())
+        return (f"{self.method} {self.route} {self.status} {self.duration_ms:.1f}ms trace={self.id}"
+                + (f" {stages}" if stages else "") + (f" {fields}" if fields else ""))
+
+
+# The trace of the request being handled; copied into worker-pool jobs by the scheduler
+current_trace = ContextVar("current_trace", default=None)
+
+
+def annotate(**fields):
+    """Attach small fields (sizes, counts, ids - never raw text) to the current request's trace, if any."""
+    trace = current_trace.get()
+    if trace is not None:
+        trace.set(**fields)
+
+
+@lru_cache(maxsize=None)
+def sample_rate(route):
+    """LOG_SAMPLE_<ROUTE> for the route template, e.g. /llm-chat/stream -> LOG_SAMPLE_LLM_CHAT_STREAM."""
+    name = "".join(char if char.isalnum() else "_" for char in route.strip("/")).upper()
+    return float(os.environ.get(f"LOG_SAMPLE_{name}", LOG_SAMPLE_RATE))
+
+
+class TraceLog:
+    """Ring buffer of recent request traces, with sampled one-line logging of each."""
+
+    def __init__(self, size=TRACE_BUFFER_SIZE, slow_ms=LOG_SLOW_MS):
+        self._traces = deque(maxlen=size)
+        self._lock = threading.Lock()
+        self.slow_ms = slow_ms
+        self.finished = 0
+        self.logged = 0
+
+    def start(self, method, path):
+        """Begin a trace and make it current; returns (trace, token) for finish()."""
+        trace = RequestTrace(method, path)
+        return trace, current_trace.set(trace)
+
+    def finish(self, trace, token, status, route=None):
+        trace.finish(status, route)
+        current_trace.reset(token)
+        log = status >= 500 or trace.duration_ms >= self.slow_ms or random.random() < sample_rate(trace.route)
+        with self._lock:
+            self._traces.append(trace)
+            self.finished += 1
+            self.logged += log
+        if log:
+            logger.log(logging.WARNING if status >= 500 else logging.INFO, trace.summary())
+
+    def recent(self, limit=50, route=None, min_ms=None, min_status=None):
+        """Newest traces first, optionally filtered by route template, duration and status."""
+        with self._lock:
+            traces = list(self._traces)
+        matches = []
+        for trace in reversed(traces):
+            if route is not None and trace.route != route:
+                continue
+            if min_ms is not None and trace.duration_ms < min_ms:
+                continue
+            if min_status is not None and trace.status < min_status:
+                continue
+            matches.append(trace.as_dict())
+            if len(matches) >= limit:
+                break
+        return matches
+
+    def stats(self):
+        with self._lock:
+            return {
+                "buffered": len(self._traces),
+                "buffer_size": self._traces.maxlen,
+                "finished": self.finished,
+                "logged": self.logged,
+                "sample_rate": LOG_SAMPLE_RATE,
+                "slow_ms": self.slow_ms,
+                **logging_stats(),
+            }
+
+
+trace_log = TraceLog()
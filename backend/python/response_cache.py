@@ -0,0 +1,144 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Disable with RESPONSE_CACHE=0
+RESPONSE_CACHE_ENABLED = os.environ.get("RESPONSE_CACHE", "1") == "1"
+# Entries kept in the in-memory tier
+RESPONSE_CACHE_SIZE = int(os.environ.get("RESPONSE_CACHE_SIZE", "512"))
+# Optional SQLite file for the on-disk tier (empty = memory only)
+RESPONSE_CACHE_DB = os.environ.get("RESPONSE_CACHE_DB", "")
+# Lifetime of on-disk entries, in seconds
+RESPONSE_CACHE_TTL_SECONDS = float(os.environ.get("RESPONSE_CACHE_TTL_SECONDS", "86400"))
+# Generate greedily on LLM endpoints so a cached answer is the answer; without it
+# their responses are sampled and are not cached
+CACHE_DETERMINISTIC = os.environ.get("CACHE_DETERMINISTIC", "0") == "1"
+
+
+def normalize(value, exact=False):
+    """Normalise an input for hashing: collapse whitespace and case-fold text (unless exact)."""
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return hashlib.sha256(value).hexdigest()
+    if value is None:
+        return ""
+    if exact:
+        return str(value)
+    return re.sub(r"\s+", " ", str(value)).strip().casefold()
+
+
+def make_key(namespace, *parts, exact=False):
+    """
+    Content-addressed key for an endpoint and its normalised inputs.
+
+    Pass exact=True when the response depends on case or spacing (VADER
+    scores "GREAT!!" above "great") or echoes the input back.
+    """
+    digest = hashlib.sha256(namespace.encode("utf-8"))
+    for part in parts:
+        digest.update(b"\x1f")
+        digest.update(normalize(part, exact).encode("utf-8"))
+    return f"{namespace}:{digest.hexdigest()}"
+
+
+class ResponseCache:
+    """
+    Two-tier cache for responses of stateless endpoints.
+
+    The memory tier is an LRU of at most max_entries items. The optional disk
+    tier is a SQLite table whose entries expire after ttl_seconds; disk hits
+    are promoted back into memory.
+    """
+
+    def __init__(self, max_entries=RESPONSE_CACHE_SIZE, db_path=RESPONSE_CACHE_DB,
+                 ttl_seconds=RESPONSE_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._memory = OrderedDict()  # key -> (stored_at, value)
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._conn = None
+        if db_path:
+            self._conn = sqlite3.connect(db_path, check_same_thread=False)
+            # API workers share the file; WAL lets them read while another writes
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, stored_at REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "DELETE FROM responses WHERE stored_at < ?", (time.time() - ttl_seconds,)
+            )
+            self._conn.commit()
+
+    def _expired(self, stored_at):
+        return self.ttl_seconds and time.time() - stored_at > self.ttl_seconds
+
+    def get(self, key):
+        """Return the cached value for key, or None."""
+        with self._lock:
+            item = self._memory.get(key)
+            if item is not None and not self._expired(item[0]):
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return item[1]
+            if item is not None:
+                del self._memory[key]
+
+            if self._conn is not None:
+                row = self._conn.execute(
+                    "SELECT value, stored_at FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and not self._expired(row[1]):
+                    value = json.loads(row[0])
+                    self._remember(key, row[1], value)
+                    self.disk_hits += 1
+                    return value
+
+            self.misses += 1
+            return None
+
+    def set(self, key, value):
+        stored_at = time.time()
+        with self._lock:
+            self._remember(key, stored_at, value)
+            if self._conn is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, value, stored_at) VALUES (?, ?, ?)",
+                    (key, json.dumps(value), stored_at),
+                )
+                self._conn.commit()
+
+    def _remember(self, key, stored_at, value):
+        """Insert into the memory tier. Caller must hold the lock."""
+        self._memory[key] = (stored_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self._memory),
+                "max_entries": self.max_entries,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.memory_hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+                "persistent": self._conn is not None,
+                "deterministic": CACHE_DETERMINISTIC,
+            }
+
+
+response_cache = ResponseCache() if RESPONSE_CACHE_ENABLED else None
@@ -0,0 +1,165 @@
+import asyncio
+import contextvars
+import functools
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import QUEUE_WAIT_SECONDS
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class PoolSaturated(Exception):
+    """Raised when a workload pool has no free worker or queue slot."""
+
+    def __init__(self, pool_name, retry_after):
+        super().__init__(f"The '{pool_name}' workload is at capacity, please retry later")
+        self.pool_name = pool_name
+        self.retry_after = retry_after
+
+
+class WorkloadPool:
+    """
+    Bounded thread pool for one class of blocking work (LLM, OCR, ASR, ...).
+
+    At most max_workers jobs run at once and at most max_queue more wait for a
+    worker. Anything beyond that is rejected immediately with PoolSaturated so
+    the API can shed load instead of piling up requests.
+    """
+
+    def __init__(self, name, max_workers, max_queue, retry_after=5):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.retry_after = retry_after
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"{name}-worker")
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._running = 0
+        self.completed = 0
+        self.rejected = 0
+        self.failed = 0
+        self.total_wait_seconds = 0.0
+
+    @property
+    def capacity(self):
+        return self.max_workers + self.max_queue
+
+    def _reserve(self):
+        with self._lock:
+            if self._pending >= self.capacity:
+                self.rejected += 1
+                raise PoolSaturated(self.name, self.retry_after)
+            self._pending += 1
+
+    def admit(self):
+        """
+        Raise PoolSaturated if a job submitted now would be rejected, without
+        reserving a slot (for connections whose jobs arrive later).
+        """
+        with self._lock:
+            if self._pending >= self.capacity:
+                self.rejected += 1
+                raise PoolSaturated(self.name, self.retry_after)
+
+    def _call(self, submitted_at, fn):
+        waited = time.perf_counter() - submitted_at
+        QUEUE_WAIT_SECONDS.observe(waited, queue=self.name)
+        with self._lock:
+            self._running += 1
+            self.total_wait_seconds += waited
+        try:
+            return fn()
+        finally:
+            with self._lock:
+                self._running -= 1
+
+    def _release(self, future):
+        with self._lock:
+            self._pending -= 1
+            if future.cancelled() or future.exception() is not None:
+                self.failed += 1
+            else:
+                self.completed += 1
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Submit a blocking callable and return a concurrent.futures.Future.
+
+        Raises:
+            PoolSaturated: If all workers are busy and the queue is full
+        """
+        self._reserve()
+        # Run in a copy of the caller's context, so the job's stages land in the request's trace
+        call = functools.partial(contextvars.copy_context().run, fn, *args, **kwargs)
+        try:
+            future = self._executor.submit(self._call, time.perf_counter(), call)
+        except BaseException:
+            with self._lock:
+                self._pending -= 1
+            raise
+        # Release the slot when the job really finishes (or is cancelled before
+        # starting), not when the awaiting request goes away
+        future.add_done_callback(self._release)
+        return future
+
+    async def run(self, fn, *args, **kwargs):
+        """
+        Run a blocking callable on this pool without blocking the event loop.
+
+        Raises:
+            PoolSaturated: If all workers are busy and the queue is full
+        """
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def stats(self):
+        with self._lock:
+            started = self.completed + self.failed
+            return {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "running": self._running,
+                "queued": self._pending - self._running,
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "avg_queue_wait_seconds": round(self.total_wait_seconds / started, 4) if started else 0.0,
+            }
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+
+def _pool_from_env(name, default_workers, default_queue, default_retry_after):
+    prefix = name.upper()
+    return WorkloadPool(
+        name,
+        max_workers=int(os.environ.get(f"{prefix}_WORKERS", default_workers)),
+        max_queue=int(os.environ.get(f"{prefix}_QUEUE", default_queue)),
+        retry_after=int(os.environ.get(f"{prefix}_RETRY_AFTER", default_retry_after)),
+    )
+
+
+# One pool per workload class. Limits can be overridden with <NAME>_WORKERS,
+# <NAME>_QUEUE and <NAME>_RETRY_AFTER environment variables.
+pools = {
+    # LLM workers only wait on the batching engine, so allow one per batch slot
+    "llm": _pool_from_env("llm", int(os.environ.get("LLM_MAX_BATCH_SIZE", "8")), 16, 30),
+    "ocr": _pool_from_env("ocr", os.cpu_count() or 2, 32, 5),
+    # ASR workers hand VAD chunks to the Whisper worker processes and wait, so allow one per process
+    "asr": _pool_from_env("asr", max(int(os.environ.get("ASR_PROCESS_WORKERS", "2")), 1), 8, 15),
+    "sentiment": _pool_from_env("sentiment", 2, 64, 2),
+}
+
+
+async def run_in_pool(pool_name, fn, *args, **kwargs):
+    """Run a blocking callable on the named workload pool."""
+    return await pools[pool_name].run(fn, *args, **kwargs)
+
+
+def pool_stats():
+    return {name: pool.stats() for name, pool in pools.items()}
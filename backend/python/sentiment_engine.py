@@ -0,0 +1,417 @@
+import hashlib
+import itertools
+import logging
+import multiprocessing
+import os
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Bump whenever the explanation wording changes so cached responses are invalidated
+EXPLANATION_VERSION = "1"
+# Phrases named in an explanation, per direction
+MAX_DRIVERS = 3
+# Also generate an LLM explanation in the background and serve it once cached
+SENTIMENT_GENERATIVE = os.environ.get("SENTIMENT_GENERATIVE", "0") == "1"
+# Generated explanations kept in memory
+SENTIMENT_GENERATIVE_CACHE_SIZE = int(os.environ.get("SENTIMENT_GENERATIVE_CACHE_SIZE", "1024"))
+# Worker processes for large batches (0 = always score in-process)
+SENTIMENT_PROCESSES = int(os.environ.get("SENTIMENT_PROCESSES", os.cpu_count() or 2))
+# Texts per task sent to a worker process
+SENTIMENT_CHUNK_SIZE = int(os.environ.get("SENTIMENT_CHUNK_SIZE", "256"))
+# Batches smaller than this are scored in-process; pickling would cost more than it saves
+SENTIMENT_PARALLEL_MIN = int(os.environ.get("SENTIMENT_PARALLEL_MIN", "1024"))
+# Most texts accepted by one batch request
+SENTIMENT_BATCH_MAX = int(os.environ.get("SENTIMENT_BATCH_MAX", "100000"))
+
+try:
+    # Internals used to recover per-token valences from the same pass that scores the text
+    from vaderSentiment.vaderSentiment import BOOSTER_DICT, NEGATE, SentiText
+except ImportError:
+    BOOSTER_DICT = NEGATE = SentiText = None
+
+# VADER loads its lexicon and emoji table from disk; do it once per process
+analyzer = SentimentIntensityAnalyzer()
+
+
+def label(compound):
+    return "Positive" if compound >= 0.05 else "Negative" if compound <= -0.05 else "Neutral"
+
+
+def _replace_emojis(text):
+    """Swap emojis for their VADER descriptions, exactly as polarity_scores does."""
+    if not any(char in analyzer.emojis for char in text):
+        return text.strip()
+    parts = []
+    prev_space = True
+    for char in text:
+        if char in analyzer.emojis:
+            if not prev_space:
+                parts.append(" ")
+            parts.append(analyzer.emojis[char])
+            prev_space = False
+        else:
+            parts.append(char)
+            prev_space = char == " "
+    return "".join(parts).strip()
+
+
+def _token_valences(text):
+    """
+    Score text with VADER and keep each token's valence.
+
+    Mirrors SentimentIntensityAnalyzer.polarity_scores, so the scores are
+    identical, but returns the per-token valence list it normally discards.
+
+    Returns:
+        tuple[dict, list[str], list[float]]: (scores, tokens, valences)
+    """
+    text = _replace_emojis(text)
+    sentitext = SentiText(text)
+    words = sentitext.words_and_emoticons
+    sentiments = []
+    for i, item in enumerate(words):
+        lowered = item.lower()
+        if lowered in BOOSTER_DICT or (lowered == "kind" and i < len(words) - 1 and words[i + 1].lower() == "of"):
+            sentiments.append(0)
+            continue
+        sentiments = analyzer.sentiment_valence(0, sentitext, item, i, sentiments)
+    sentiments = analyzer._but_check(words, sentiments)
+    return analyzer.score_valence(sentiments, text), words, sentiments
+
+
+def _phrase(words, index):
+    """The token at index plus the boosters and negations directly in front of it."""
+    start = index
+    while start > 0 and index - start < 3:
+        previous = words[start - 1].lower()
+        if previous in BOOSTER_DICT or previous in NEGATE or previous.endswith("n't"):
+            start -= 1
+        else:
+            break
+    return " ".join(words[start:index + 1])
+
+
+def analyze(text):
+    """
+    VADER scores plus the phrases that drive them.
+
+    Args:
+        text (str): Text to score
+
+    Returns:
+        dict: {"sentiment", "scores", "drivers"}; drivers are
+            {"phrase", "valence"} sorted by absolute contribution
+    """
+    try:
+        scores, words, valences = _token_valences(text)
+    except (AttributeError, TypeError):
+        # A vaderSentiment release without the internals above; score only
+        scores, words, valences = analyzer.polarity_scores(text), [], []
+
+    drivers = [
+        {"phrase": _phrase(words, i), "valence": round(float(valence), 3)}
+        for i, valence in enumerate(valences)
+        if valence
+    ]
+    drivers.sort(key=lambda driver: abs(driver["valence"]), reverse=True)
+    return {"sentiment": label(scores["compound"]), "scores": scores, "drivers": drivers}
+
+
+def _quoted(drivers):
+    return ", ".join(f"\"{driver['phrase']}\" ({driver['valence']:+.1f})" for driver in drivers)
+
+
+def explain(text, sentiment_data):
+    """
+    Deterministic explanation naming the phrases behind the score.
+
+    Args:
+        text (str): The scored text
+        sentiment_data (dict): Result of analyze()
+
+    Returns:
+        str: A few sentences for the user
+    """
+    sentiment = sentiment_data["sentiment"]
+    scores = sentiment_data["scores"]
+    drivers = sentiment_data.get("drivers", [])
+    positive = [driver for driver in drivers if driver["valence"] > 0][:MAX_DRIVERS]
+    negative = [driver for driver in drivers if driver["valence"] < 0][:MAX_DRIVERS]
+
+    sentences = [
+        f"The statement comes across as {sentiment.lower()} (compound score {scores['compound']:+.2f}; "
+        f"{scores['pos'] * 100:.0f}% positive, {scores['neg'] * 100:.0f}% negative, "
+        f"{scores['neu'] * 100:.0f}% neutral)."
+    ]
+    if not drivers:
+        sentences.append("It contains no strongly emotional words, so the user seems to be stating facts "
+                         "rather than expressing a feeling.")
+        return " ".join(sentences)
+
+    if positive:
+        sentences.append(f"Positive feeling comes from {_quoted(positive)}.")
+    if negative:
+        sentences.append(f"Negative feeling comes from {_quoted(negative)}.")
+    if any(" " in driver["phrase"] for driver in positive + negative):
+        sentences.append("Intensifiers and negations in front of these words strengthen or flip them.")
+    if " but " in f" {text.lower()} ":
+        sentences.append("What follows \"but\" weighs more than what precedes it, so the later clause "
+                         "reflects the user's feeling best.")
+
+    if positive and negative:
+        stronger = "positive" if scores["pos"] >= scores["neg"] else "negative"
+        sentences.append(f"The user has mixed feelings, with the {stronger} side weighing more overall.")
+    elif sentiment == "Negative":
+        sentences.append("The user seems to be struggling with or worried about what they describe.")
+    elif sentiment == "Positive":
+        sentences.append("The user seems content or hopeful about what they describe.")
+    return " ".join(sentences)
+
+
+def score(text, drivers=False):
+    """Label and scores for one text; with drivers, the analyze() result."""
+    if drivers:
+        return analyze(text)
+    scores = analyzer.polarity_scores(text)
+    return {"sentiment": label(scores["compound"]), "scores": scores}
+
+
+def score_texts(texts, drivers=False):
+    """Score a list of texts in this process (also the worker-process task)."""
+    return [score(text, drivers) for text in texts]
+
+
+class SentimentFanout:
+    """
+    Scores large batches across worker processes, preserving input order.
+
+    Each spawned worker imports this module once and so builds its own
+    shared analyzer. Texts go out in chunks; at most max_in_flight chunks are
+    queued at a time, so arbitrarily long inputs stream through in bounded
+    memory and results come back in order as soon as the head chunk is done.
+    """
+
+    def __init__(self, processes=SENTIMENT_PROCESSES, chunk_size=SENTIMENT_CHUNK_SIZE,
+                 parallel_min=SENTIMENT_PARALLEL_MIN):
+        self.processes = processes
+        self.chunk_size = chunk_size
+        self.parallel_min = parallel_min
+        self.max_in_flight = max(processes, 1) * 2
+        self._pool = None
+        self._lock = threading.Lock()
+        self.texts = 0
+        self.parallel_texts = 0
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                # Spawn, so workers do not inherit the API process's threads and model weights
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.processes, mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._pool
+
+    def submit(self, texts, drivers=False, launch=None):
+        """
+        Score one chunk on a worker process (in-process when processes is 0); returns a Future.
+
+        Args:
+            texts (list[str]): Texts to score
+            drivers (bool): Include the phrases driving each score
+            launch (callable): Runs fn(*args) in-process and returns a Future (e.g. a
+                WorkloadPool's submit); without it in-process chunks are scored on the calling thread
+        """
+        with self._lock:
+            self.texts += len(texts)
+        if self.processes <= 0:
+            if launch is not None:
+                return launch(score_texts, texts, drivers)
+            future = Future()
+            future.set_result(score_texts(texts, drivers))
+            return future
+        with self._lock:
+            self.parallel_texts += len(texts)
+        return self._get_pool().submit(score_texts, texts, drivers)
+
+    def map(self, texts, drivers=False):
+        """
+        Score an iterable of texts, yielding results in input order.
+
+        Args:
+            texts (Iterable[str]): Texts; consumed lazily
+            drivers (bool): Include the phrases driving each score
+
+        Yields:
+            dict: One result per text
+        """
+        texts = iter(texts)
+        head = list(itertools.islice(texts, self.parallel_min))
+        if len(head) < self.parallel_min or self.processes <= 0:
+            for text in itertools.chain(head, texts):
+                with self._lock:
+                    self.texts += 1
+                yield score(text, drivers)
+            return
+
+        remaining = itertools.chain(head, texts)
+        window = deque()
+        while True:
+            chunk = list(itertools.islice(remaining, self.chunk_size))
+            if chunk:
+                window.append(self.submit(chunk, drivers))
+            if window and (not chunk or len(window) >= self.max_in_flight):
+                yield from window.popleft().result()
+            if not chunk and not window:
+                return
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+    def stats(self):
+        with self._lock:
+            return {
+                "processes": self.processes,
+                "chunk_size": self.chunk_size,
+                "texts": self.texts,
+                "parallel_texts": self.parallel_texts,
+            }
+
+
+sentiment_fanout = SentimentFanout()
+
+
+def score_batch(texts, drivers=False):
+    """Score many texts, fanning out across processes for large batches; yields results in order."""
+    return sentiment_fanout.map(texts, drivers)
+
+
+def sentiment_timeline(segments, window=3):
+    """
+    Sentiment over time for a timestamped transcript.
+
+    Args:
+        segments (list[dict]): {"start", "end", "text"} segments, in order
+        window (int): Segments in the trailing mean that smooths the curve
+
+    Returns:
+        list[dict]: Per segment: start, end, text, sentiment, compound and
+            the rolling mean of compound over the last window segments
+    """
+    timeline = []
+    recent = deque(maxlen=window)
+    for segment in segments:
+        scores = analyzer.polarity_scores(segment["text"])
+        recent.append(scores["compound"])
+        timeline.append({
+            "start": segment["start"],
+            "end": segment["end"],
+            "text": segment["text"],
+            "sentiment": label(scores["compound"]),
+            "compound": scores["compound"],
+            "rolling_compound": round(sum(recent) / len(recent), 4),
+        })
+    return timeline
+
+
+class GenerativeExplainer:
+    """
+    Optional LLM explanations, generated off the request path.
+
+    Requests never wait for the LLM: cached() returns a generated
+    explanation once one exists, and schedule() queues generation with the
+    supplied launcher so a later request for the same text gets it.
+    """
+
+    def __init__(self, generate, launch, max_entries=SENTIMENT_GENERATIVE_CACHE_SIZE):
+        self.generate = generate  # prompt -> text
+        self.launch = launch  # (fn, *args) -> Future; may raise to refuse work
+        self.max_entries = max_entries
+        self._cache = OrderedDict()
+        self._in_flight = set()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.scheduled = 0
+        self.refused = 0
+
+    @staticmethod
+    def _key(text):
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def cached(self, text):
+        key = self._key(text)
+        with self._lock:
+            explanation = self._cache.get(key)
+            if explanation is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+            return explanation
+
+    def schedule(self, text, prompt):
+        key = self._key(text)
+        with self._lock:
+            if key in self._cache or key in self._in_flight:
+                return
+            self._in_flight.add(key)
+        try:
+            future = self.launch(self.generate, prompt)
+        except Exception as e:
+            # Busy LLM: the lexicon explanation stands, and a later request may retry
+            with self._lock:
+                self._in_flight.discard(key)
+                self.refused += 1
+            logger.debug(f"Generative explanation not scheduled: {e}")
+            return
+        with self._lock:
+            self.scheduled += 1
+        future.add_done_callback(lambda done: self._store(key, done))
+
+    def _store(self, key, future):
+        with self._lock:
+            self._in_flight.discard(key)
+            if future.cancelled() or future.exception() is not None:
+                return
+            explanation = (future.result() or "").strip()
+            if explanation:
+                self._cache[key] = explanation
+                while len(self._cache) > self.max_entries:
+                    self._cache.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._cache),
+                "in_flight": len(self._in_flight),
+                "hits": self.hits,
+                "scheduled": self.scheduled,
+                "refused": self.refused,
+            }
+
+
+def explain_feelings(text, sentiment_data, generative=None, prompt=None):
+    """
+    Explanation for a scored text, and where it came from.
+
+    Args:
+        text (str): The scored text
+        sentiment_data (dict): Result of analyze()
+        generative (GenerativeExplainer): Optional background LLM explainer
+        prompt (str): Prompt for the generative explainer
+
+    Returns:
+        tuple[str, str]: (explanation, "generative" or "lexicon")
+    """
+    if generative is not None:
+        generated = generative.cached(text)
+        if generated is not None:
+            return generated, "generative"
+        generative.schedule(text, prompt)
+    return explain(text, sentiment_data), "lexicon"
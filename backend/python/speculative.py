@@ -0,0 +1,173 @@
+import logging
+import os
+import threading
+import time
+
+from metrics import LLM_TOKENS, LLM_TOKENS_PER_SECOND
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Small model that drafts tokens for the main model to verify. One that shares
+# the main model's tokenizer (e.g. meta-llama/Llama-3.2-1B-Instruct for Llama 3)
+# drafts fastest; others work through transformers' universal assisted decoding.
+LLM_DRAFT_MODEL = os.environ.get("LLM_DRAFT_MODEL", "Qwen/Qwen1.5-0.5B-Chat")
+# Tokens drafted per verification step; transformers adapts it as acceptance changes
+SPECULATIVE_DRAFT_TOKENS = int(os.environ.get("SPECULATIVE_DRAFT_TOKENS", "5"))
+
+
+class ForwardCounter:
+    """Counts a module's forward passes made by the current thread while counting is on."""
+
+    def __init__(self, module):
+        self._local = threading.local()
+        module.register_forward_hook(self._hook)
+
+    def _hook(self, module, args, output):
+        if getattr(self._local, "count", None) is not None:
+            self._local.count += 1
+
+    def start(self):
+        self._local.count = 0
+
+    def stop(self):
+        count, self._local.count = self._local.count, None
+        return count
+
+
+class SpeculativeStats:
+    """
+    Forward passes and throughput of speculative generations.
+
+    Only forward passes are counted, not the tokens each one proposed or
+    accepted. tokens_per_target_pass is exact and is what speculation gains.
+    With a shared tokenizer every draft pass proposes one token and every
+    target pass adds one token of its own, so the acceptance rate can be
+    estimated from the counts; with different tokenizers drafts are
+    re-tokenized for the target and no such estimate holds.
+    """
+
+    def __init__(self, shared_tokenizer=True):
+        self._lock = threading.Lock()
+        self.shared_tokenizer = shared_tokenizer
+        self.generations = 0
+        self.tokens = 0
+        self.target_passes = 0
+        self.draft_passes = 0
+        self.seconds = 0.0
+
+    def record(self, tokens, target_passes, draft_passes, seconds):
+        with self._lock:
+            self.generations += 1
+            self.tokens += tokens
+            self.target_passes += target_passes
+            self.draft_passes += draft_passes
+            self.seconds += seconds
+
+    def as_dict(self):
+        with self._lock:
+            estimated_acceptance = None
+            if self.shared_tokenizer and self.draft_passes:
+                estimated_acceptance = round(max(self.tokens - self.target_passes, 0) / self.draft_passes, 3)
+            return {
+                "generations": self.generations,
+                "generated_tokens": self.tokens,
+                "target_passes": self.target_passes,
+                "draft_passes": self.draft_passes,
+                "tokens_per_target_pass": round(self.tokens / self.target_passes, 2) if self.target_passes else None,
+                "estimated_acceptance_rate": estimated_acceptance,
+                "tokens_per_second": round(self.tokens / self.seconds, 2) if self.seconds else None,
+            }
+
+
+class SpeculativeDecoder:
+    """
+    Assisted generation: the draft model proposes a few tokens, and the target
+    model checks them all in one forward pass, keeping the longest prefix it
+    agrees with plus one token of its own.
+
+    Greedy output is token-for-token identical to the target model alone, and
+    sampled output follows the target's distribution (transformers verifies
+    drafts by speculative sampling), so quality is unchanged; only the number
+    of memory-bound target passes per token drops. Assisted generation is
+    single-sequence, so these calls bypass the batcher and the KV-cache reuse.
+    """
+
+    def __init__(self, target, draft, num_draft_tokens=SPECULATIVE_DRAFT_TOKENS):
+        """
+        Args:
+            target (llm_backends.LLMBackend): Loaded main model
+            draft (llm_backends.LLMBackend): Loaded draft model, from the same backend family
+            num_draft_tokens (int): Initial tokens drafted per step
+        """
+        if not (target.supports_speculative and draft.supports_speculative):
+            raise ValueError(f"The {target.name} backend does not support speculative decoding")
+        self.target = target
+        self.draft = draft
+        self.same_tokenizer = target.tokenizer.get_vocab() == draft.tokenizer.get_vocab()
+        draft.model.generation_config.num_assistant_tokens = num_draft_tokens
+        draft.model.generation_config.num_assistant_tokens_schedule = "heuristic"
+        self._target_passes = ForwardCounter(target.model)
+        self._draft_passes = ForwardCounter(draft.model)
+        self.generation_stats = SpeculativeStats(shared_tokenizer=self.same_tokenizer)
+        logger.info(
+            f"Speculative decoding with draft {draft.model_name} "
+            f"({'shared' if self.same_tokenizer else 'different'} tokenizer)"
+        )
+
+    def generate(self, prompt, streamer=None, **overrides):
+        """
+        Generate a completion for a chat-formatted prompt.
+
+        Args:
+            prompt (str): Full chat-formatted prompt
+            streamer: Optional transformers streamer
+            **overrides: Generation settings overriding the target's defaults
+
+        Returns:
+            str: Decoded completion
+        """
+        import torch
+
+        tokenizer = self.target.tokenizer
+        inputs = tokenizer(prompt, return_tensors="pt").to(self.target.model.device)
+        assisted = {"assistant_model": self.draft.model}
+        if not self.same_tokenizer:
+            assisted.update(tokenizer=tokenizer, assistant_tokenizer=self.draft.tokenizer)
+
+        self._target_passes.start()
+        self._draft_passes.start()
+        started = time.perf_counter()
+        try:
+            with torch.inference_mode():
+                output_ids = self.target.model.generate(
+                    **inputs,
+                    streamer=streamer,
+                    pad_token_id=tokenizer.pad_token_id or tokenizer.eos_token_id,
+                    **assisted,
+                    **{**self.target.generation_kwargs, **overrides},
+                )
+        finally:
+            target_passes = self._target_passes.stop()
+            draft_passes = self._draft_passes.stop()
+
+        new_tokens = output_ids[0, inputs["input_ids"].shape[1]:]
+        seconds = time.perf_counter() - started
+        self.generation_stats.record(len(new_tokens), target_passes, draft_passes, seconds)
+        LLM_TOKENS.inc(len(new_tokens), direction="out")
+        LLM_TOKENS_PER_SECOND.observe(len(new_tokens) / seconds)
+        return tokenizer.decode(new_tokens, skip_special_tokens=True)
+
+    def stats(self):
+        stats = {
+            "draft_model": self.draft.model_name,
+            "shared_tokenizer": self.same_tokenizer,
+            **self.generation_stats.as_dict(),
+        }
+        if not self.same_tokenizer:
+            stats["note"] = (
+                f"{self.draft.model_name} and {self.target.model_name} use different tokenizers, so drafts "
+                "are re-tokenized for the target and no acceptance rate is estimated; "
+                "compare tokens_per_target_pass with 1.0 instead"
+            )
+        return stats
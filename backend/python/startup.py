@@ -0,0 +1,134 @@
+import logging
+import os
+import threading
+import time
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# How models are brought up when the server starts:
+#   background - accept requests at once; load and warm models on background threads
+#   eager      - load and warm every model before the server accepts requests
+#   lazy       - load each model on its first request; nothing is loaded at startup
+STARTUP_MODE = os.environ.get("STARTUP_MODE", "background")
+# Run one dummy inference per model after loading it (STARTUP_WARMUP=0 disables)
+STARTUP_WARMUP = os.environ.get("STARTUP_WARMUP", "1") == "1"
+# Models that must be warm before the readiness probe passes (comma-separated; default all)
+READY_MODELS = [name.strip() for name in os.environ.get("READY_MODELS", "").split(",") if name.strip()]
+
+
+class ModelStartup:
+    """Load and warmup steps of one model, and how far it has got."""
+
+    def __init__(self, name, load, warmup=None):
+        self.name = name
+        self.load = load
+        self.warmup = warmup
+        # pending -> loading -> warming -> ready, or failed; deferred in lazy mode
+        self.state = "pending"
+        self.error = None
+        self.load_seconds = None
+        self.warmup_seconds = None
+
+    def prepare(self, warmup=True):
+        """Load (and optionally warm) the model, recording the outcome instead of raising."""
+        try:
+            self.state = "loading"
+            start = time.perf_counter()
+            self.load()
+            self.load_seconds = round(time.perf_counter() - start, 3)
+            if warmup and self.warmup is not None:
+                self.state = "warming"
+                start = time.perf_counter()
+                self.warmup()
+                self.warmup_seconds = round(time.perf_counter() - start, 3)
+            self.state = "ready"
+            logger.info(
+                f"Model '{self.name}' ready (load {self.load_seconds}s, warmup {self.warmup_seconds}s)"
+            )
+        except Exception as e:
+            self.state = "failed"
+            self.error = str(e)
+            logger.error(f"Model '{self.name}' failed to start: {e}")
+
+    def stats(self):
+        return {
+            "state": self.state,
+            "error": self.error,
+            "load_seconds": self.load_seconds,
+            "warmup_seconds": self.warmup_seconds,
+        }
+
+
+class StartupManager:
+    """
+    Brings registered models up from the FastAPI lifespan, so importing the
+    app stays cheap and uvicorn binds immediately.
+
+    Each model is loaded (and warmed) on its own daemon thread. A failure is
+    recorded for the readiness probe instead of killing the process; requests
+    that need the model still attempt to load it on use.
+    """
+
+    def __init__(self, mode=STARTUP_MODE, warmup=STARTUP_WARMUP, required=READY_MODELS):
+        if mode not in ("background", "eager", "lazy"):
+            raise ValueError(f"Unknown STARTUP_MODE '{mode}'")
+        self.mode = mode
+        self.warmup = warmup
+        self.required = required
+        self._models = {}
+        self._threads = []
+        self.started_at = None
+
+    def register(self, name, load, warmup=None):
+        """
+        Register a model to bring up at startup.
+
+        Args:
+            name (str): Name reported by the readiness probe
+            load (callable): Zero-argument function that loads the model
+            warmup (callable): Zero-argument function running one dummy inference
+        """
+        self._models[name] = ModelStartup(name, load, warmup)
+
+    def start(self):
+        """Begin loading according to the startup mode; in eager mode the caller then wait()s."""
+        self.started_at = time.time()
+        if self.mode == "lazy":
+            for model in self._models.values():
+                model.state = "deferred"
+            return
+        for model in self._models.values():
+            thread = threading.Thread(
+                target=model.prepare, args=(self.warmup,), name=f"startup-{model.name}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def wait(self, timeout=None):
+        """Block until every startup thread has finished."""
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def readiness(self):
+        """
+        Report whether the required models can serve traffic.
+
+        Returns:
+            dict: {"ready", "mode", "models": {name: state details}}; deferred
+                (lazy-mode) models count as ready since they load on demand
+        """
+        required = self.required or list(self._models)
+        ready = all(
+            name in self._models and self._models[name].state in ("ready", "deferred") for name in required
+        )
+        return {
+            "ready": ready,
+            "mode": self.mode,
+            "required": required,
+            "uptime_seconds": round(time.time() - self.started_at, 1) if self.started_at else None,
+            "models": {name: model.stats() for name, model in self._models.items()},
+        }
+
+
+startup = StartupManager()
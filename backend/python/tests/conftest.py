@@ -0,0 +1,6 @@
+import os
+import sys
+
+# Tests import the backend modules the way app.py does
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
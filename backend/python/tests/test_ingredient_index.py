@@ -0,0 +1,38 @@
+from ingredient_index import format_ingredients, ingredient_index
+
+
+def names(entries):
+    return [entry.name for entry in entries]
+
+
+def test_allergens_outside_the_dictionary_are_kept():
+    found, unmatched = ingredient_index.extract("Contains Tree Nuts, Lupin, Celery, Sulphites, Fish")
+    assert names(found) == ["Sulphites"]
+    assert unmatched == ["contains tree nuts", "lupin", "celery", "fish"]
+
+
+def test_bare_additive_numbers_are_kept():
+    found, unmatched = ingredient_index.extract(
+        "Ingredients: Wheat flour, Sugar, Shellfish, Gluten, Raising agents (500ii/503ii), Emulsifier (322)"
+    )
+    assert names(found) == ["Wheat flour", "Sugar", "Wheat"]
+    assert unmatched == ["shellfish", "500ii", "503ii", "322"]
+
+
+def test_ocr_noise_is_corrected_and_deduplicated():
+    found, unmatched = ingredient_index.extract("INGREDIENTS: Refined wheat flour (maida), sugar, suger, pa1m oil, E 5OO")
+    assert names(found) == ["Wheat flour", "Sugar", "Palm oil", "Sodium bicarbonate"]
+    assert unmatched == []
+
+
+def test_label_words_alone_are_not_reported():
+    found, unmatched = ingredient_index.extract("Ingredients: contains permitted emulsifiers")
+    assert found == []
+    assert unmatched == []
+
+
+def test_format_lists_unmatched_text_after_the_ingredients():
+    found, unmatched = ingredient_index.extract("Sugar, Fish")
+    lines = format_ingredients(found, unmatched).splitlines()
+    assert lines[0].startswith("- Sugar [")
+    assert lines[-1] == "Other label text (not in the ingredient dictionary): fish"
@@ -0,0 +1,36 @@
+from lab_extract import extract_lab_rows
+
+
+def rows(text):
+    return {row.test: row for row in extract_lab_rows(text)}
+
+
+def test_thousands_separators_are_not_decimal_commas():
+    row = rows("WBC 7,800 /uL 4000-11000")["WBC Count"]
+    assert (row.value, row.reference, row.flag) == ("7800", "4000-11000", "N")
+
+    row = rows("Total WBC Count 10,500 cells/cumm 4,000-11,000")["WBC Count"]
+    assert (row.value, row.reference, row.flag) == ("10500", "4000-11000", "N")
+
+
+def test_lakh_grouping():
+    row = rows("Platelet Count 2,50,000 /cumm 1,50,000-4,50,000")["Platelet Count"]
+    assert (row.value, row.reference, row.flag) == ("250000", "150000-450000", "N")
+
+
+def test_decimal_comma():
+    row = rows("Haemoglobin 13,5 g/dL 12-17")["Hemoglobin"]
+    assert (row.value, row.flag) == ("13.5", "N")
+
+
+def test_short_aliases_only_at_line_or_cell_start():
+    found = rows("Lab: Alt. Road, Nagpur\nDr. Na Kim\nSGPT 30 U/L\n| Na | 139 | mmol/L |\n1. Hb 11.2 g/dL")
+    assert found["SGPT (ALT)"].value == "30"
+    assert found["Sodium"].value == "139"
+    assert found["Hemoglobin"].value == "11.2"
+
+
+def test_implausible_values_are_dropped():
+    found = rows("Ph: 9876543210\nReaction (pH) 6.0\nNa 1400 mmol/L")
+    assert found["Urine pH"].value == "6"
+    assert "Sodium" not in found
@@ -0,0 +1,50 @@
+import os
+
+# Offline backend with no simulated decode cost; set before llm_backends reads it
+os.environ["LLM_BACKEND"] = "stub"
+os.environ["LLM_STUB_TOKEN_MS"] = "0"
+os.environ["LLM_STUB_PREFILL_MS"] = "0"
+
+import pytest
+
+from llm_backends import STUB_RESPONSE
+from llm_model import ChatHistory, get_llm_response, is_error_response, stream_llm_response
+
+
+def test_get_llm_response_updates_history():
+    history = ChatHistory()
+    response = get_llm_response("What should I eat with high cholesterol?", history)
+
+    assert not is_error_response(response)
+    assert response == STUB_RESPONSE.strip()
+    assert history.messages == [("What should I eat with high cholesterol?", response)]
+
+
+def test_get_llm_response_with_session_keeps_turns():
+    history = ChatHistory()
+    first = get_llm_response("Is my HbA1c of 6.1 high?", history, session_id="test-session-0001")
+    second = get_llm_response("What about fasting glucose?", history, session_id="test-session-0001")
+
+    assert [user for user, _ in history.messages] == ["Is my HbA1c of 6.1 high?", "What about fasting glucose?"]
+    assert [ai for _, ai in history.messages] == [first, second]
+
+
+def test_stream_llm_response_writes_history_when_exhausted():
+    history = ChatHistory()
+    chunks = list(stream_llm_response("How much water should I drink?", history))
+
+    assert "".join(chunks).strip() == STUB_RESPONSE.strip()
+    assert history.messages == [("How much water should I drink?", "".join(chunks).strip())]
+
+
+def test_stream_llm_response_restores_history_when_launch_fails():
+    history = ChatHistory()
+    get_llm_response("Hello", history)
+    before = list(history.messages)
+
+    def refuse(fn):
+        raise RuntimeError("pool full")
+
+    with pytest.raises(RuntimeError):
+        stream_llm_response("Are these results normal?", history, launch=refuse)
+    assert history.messages == before
@@ -0,0 +1,368 @@
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+from audio_ingest import resample
+from model_registry import WHISPER_MODEL, registry
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Whisper works on 16 kHz mono float32 audio
+SAMPLE_RATE = 16000
+# Worker processes that each keep a loaded Whisper model (0 = transcribe in-process, serially)
+ASR_PROCESS_WORKERS = int(os.environ.get("ASR_PROCESS_WORKERS", "2"))
+# Longest chunk sent to Whisper in one call; Whisper's own window is 30 s
+ASR_MAX_CHUNK_SECONDS = float(os.environ.get("ASR_MAX_CHUNK_SECONDS", "30"))
+# Force a language instead of detecting it separately for every chunk
+ASR_LANGUAGE = os.environ.get("ASR_LANGUAGE") or None
+
+# Energy VAD parameters
+VAD_FRAME_MS = 30
+VAD_MIN_RMS = 0.005  # absolute floor so near-silent recordings are not all "speech"
+VAD_NOISE_FACTOR = 3.0  # speech must be this much louder than the noise floor (~10 dB)
+VAD_MIN_SILENCE_MS = 300  # shorter pauses do not split speech
+VAD_MIN_SPEECH_MS = 200  # shorter bursts are clicks and pops
+VAD_PAD_MS = 150  # kept around each speech region so word edges are not clipped
+
+
+# ---------------------------------------------------------------------------
+# Voice-activity detection
+# ---------------------------------------------------------------------------
+
+def frame_rms(audio, frame_length):
+    """RMS energy of consecutive non-overlapping frames."""
+    count = len(audio) // frame_length
+    if count == 0:
+        return np.zeros(0, dtype=np.float32)
+    frames = audio[:count * frame_length].reshape(count, frame_length)
+    return np.sqrt(np.mean(np.square(frames, dtype=np.float32), axis=1))
+
+
+def detect_speech(audio, sample_rate=SAMPLE_RATE, frame_ms=VAD_FRAME_MS, min_silence_ms=VAD_MIN_SILENCE_MS,
+                  min_speech_ms=VAD_MIN_SPEECH_MS, pad_ms=VAD_PAD_MS):
+    """
+    Find speech regions with an energy threshold relative to the noise floor.
+
+    Args:
+        audio (numpy.ndarray): Mono float32 samples in [-1, 1]
+        sample_rate (int): Samples per second
+
+    Returns:
+        list[tuple[int, int]]: (start, end) sample offsets of speech regions
+    """
+    frame_length = max(int(sample_rate * frame_ms / 1000), 1)
+    rms = frame_rms(audio, frame_length)
+    if rms.size == 0:
+        return []
+    threshold = max(float(np.percentile(rms, 10)) * VAD_NOISE_FACTOR, VAD_MIN_RMS)
+    voiced = np.concatenate(([0], (rms > threshold).astype(np.int8), [0]))
+    edges = np.diff(voiced)
+    starts, ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+    min_silence = min_silence_ms // frame_ms
+    min_speech = max(min_speech_ms // frame_ms, 1)
+    regions = []
+    for start, end in zip(starts, ends):
+        if regions and start - regions[-1][1] < min_silence:
+            regions[-1][1] = end
+        else:
+            regions.append([start, end])
+
+    pad = int(sample_rate * pad_ms / 1000)
+    return [
+        (max(int(start) * frame_length - pad, 0), min(int(end) * frame_length + pad, len(audio)))
+        for start, end in regions
+        if end - start >= min_speech
+    ]
+
+
+def plan_chunks(speech, max_samples):
+    """
+    Group speech regions into chunks of at most max_samples.
+
+    Chunks always end at a pause, so no word is split between two Whisper
+    calls; only a single region longer than max_samples is cut hard.
+
+    Returns:
+        list[tuple[int, int]]: (start, end) sample offsets of chunks
+    """
+    chunks = []
+    for start, end in speech:
+        if chunks and end - chunks[-1][0] <= max_samples:
+            chunks[-1] = (chunks[-1][0], end)
+            continue
+        while end - start > max_samples:
+            chunks.append((start, start + max_samples))
+            start += max_samples
+        chunks.append((start, end))
+    return chunks
+
+
+# ---------------------------------------------------------------------------
+# Worker-process side
+# ---------------------------------------------------------------------------
+
+_worker_model = None
+
+
+def _init_worker(model_name):
+    """Load Whisper once per worker process."""
+    global _worker_model
+    import whisper
+    _worker_model = whisper.load_model(model_name)
+
+
+def _run_whisper(model, audio, offset, options):
+    result = model.transcribe(audio, **options)
+    return {
+        "start": offset,
+        "end": offset + len(audio) / SAMPLE_RATE,
+        "text": result["text"].strip(),
+        "language": result.get("language"),
+        "segments": [
+            {"start": round(offset + s["start"], 2), "end": round(offset + s["end"], 2), "text": s["text"].strip()}
+            for s in result.get("segments", ())
+        ],
+    }
+
+
+def _worker_ready():
+    """No-op task; running it guarantees the worker's initializer (the model load) has finished."""
+    return os.getpid()
+
+
+def _transcribe_chunk(audio, offset, options):
+    return _run_whisper(_worker_model, audio, offset, options)
+
+
+def _transcribe_chunk_in_process(audio, offset, options):
+    with registry.use("whisper") as model:
+        return _run_whisper(model, audio, offset, options)
+
+
+# ---------------------------------------------------------------------------
+# Engine
+# ---------------------------------------------------------------------------
+
+def stitch(chunk_results):
+    """Join chunk results (in any order) into one transcript with absolute timestamps."""
+    ordered = sorted(chunk_results, key=lambda chunk: chunk["start"])
+    return {
+        "text": " ".join(chunk["text"] for chunk in ordered if chunk["text"]),
+        "segments": [segment for chunk in ordered for segment in chunk["segments"]],
+        "language": next((chunk["language"] for chunk in ordered if chunk.get("language")), None),
+    }
+
+
+class TranscriptionJob:
+    """Chunks of one recording in flight; results can be read as they finish."""
+
+    def __init__(self, futures):
+        self.futures = futures
+        self.started = time.perf_counter()
+
+    @property
+    def total(self):
+        return len(self.futures)
+
+    def partial(self):
+        """Stitched transcript of the chunks finished so far."""
+        done = [future.result() for future in self.futures if future.done() and not future.exception()]
+        return {**stitch(done), "done": len(done), "total": self.total}
+
+    def as_completed(self, timeout=None):
+        """Yield chunk results in completion order."""
+        for future in as_completed(self.futures, timeout=timeout):
+            yield future.result()
+
+    def result(self, timeout=None):
+        return stitch([future.result(timeout=timeout) for future in self.futures])
+
+
+class TranscriptionEngine:
+    """
+    Transcribes long recordings in VAD-delimited chunks, in parallel.
+
+    Each worker process loads Whisper once and keeps it; a recording is split
+    at pauses into chunks of up to max_chunk_seconds that are transcribed
+    concurrently and stitched back together with absolute timestamps.
+    """
+
+    def __init__(self, workers=ASR_PROCESS_WORKERS, model_name=WHISPER_MODEL,
+                 max_chunk_seconds=ASR_MAX_CHUNK_SECONDS, language=ASR_LANGUAGE):
+        self.workers = workers
+        self.model_name = model_name
+        self.max_samples = int(max_chunk_seconds * SAMPLE_RATE)
+        self.options = {"language": language} if language else {}
+        self._pool = None
+        self._lock = threading.Lock()
+        self.recordings = 0
+        self.chunks = 0
+        self.audio_seconds = 0.0
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                if self.workers > 0:
+                    # Spawn, so workers do not inherit the API process's threads and model weights
+                    self._pool = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context("spawn"),
+                        initializer=_init_worker,
+                        initargs=(self.model_name,),
+                    )
+                else:
+                    # One model instance in the registry; torch modules are not safe to share across threads
+                    self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="whisper")
+            return self._pool
+
+    def _reset_pool(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+    def submit(self, audio, offset=0.0, **options):
+        """Queue one chunk (16 kHz float32) and return a Future of its result."""
+        worker = _transcribe_chunk if self.workers > 0 else _transcribe_chunk_in_process
+        audio = np.ascontiguousarray(audio, dtype=np.float32)
+        with self._lock:
+            self.chunks += 1
+            self.audio_seconds += len(audio) / SAMPLE_RATE
+        try:
+            return self._get_pool().submit(worker, audio, offset, {**self.options, **options})
+        except BrokenProcessPool:
+            logger.error("Whisper worker pool crashed; restarting it")
+            self._reset_pool()
+            return self._get_pool().submit(worker, audio, offset, {**self.options, **options})
+
+    def transcribe_chunk(self, audio, offset=0.0, **options):
+        """Transcribe one chunk and wait for it (for callers already on a worker thread)."""
+        return self.submit(audio, offset, **options).result()
+
+    def start(self, audio, **options):
+        """
+        Split a recording at pauses and queue all chunks.
+
+        Args:
+            audio (numpy.ndarray): 16 kHz mono float32 samples
+
+        Returns:
+            TranscriptionJob: Handle for partial and final results
+        """
+        with self._lock:
+            self.recordings += 1
+        chunks = plan_chunks(detect_speech(audio), self.max_samples)
+        return TranscriptionJob([
+            self.submit(audio[start:end], start / SAMPLE_RATE, **options) for start, end in chunks
+        ])
+
+    def transcribe(self, audio, **options):
+        """Transcribe a whole recording; returns {"text", "segments", "language"}."""
+        return self.start(audio, **options).result()
+
+    def load(self):
+        """Start every worker and wait until each has loaded Whisper."""
+        if self.workers <= 0:
+            registry.get("whisper")
+            return
+        pool = self._get_pool()
+        # Each submission to an idle spawn pool starts one more process
+        pids = {future.result() for future in [pool.submit(_worker_ready) for _ in range(self.workers)]}
+        logger.info(f"Whisper loaded in {len(pids)} worker process(es)")
+
+    def warmup(self):
+        """Transcribe a second of silence on each worker to initialise decoding kernels."""
+        silence = np.zeros(SAMPLE_RATE, dtype=np.float32)
+        for future in [self.submit(silence) for _ in range(max(self.workers, 1))]:
+            future.result()
+
+    def shutdown(self):
+        self._reset_pool()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "model": self.model_name,
+                "recordings": self.recordings,
+                "chunks": self.chunks,
+                "audio_seconds": round(self.audio_seconds, 1),
+            }
+
+
+class LiveTranscriber:
+    """
+    Cuts a live PCM stream into 16 kHz chunks at pauses.
+
+    feed() buffers audio at input_rate and returns (offset, chunk) pairs as
+    soon as a pause closes a stretch of speech, or when the buffer reaches the
+    chunk limit. Each chunk is resampled once when it is cut, not per frame.
+    """
+
+    def __init__(self, max_chunk_seconds=ASR_MAX_CHUNK_SECONDS, min_silence_ms=VAD_MIN_SILENCE_MS,
+                 input_rate=SAMPLE_RATE):
+        self.input_rate = input_rate
+        self.max_samples = int(max_chunk_seconds * input_rate)
+        self.min_silence = int(input_rate * min_silence_ms / 1000)
+        self._buffer = np.zeros(0, dtype=np.float32)
+        self._offset = 0  # samples already cut off the front of the buffer
+        self._odd_byte = b""  # half of a 16-bit sample split across frames
+
+    def _cut(self, end):
+        chunk = resample(self._buffer[:end], self.input_rate, SAMPLE_RATE)
+        offset = self._offset / self.input_rate
+        self._buffer = self._buffer[end:]
+        self._offset += end
+        return offset, chunk
+
+    def feed(self, samples):
+        """
+        Add float32 samples at input_rate and return any chunks that are ready.
+
+        Returns:
+            list[tuple[float, numpy.ndarray]]: (start seconds, samples) pairs
+        """
+        self._buffer = np.concatenate((self._buffer, samples))
+        ready = []
+        while True:
+            speech = detect_speech(self._buffer, self.input_rate)
+            if not speech:
+                # Nothing but silence; keep only a short tail for context
+                if len(self._buffer) > self.min_silence:
+                    self._offset += len(self._buffer) - self.min_silence
+                    self._buffer = self._buffer[-self.min_silence:]
+                return ready
+            # Speech followed by a long enough pause is a finished utterance
+            closed = [end for _, end in speech if len(self._buffer) - end >= self.min_silence]
+            if closed and closed[-1] <= self.max_samples:
+                ready.append(self._cut(closed[-1]))
+            elif len(self._buffer) >= self.max_samples:
+                ready.append(self._cut(max([end for end in closed if end <= self.max_samples],
+                                           default=self.max_samples)))
+            else:
+                return ready
+
+    def feed_pcm16(self, data):
+        """feed() for raw 16-bit little-endian PCM bytes at input_rate, as sent by browsers and mobile recorders."""
+        data = self._odd_byte + data
+        usable = len(data) - len(data) % 2
+        self._odd_byte = data[usable:]
+        samples = np.frombuffer(data[:usable], dtype="<i2").astype(np.float32) / 32768.0
+        return self.feed(samples)
+
+    def flush(self):
+        """Return whatever speech is left in the buffer."""
+        if len(self._buffer) and detect_speech(self._buffer, self.input_rate):
+            return [self._cut(len(self._buffer))]
+        return []
+
+
+transcription_engine = TranscriptionEngine()
@@ -0,0 +1,132 @@
+import os
+
+from fastapi import HTTPException, UploadFile
+
+from metrics import stage
+
+# Largest accepted upload, in MB
+MAX_UPLOAD_MB = float(os.environ.get("MAX_UPLOAD_MB", "10"))
+MAX_UPLOAD_BYTES = int(MAX_UPLOAD_MB * 1024 * 1024)
+# Voice notes are larger than photos
+MAX_AUDIO_UPLOAD_MB = float(os.environ.get("MAX_AUDIO_UPLOAD_MB", "50"))
+MAX_AUDIO_UPLOAD_BYTES = int(MAX_AUDIO_UPLOAD_MB * 1024 * 1024)
+
+# Read uploads in chunks so oversized files are rejected without buffering them
+UPLOAD_CHUNK_BYTES = 64 * 1024
+
+# Leading bytes of the image formats the OCR pipeline can decode
+IMAGE_SIGNATURES = {
+    "jpeg": (b"\xff\xd8\xff",),
+    "png": (b"\x89PNG\r\n\x1a\n",),
+    "gif": (b"GIF87a", b"GIF89a"),
+    "bmp": (b"BM",),
+    "tiff": (b"II*\x00", b"MM\x00*"),
+}
+
+
+# Leading bytes of audio containers; MP4/M4A is detected by its "ftyp" box
+AUDIO_SIGNATURES = {
+    "flac": (b"fLaC",),
+    "ogg": (b"OggS",),
+    "mp3": (b"ID3",),
+    "webm": (b"\x1a\x45\xdf\xa3",),
+}
+
+
+def detect_image_format(header: bytes):
+    """Return the image format named by the file's magic bytes, or None."""
+    # WebP is a RIFF container with the form type at offset 8
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "webp"
+    for image_format, signatures in IMAGE_SIGNATURES.items():
+        if header.startswith(signatures):
+            return image_format
+    return None
+
+
+def detect_audio_format(header: bytes):
+    """Return the audio format named by the file's magic bytes, or None."""
+    if header[:4] == b"RIFF" and header[8:12] == b"WAVE":
+        return "wav"
+    if header[4:8] == b"ftyp":
+        return "m4a"
+    for audio_format, signatures in AUDIO_SIGNATURES.items():
+        if header.startswith(signatures):
+            return audio_format
+    # Bare MPEG audio frames (MP3 without ID3, or AAC in ADTS) start with an 11-bit sync word
+    if len(header) >= 2 and header[0] == 0xFF and header[1] & 0xE0 == 0xE0:
+        return "aac" if header[1] & 0x06 == 0 else "mp3"
+    return None
+
+
+async def _read_upload(file: UploadFile, max_bytes: int, detect, unsupported_detail):
+    """Read an upload in chunks, rejecting it as soon as its size or magic bytes rule it out."""
+    too_large = HTTPException(
+        status_code=413, detail=f"File too large. Maximum upload size is {max_bytes // (1024 * 1024)} MB"
+    )
+    if file.size is not None and file.size > max_bytes:
+        raise too_large
+
+    data = bytearray()
+    detected = None
+    while True:
+        chunk = await file.read(UPLOAD_CHUNK_BYTES)
+        if not chunk:
+            break
+        if not data:
+            detected = detect(chunk)
+            if detected is None:
+                raise HTTPException(status_code=415, detail=unsupported_detail)
+        data += chunk
+        if len(data) > max_bytes:
+            raise too_large
+
+    if not data:
+        raise HTTPException(status_code=400, detail="The uploaded file is empty.")
+    return data, detected
+
+
+async def read_image_upload(file: UploadFile, max_bytes: int = MAX_UPLOAD_BYTES) -> bytearray:
+    """
+    Read an uploaded image into memory, enforcing a size limit and checking its type.
+
+    The declared size is checked before reading, the magic bytes after the
+    first chunk, and the running size on every chunk, so oversized or
+    non-image uploads are rejected as early as possible.
+
+    Args:
+        file (UploadFile): Incoming upload
+        max_bytes (int): Maximum accepted size
+
+    Returns:
+        bytearray: The encoded image (returned as-is to avoid another copy)
+
+    Raises:
+        HTTPException: 413 if the upload is too large, 415 if it is not an image
+    """
+    with stage("upload_image"):
+        data, _ = await _read_upload(
+            file, max_bytes, detect_image_format, "Unsupported file type. Please upload an image."
+        )
+    return data
+
+
+async def read_audio_upload(file: UploadFile, max_bytes: int = MAX_AUDIO_UPLOAD_BYTES):
+    """
+    Read an uploaded audio file into memory with the same early checks as images.
+
+    Args:
+        file (UploadFile): Incoming upload
+        max_bytes (int): Maximum accepted size
+
+    Returns:
+        tuple[bytearray, str]: The encoded audio and its detected format
+
+    Raises:
+        HTTPException: 413 if the upload is too large, 415 if it is not a supported audio format
+    """
+    with stage("upload_audio"):
+        return await _read_upload(
+            file, max_bytes, detect_audio_format,
+            "Unsupported file format. Supported formats: WAV, FLAC, OGG, MP3, M4A/MP4, AAC, WebM"
+        )
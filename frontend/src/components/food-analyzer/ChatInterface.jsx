@@ -21,6 +21,8 @@ const ChatInterface = () => {
   const [isUploading, setIsUploading] = useState(false);
   const [showUploadForm, setShowUploadForm] = useState(false);
   const messageEndRef = useRef(null);
+  // Conversation id issued by the backend on the first reply (X-Session-ID)
+  const sessionIdRef = useRef(null);
   const [hasInteracted, setHasInteracted] = useState(false);
 
   // Update backend URL to point to ngrok URL
@@ -93,9 +95,18 @@ const ChatInterface = () => {
   const handleChatMessage = async (message) => {
     try {
       // Directly use the FastAPI llm-chat endpoint
-      const response = await axios.post(`${BACKEND_URL}/llm-chat`, {
-        message: message,
-      });
+      const response = await axios.post(
+        `${BACKEND_URL}/llm-chat`,
+        { message: message },
+        {
+          headers: sessionIdRef.current
+            ? { "X-Session-ID": sessionIdRef.current }
+            : {},
+        }
+      );
+      // Keep the conversation going on later messages
+      sessionIdRef.current =
+        response.headers["x-session-id"] || sessionIdRef.current;
 
       // Handle the direct text response instead of JSON
       const responseContent = response.data;